@@ -3,11 +3,27 @@
 # http://opensource.org/licenses/mit-license.php
 
 import logging
+import os
 import socket
+import struct
 import time
 import subprocess
 
+from adjRibIn import AdjRibIn, rib_update, UPDATE, PEER_UP, PEER_DOWN
+from bmpCapture import CaptureWriter
+from collections import namedtuple
 from datetime import datetime
+from eventQueue import EventQueue
+from bmpStream import BMPStreamReader, BMPStreamError, peek_header
+from bmpStream import PEER_MESSAGE_TYPES, BMP_MSG_ROUTE_MONITORING
+from bmpStream import BMP_MSG_PEER_UP_NOTIFICATION, BMP_MSG_INITIATION
+from bmpStream import BMP_MSG_PEER_DOWN_NOTIFICATION
+from bmpDecoder import decode_route_monitoring, DecodeFallback
+from bmpDecoder import BGP_ATTR_TYPE_MP_REACH_NLRI, BGP_ATTR_TYPE_NEXT_HOP
+from bmpDecoder import BGP_ATTR_TYPE_MP_UNREACH_NLRI
+from latency import monotonic
+from metrics import REGISTRY, COUNTER, GAUGE
+from parserPool import ParserPool
 from ryu.base import app_manager
 from ryu.lib import hub
 from ryu.lib.hub import StreamServer
@@ -22,196 +38,576 @@ HOST = '0.0.0.0'
 PORT = 11019
 ADDR = (HOST, PORT)
 
+# Parse BMP messages in this many worker processes instead of the handler
+# greenthreads (0 keeps parsing in-process).
+PARSER_PROCESSES = int(os.environ.get('APGW_BMP_PARSER_PROCESSES', 0))
+PARSER_BATCH = int(os.environ.get('APGW_BMP_PARSER_BATCH', 64))
+
+# Bound on the events waiting in bmp_q (0 = unbounded) and what to do when
+# it is reached: "block", "drop_oldest" or "coalesce".
+QUEUE_SIZE = int(os.environ.get('APGW_BMP_QUEUE_SIZE', 100000))
+QUEUE_POLICY = os.environ.get('APGW_BMP_QUEUE_POLICY', 'block')
+
+# Route Monitoring and Peer Up messages older than this many seconds are
+# not reported.
+ROUTE_MONITORING_MAX_AGE = 60
+PEER_UP_MAX_AGE = 30
+
+# Skip messages that would be dropped anyway before parsing them, using
+# only their common and per-peer headers.
+PREFILTER = os.environ.get('APGW_BMP_PREFILTER', '1') == '1'
+PREFILTER_TYPES = (BMP_MSG_ROUTE_MONITORING, BMP_MSG_PEER_UP_NOTIFICATION,
+                   BMP_MSG_PEER_DOWN_NOTIFICATION, BMP_MSG_INITIATION)
+PREFILTER_MAX_AGE = {BMP_MSG_ROUTE_MONITORING: ROUTE_MONITORING_MAX_AGE,
+                     BMP_MSG_PEER_UP_NOTIFICATION: PEER_UP_MAX_AGE}
+
+# Decode Route Monitoring messages with bmpDecoder, falling back to the Ryu
+# parser for what it does not handle.
+FAST_DECODER = os.environ.get('APGW_BMP_FAST_DECODER', '1') == '1'
+
+# Mirror the Adj-RIB-In of every monitored peer in memory.  The prefilter
+# then only skips by message type, as the mirror needs stale messages and
+# peers without targets too.
+ADJ_RIB_IN = os.environ.get('APGW_ADJ_RIB_IN', '0') == '1'
+# Attributes the mirror keeps out of its interned path attributes.
+RIB_SKIP_ATTRIBUTES = (BGP_ATTR_TYPE_NEXT_HOP, BGP_ATTR_TYPE_MP_REACH_NLRI,
+                       BGP_ATTR_TYPE_MP_UNREACH_NLRI)
+
+# Record every received BMP message to this bmpCapture file, for replay
+# with tool/bmp_replay.py.
+CAPTURE_FILE = os.environ.get('APGW_BMP_CAPTURE', '')
+
+# Peer distinguisher and peer address, past the 6 byte common header.
+PEER_KEY_OFFSET = 6 + 2
+PEER_KEY_LEN = 8 + 16
+
+# Immutable, dict-free record for one BMP event.  bmp_q carries a BmpBatch
+# of these per BMP message.
+BmpEvent = namedtuple('BmpEvent', ['received_time', 'received_host',
+                                   'event_type', 'peer_as', 'peer_bgp_id',
+                                   'prefix', 'route_dist', 'vpnv4_prefix',
+                                   'nexthop'])
+
+# The events of one BMP message together with the monotonic times its first
+# and last byte were read, its parse finished and it was queued.
+BmpBatch = namedtuple('BmpBatch', ['events', 'recv_time', 'read_time',
+                                   'parse_time', 'queue_time'])
+
+
+def shard_key(pkt, addr):
+    # Keeps every message of one monitored peer on the same parser process
+    # without decoding it.
+    if (len(pkt) >= PEER_KEY_OFFSET + PEER_KEY_LEN and
+            ord(pkt[5]) in PEER_MESSAGE_TYPES):
+        return addr[0], pkt[PEER_KEY_OFFSET:
+                            PEER_KEY_OFFSET + PEER_KEY_LEN].tobytes()
+    return addr[0]
+
 
 class BgpMonitor(app_manager.RyuApp):
     def __init__(self):
         super(BgpMonitor, self).__init__()
-        self.bmp_q = hub.Queue()
+        self.bmp_q = EventQueue(QUEUE_SIZE, QUEUE_POLICY)
         self.name = 'bmp'
+        self.failed_pkt_count = 0
+        self.parser_pool = None
+        self.peer_filter = None
+        self.adj_rib_in = None
+        if ADJ_RIB_IN:
+            self.adj_rib_in = AdjRibIn()
+        self.capture = None
+        if CAPTURE_FILE:
+            self.capture = CaptureWriter(CAPTURE_FILE)
+        self.sessions_started = 0
+        self.report_time_key = None
+        self.report_time_value = None
+        self.sessions = REGISTRY.gauge(
+            'apgw_bmp_sessions', 'Connected BMP sessions.')
+        self.bytes_total = REGISTRY.counter(
+            'apgw_bmp_bytes_total', 'Bytes of BMP messages received.')
+        self.messages_total = REGISTRY.counter(
+            'apgw_bmp_messages_total', 'BMP messages received by type.',
+            ('type',))
+        self.peer_messages_total = REGISTRY.counter(
+            'apgw_bmp_peer_messages_total',
+            'BMP messages received per monitored peer.',
+            ('router', 'peer_address'))
+        self.parse_failures_total = REGISTRY.counter(
+            'apgw_bmp_parse_failures_total', 'BMP messages failed to parse.')
+        self.events_total = REGISTRY.counter(
+            'apgw_bmp_events_total', 'Events published on bmp_q by type.',
+            ('event_type',))
+        self.busy_seconds = REGISTRY.counter(
+            'apgw_worker_busy_seconds_total',
+            'Time spent working by each pipeline greenthread.', ('worker',))
+        self.prefilter_skipped_total = REGISTRY.counter(
+            'apgw_bmp_prefilter_skipped_total',
+            'BMP messages skipped before parsing by reason.', ('reason',))
+        self.prefilter_passed_total = REGISTRY.counter(
+            'apgw_bmp_prefilter_passed_total',
+            'BMP messages passed on to the parser.')
+        self.decoded_total = REGISTRY.counter(
+            'apgw_bmp_decoded_total', 'BMP messages decoded by decoder.',
+            ('decoder',))
+        bmp_q = self.bmp_q
+        REGISTRY.callback(
+            'apgw_bmp_queue_dropped_total',
+            'Events dropped from bmp_q on overflow.',
+            COUNTER, lambda: bmp_q.dropped)
+        REGISTRY.callback(
+            'apgw_bmp_queue_coalesced_total',
+            'Events overwritten in bmp_q by a newer event for the prefix.',
+            COUNTER, lambda: bmp_q.coalesced)
+        REGISTRY.callback(
+            'apgw_bmp_queue_blocked_seconds_total',
+            'Time BMP sessions waited for room in bmp_q.',
+            COUNTER, lambda: bmp_q.blocked_time)
+        REGISTRY.callback(
+            'apgw_bmp_queue_max_events', 'Bound on the events in bmp_q.',
+            GAUGE, lambda: bmp_q.maxsize)
+        adj_rib_in = self.adj_rib_in
+        if adj_rib_in is not None:
+            REGISTRY.callback(
+                'apgw_adj_rib_in_routes', 'Routes in the Adj-RIB-In mirror.',
+                GAUGE, lambda: adj_rib_in.routes)
+            REGISTRY.callback(
+                'apgw_adj_rib_in_paths',
+                'Distinct path attributes in the Adj-RIB-In mirror.',
+                GAUGE, lambda: adj_rib_in.stats()['paths'])
+            REGISTRY.callback(
+                'apgw_adj_rib_in_peers', 'Peers in the Adj-RIB-In mirror.',
+                GAUGE, lambda: adj_rib_in.stats()['peers'])
 
     def start(self):
         super(BgpMonitor, self).start()
+        if PARSER_PROCESSES > 0:
+            self.parser_pool = ParserPool(self.decode_remote,
+                                          self.publish_remote,
+                                          processes=PARSER_PROCESSES,
+                                          batch_size=PARSER_BATCH)
+            pool_stats = self.parser_pool.stats
+            REGISTRY.callback(
+                'apgw_bmp_parser_in_flight',
+                'Messages sent to parser processes and not yet decoded.',
+                GAUGE, lambda: pool_stats()['in_flight'])
+            REGISTRY.callback(
+                'apgw_bmp_parser_queued_batches',
+                'Message batches waiting for a parser process.',
+                GAUGE, lambda: pool_stats()['queued_batches'])
+            REGISTRY.callback(
+                'apgw_bmp_parser_restarts_total',
+                'Parser processes restarted after exiting.',
+                COUNTER, lambda: pool_stats()['restarts'])
         return hub.spawn(StreamServer(ADDR, self.handler).serve_forever)
 
     def handler(self, sock, addr):
         self.logger.debug("BMP client connected, ip=%s, port=%s" % addr)
-        is_active = True
-        buf = bytearray()
-        required_len = bmp.BMPMessage._HDR_LEN
-
-        while is_active:
-            ret = sock.recv(required_len)
-            if len(ret) == 0:
-                is_active = False
-                break
-            buf += ret
-            while len(buf) >= required_len:
-                version, len_, _ = bmp.BMPMessage.parse_header(buf)
-                if version != bmp.VERSION:
-                    self.logger.error("unsupported bmp version: %d" % version)
-                    is_active = False
-                    break
-
-                required_len = len_
-                if len(buf) < required_len:
-                    break
-
-                try:
-                    msg, rest = bmp.BMPMessage.parser(buf)
-                except Exception, e:
-                    pkt = buf[:len_]
-                    buf = buf[len_:]
-                    self.failed_pkt_count += 1
-                    self.logger.error("failed to parse: %s"
-                                      " (total fail count: %d)" %
-                                      (e, self.failed_pkt_count))
-                else:
-                    buf = rest
-                    if isinstance(msg, bmp.BMPInitiation):
-                        LOG.info("Start BMP session!! [%s]"%addr[0])
-                    elif isinstance(msg, bmp.BMPPeerUpNotification):
-                        self.print_BMPPeerUpNotification(msg, addr)
-                    elif isinstance(msg, bmp.BMPRouteMonitoring):
-                        self.print_BMPRouteMonitoring(msg, addr)
-                    elif isinstance(msg, bmp.BMPPeerDownNotification):
-                        self.print_BMPPeerDownNotification(msg, addr)
-
-                required_len = bmp.BMPMessage._HDR_LEN
+        reader = BMPStreamReader(sock)
+        parser_pool = self.parser_pool
+        capture = self.capture
+        session = self.sessions_started
+        self.sessions_started += 1
+        self.sessions.inc()
+
+        try:
+            for pkt in reader:
+                self.bytes_total.inc(len(pkt))
+                if capture is not None:
+                    capture.write(session, time.time(), pkt.tobytes())
+                if PREFILTER:
+                    reason = self.prefilter(pkt)
+                    if reason is not None:
+                        self.prefilter_skipped_total.inc(labels=(reason,))
+                        continue
+                    self.prefilter_passed_total.inc()
+                task = (addr, pkt.tobytes(), reader.recv_time,
+                        reader.read_time)
+                if parser_pool is None:
+                    self.publish(self.decode(task))
+                    continue
+                parser_pool.submit(shard_key(pkt, addr), task)
+                if not reader.has_message():
+                    # Hand over what was framed before waiting on the socket.
+                    parser_pool.flush()
+        except BMPStreamError, e:
+            self.logger.error("%s" % e)
+        finally:
+            if parser_pool is not None:
+                parser_pool.flush()
+            if capture is not None:
+                capture.flush()
+            self.sessions.dec()
+            sock.close()
 
         self.logger.debug("BMP client disconnected, ip=%s, port=%s" % addr)
-        sock.close()
 
-    def print_BMPPeerUpNotification(self, msg, addr):
-        if msg.timestamp == 0:
-            bgp_t = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime())
-            self.print_BGP_PeerUpNotification(msg, addr, bgp_t)
+    def close(self):
+        if self.capture is not None:
+            self.capture.close()
+
+    def set_peer_filter(self, peer_ases):
+        # Only messages from these peer ASes can match a target (None lets
+        # every peer through).
+        if peer_ases is None:
+            self.peer_filter = None
+        else:
+            self.peer_filter = frozenset(str(peer_as) for peer_as in peer_ases)
+
+    def prefilter(self, pkt):
+        # Returns why pkt can be skipped, or None when it has to be parsed.
+        msg_type, peer_as, timestamp = peek_header(pkt)
+        if msg_type not in PREFILTER_TYPES:
+            return "type"
+        if peer_as is None or self.adj_rib_in is not None:
+            return None
+        peer_filter = self.peer_filter
+        if peer_filter is not None and str(peer_as) not in peer_filter:
+            return "peer"
+        max_age = PREFILTER_MAX_AGE.get(msg_type)
+        if max_age and timestamp and int(time.time()) - timestamp >= max_age:
+            return "stale"
+        return None
+
+    def stats(self):
+        return {
+            'sessions': self.sessions.get(),
+            'failed_pkt_count': self.failed_pkt_count,
+            'prefilter': PREFILTER,
+            'prefilter_passed': self.prefilter_passed_total.get(),
+            'prefilter_skipped': dict(
+                (labels[0], count) for labels, count
+                in self.prefilter_skipped_total.values().iteritems()),
+            'fast_decoder': FAST_DECODER,
+            'capture': (None if self.capture is None
+                        else self.capture.stats()),
+            'adj_rib_in': (None if self.adj_rib_in is None
+                           else self.adj_rib_in.stats()),
+            'decoded': dict(
+                (labels[0], count) for labels, count
+                in self.decoded_total.values().iteritems()),
+        }
+
+    def decode(self, task):
+        # Parses one framed message.  Runs in the handler, or in a parser
+        # process when PARSER_PROCESSES is set.
+        addr, data, recv_time, read_time = task
+        start_time = monotonic()
+        rib = self.adj_rib_in is not None
+        update = None
+        if FAST_DECODER and ord(data[5]) == BMP_MSG_ROUTE_MONITORING:
+            try:
+                rm = decode_route_monitoring(data, rib)
+            except (DecodeFallback, IndexError, struct.error):
+                # Ryu decides what is wrong with it.
+                pass
+            else:
+                bmp_results = self.print_RouteMonitoring(rm, addr)
+                if rib:
+                    update = self.rib_update_fast(rm)
+                parse_time = monotonic()
+                return (addr, recv_time, read_time, parse_time,
+                        parse_time - start_time, "BMPRouteMonitoring",
+                        rm.peer_address, "fast", update, bmp_results)
+        try:
+            msg, _ = bmp.BMPMessage.parser(data)
+        except Exception, e:
+            return (addr, recv_time, read_time, monotonic(), None, None,
+                    None, None, None, "%s" % e)
+        try:
+            peer_address, bmp_results, update = self.report(msg, addr, rib)
+        except Exception, e:
+            # Parsed, but not into anything the reports can make sense of.
+            return (addr, recv_time, read_time, monotonic(), None, None,
+                    None, None, None, "%s" % e)
+        parse_time = monotonic()
+        return (addr, recv_time, read_time, parse_time,
+                parse_time - start_time, msg.__class__.__name__, peer_address,
+                "ryu", update, bmp_results)
+
+    def report(self, msg, addr, rib):
+        # (peer address, bmp results, rib update) of a message Ryu parsed.
+        update = None
+        peer_address = None
+        if isinstance(msg, bmp.BMPPeerMessage):
+            peer_address = msg.peer_address
+        bmp_results = []
+        if isinstance(msg, bmp.BMPInitiation):
+            LOG.info("Start BMP session!! [%s]"%addr[0])
+        elif isinstance(msg, bmp.BMPPeerUpNotification):
+            bmp_results = self.print_BMPPeerUpNotification(msg, addr)
+            if rib:
+                update = rib_update(PEER_UP, msg.peer_as, msg.peer_bgp_id)
+        elif isinstance(msg, bmp.BMPRouteMonitoring):
+            bmp_results = self.print_BMPRouteMonitoring(msg, addr)
+            if rib and isinstance(msg.bgp_update, bgp.BGPUpdate):
+                update = self.rib_update_ryu(msg)
+        elif isinstance(msg, bmp.BMPPeerDownNotification):
+            bmp_results = self.print_BMPPeerDownNotification(msg, addr)
+            if rib:
+                update = rib_update(PEER_DOWN, msg.peer_as, msg.peer_bgp_id)
+        return peer_address, bmp_results, update
+
+    def rib_update_fast(self, rm):
+        withdrawn = [(None, prefix) for prefix in rm.withdrawn]
+        announced = [(None, prefix, rm.nexthop) for prefix in rm.nlri]
+        for type_, nexthop, prefixes in rm.mp_attributes:
+            if type_ == BGP_ATTR_TYPE_MP_REACH_NLRI:
+                announced += [(route_dist, prefix, nexthop)
+                              for prefix, route_dist, _ in prefixes]
+            else:
+                withdrawn += [(route_dist, prefix)
+                              for prefix, route_dist, _ in prefixes]
+        return rib_update(UPDATE, rm.peer_as, rm.peer_bgp_id, withdrawn,
+                          announced, rm.attributes)
+
+    def rib_update_ryu(self, msg):
+        update = msg.bgp_update
+        withdrawn = [(None, nlri.prefix) for nlri in update.withdrawn_routes]
+        announced = []
+        nexthop = None
+        attributes = []
+        for data in update.path_attributes:
+            if isinstance(data, bgp.BGPPathAttributeNextHop):
+                nexthop = data.value
+            elif isinstance(data, bgp.BGPPathAttributeMpUnreachNLRI):
+                withdrawn += [(getattr(nlri, 'route_dist', None), nlri.prefix)
+                              for nlri in data.withdrawn_routes
+                              if hasattr(nlri, 'prefix')]
+            elif isinstance(data, bgp.BGPPathAttributeMpReachNLRI):
+                announced += [(getattr(nlri, 'route_dist', None), nlri.prefix,
+                               data.next_hop)
+                              for nlri in data.nlri if hasattr(nlri, 'prefix')]
+            if data.type not in RIB_SKIP_ATTRIBUTES:
+                # serialize() gives a bytearray, the fast decoder a str.
+                attributes.append(str(data.serialize()))
+        announced += [(None, nlri.prefix, nexthop) for nlri in update.nlri]
+        return rib_update(UPDATE, msg.peer_as, msg.peer_bgp_id, withdrawn,
+                          announced, ''.join(attributes))
+
+    def publish(self, result):
+        (addr, recv_time, read_time, parse_time, busy, msg_type, peer_address,
+         decoder, update, bmp_results) = result
+        if msg_type is None:
+            self.failed_pkt_count += 1
+            self.parse_failures_total.inc()
+            self.logger.error("failed to parse: %s"
+                              " (total fail count: %d)" %
+                              (bmp_results, self.failed_pkt_count))
+            return
+        self.messages_total.inc(labels=(msg_type,))
+        self.decoded_total.inc(labels=(decoder,))
+        if peer_address is not None:
+            self.peer_messages_total.inc(labels=(addr[0], peer_address))
+        self.busy_seconds.inc(busy, labels=('bmp_parse',))
+        if update is not None:
+            self.adj_rib_in.apply(addr[0], peer_address, update)
+        if bmp_results:
+            for bmp_result in bmp_results:
+                self.events_total.inc(labels=(bmp_result.event_type,))
+            # One UPDATE is published as one batch.
+            self.bmp_q.put(BmpBatch(bmp_results, recv_time, read_time,
+                                    parse_time, monotonic()))
+
+    def decode_remote(self, task):
+        result = self.decode(tuple(task))
+        if result[4] is None:
+            return result
+        # marshal only carries plain tuples.
+        return result[:-1] + ([tuple(bmp_result)
+                               for bmp_result in result[-1]],)
+
+    def publish_remote(self, result):
+        if result[4] is not None:
+            result = result[:-1] + ([BmpEvent._make(bmp_result)
+                                     for bmp_result in result[-1]],)
+        self.publish(result)
+
+    def report_time(self, timestamp, max_age):
+        # The time to report a message with, or None when it is too old.
+        # Messages of a busy session mostly share their second, so the last
+        # answer is kept.
+        now = time.time()
+        key = (timestamp == 0, int(timestamp), int(now), max_age)
+        if key == self.report_time_key:
+            return self.report_time_value
+        if timestamp == 0:
+            bgp_t = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime(now))
         else:
             bgp_t = time.strftime("%Y/%m/%d %H:%M:%S",
-                                   time.localtime(int(msg.timestamp)))
-            time1 = time.mktime(time.localtime(int(msg.timestamp)))
-            time2 = time.mktime(time.localtime())
+                                   time.localtime(int(timestamp)))
+            time1 = time.mktime(time.localtime(int(timestamp)))
+            time2 = time.mktime(time.localtime(now))
             time_delta = time2 - time1
-            if time_delta < 30:
-                self.print_BGP_PeerUpNotification(msg, addr, bgp_t)
+            if time_delta >= max_age:
+                bgp_t = None
+        self.report_time_key = key
+        self.report_time_value = bgp_t
+        return bgp_t
+
+    def print_BMPPeerUpNotification(self, msg, addr):
+        bgp_t = self.report_time(msg.timestamp, PEER_UP_MAX_AGE)
+        if bgp_t is None:
+            return []
+        return self.print_BGP_PeerUpNotification(msg, addr, bgp_t)
 
     def print_BGP_PeerUpNotification(self, msg, addr, bgp_t):
-        bmp_result = {}
-        bmp_result['received_time'] = bgp_t
-        bmp_result['received_host'] = addr[0]
-        bmp_result['event_type'] = "adj_up"
-        bmp_result['peer_as'] = msg.peer_as
-        bmp_result['peer_bgp_id'] = msg.peer_bgp_id
-        bmp_result['prefix'] = None
-        bmp_result['route_dist'] = None
-        bmp_result['vpnv4_prefix'] = None
-        bmp_result['nexthop'] = None
-        self.bmp_q.put(bmp_result)
-        LOG.debug("bmp_result=%s"%bmp_result)
+        bmp_result = BmpEvent(received_time=bgp_t,
+                              received_host=addr[0],
+                              event_type="adj_up",
+                              peer_as=msg.peer_as,
+                              peer_bgp_id=msg.peer_bgp_id,
+                              prefix=None,
+                              route_dist=None,
+                              vpnv4_prefix=None,
+                              nexthop=None)
+        LOG.debug("bmp_result=%s"%(bmp_result,))
+        return [bmp_result]
 
     def print_BMPPeerDownNotification(self, msg, addr):
-        bmp_result = {}
-        peer_as = msg.peer_as
-        peer_bgp_id = msg.peer_bgp_id
         now_t = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime())
-        bmp_result['received_time'] = now_t
-        bmp_result['received_host'] = addr[0]
-        bmp_result['event_type'] = "adj_down"
-        bmp_result['peer_as'] = peer_as
-        bmp_result['peer_bgp_id'] = peer_bgp_id
-        bmp_result['prefix'] = None
-        bmp_result['route_dist'] = None
-        bmp_result['vpnv4_prefix'] = None
-        bmp_result['nexthop'] = None
-        self.bmp_q.put(bmp_result)
-        LOG.debug("bmp_result=%s"%bmp_result)
+        bmp_result = BmpEvent(received_time=now_t,
+                              received_host=addr[0],
+                              event_type="adj_down",
+                              peer_as=msg.peer_as,
+                              peer_bgp_id=msg.peer_bgp_id,
+                              prefix=None,
+                              route_dist=None,
+                              vpnv4_prefix=None,
+                              nexthop=None)
+        LOG.debug("bmp_result=%s"%(bmp_result,))
+        return [bmp_result]
 
     def print_BMPRouteMonitoring(self, msg, addr):
-        if msg.timestamp == 0:
-            bgp_t = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime())
-            if isinstance(msg.bgp_update, bgp.BGPRouteRefresh):
-                self.extract_BGP_RouteRefresh(msg, addr, bgp_t)
-            elif isinstance(msg.bgp_update, bgp.BGPUpdate):
-                self.extract_BGP_Update(msg, addr, bgp_t)
-        else:
-            bgp_t = time.strftime("%Y/%m/%d %H:%M:%S",
-                                   time.localtime(int(msg.timestamp)))
-            now_t = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime())
-            time1 = time.mktime(time.localtime(int(msg.timestamp)))
-            time2 = time.mktime(time.localtime())
-            time_delta = time2 - time1
-            if time_delta < 60:
-                if isinstance(msg.bgp_update, bgp.BGPRouteRefresh):
-                    self.extract_BGP_RouteRefresh(msg, addr, bgp_t)
-                elif isinstance(msg.bgp_update, bgp.BGPUpdate):
-                    self.extract_BGP_Update(msg, addr, bgp_t)
+        bgp_t = self.report_time(msg.timestamp, ROUTE_MONITORING_MAX_AGE)
+        if bgp_t is None:
+            return []
+        if isinstance(msg.bgp_update, bgp.BGPRouteRefresh):
+            return self.extract_BGP_RouteRefresh(msg, addr, bgp_t)
+        elif isinstance(msg.bgp_update, bgp.BGPUpdate):
+            return self.extract_BGP_Update(msg, addr, bgp_t)
+        return []
+
+    def print_RouteMonitoring(self, rm, addr):
+        # Same events as print_BMPRouteMonitoring, from a bmpDecoder
+        # RouteMonitoring.
+        bgp_t = self.report_time(rm.timestamp, ROUTE_MONITORING_MAX_AGE)
+        if bgp_t is None:
+            return []
+        return self.extract_fast(rm, addr, bgp_t)
 
     def extract_BGP_RouteRefresh(self, msg, addr, bgp_t):
-        bmp_result = {}
-        bmp_result['received_time'] = bgp_t
-        bmp_result['received_host'] = addr[0]
-        bmp_result['peer_as'] = msg.peer_as
-        bmp_result['peer_bgp_id'] = msg.peer_bgp_id
-        bmp_result['event_type'] = "route_refresh"
-        bmp_result['peer_bgp_id'] = msg.peer_bgp_id
-        bmp_result['route_dist'] = None
-        bmp_result['vpnv4_prefix'] = None
-        bmp_result['nexthop'] = None
-        self.bmp_q.put(bmp_result)
-        LOG.debug("bmp_result=%s"%bmp_result)
+        bmp_result = BmpEvent(received_time=bgp_t,
+                              received_host=addr[0],
+                              event_type="route_refresh",
+                              peer_as=msg.peer_as,
+                              peer_bgp_id=msg.peer_bgp_id,
+                              prefix=None,
+                              route_dist=None,
+                              vpnv4_prefix=None,
+                              nexthop=None)
+        LOG.debug("bmp_result=%s"%(bmp_result,))
+        return [bmp_result]
 
     def extract_BGP_Update(self, msg, addr, bgp_t):
-        bmp_result = {}
-        bmp_result['received_time'] = bgp_t
-        bmp_result['received_host'] = addr[0]
-        bmp_result['peer_as'] = msg.peer_as
-        bmp_result['peer_bgp_id'] = msg.peer_bgp_id
-
         if msg.bgp_update.withdrawn_routes:
-            self.extract_bgp4_withdraw(msg, bmp_result)
+            return self.extract_bgp4_withdraw(msg, addr, bgp_t)
         elif msg.bgp_update.nlri:
-            self.extract_bgp4_nlri(msg, bmp_result)
+            return self.extract_bgp4_nlri(msg, addr, bgp_t)
         else:
-            self.extract_mpbgp(msg, bmp_result)
+            return self.extract_mpbgp(msg, addr, bgp_t)
 
-    def extract_bgp4_withdraw(self, msg, bmp_result):
+    def extract_bgp4_withdraw(self, msg, addr, bgp_t):
+        bmp_results = []
         for del_nlri in msg.bgp_update.withdrawn_routes:
-            bmp_result['event_type'] = "adj_rib_in_changed(withdraw)"
-            bmp_result['prefix'] = del_nlri.prefix
-            bmp_result['route_dist'] = None
-            bmp_result['vpnv4_prefix'] = None
-            bmp_result['nexthop'] = None
-            self.bmp_q.put(bmp_result)
-            LOG.debug("bmp_result=%s"%bmp_result)
-
-    def extract_bgp4_nlri(self, msg, bmp_result):
+            bmp_result = BmpEvent(received_time=bgp_t,
+                                  received_host=addr[0],
+                                  event_type="adj_rib_in_changed(withdraw)",
+                                  peer_as=msg.peer_as,
+                                  peer_bgp_id=msg.peer_bgp_id,
+                                  prefix=del_nlri.prefix,
+                                  route_dist=None,
+                                  vpnv4_prefix=None,
+                                  nexthop=None)
+            bmp_results.append(bmp_result)
+            LOG.debug("bmp_result=%s"%(bmp_result,))
+        return bmp_results
+
+    def extract_bgp4_nlri(self, msg, addr, bgp_t):
+        nexthop = None
+        for data in msg.bgp_update.path_attributes:
+            if isinstance(data, bgp.BGPPathAttributeNextHop):
+                nexthop = data.value
+        bmp_results = []
         for add_nlri in msg.bgp_update.nlri:
-            bmp_result['event_type'] = "adj_rib_in_changed"
-            bmp_result['prefix'] = add_nlri.prefix
-            bmp_result['route_dist'] = None
-            bmp_result['vpnv4_prefix'] = None
-            for data in msg.bgp_update.path_attributes:
-                if isinstance(data, bgp.BGPPathAttributeNextHop):
-                    bmp_result['nexthop'] = data.value
-            self.bmp_q.put(bmp_result)
-            LOG.debug("bmp_result=%s"%bmp_result)
-
-    def extract_mpbgp(self, msg, bmp_result):
+            bmp_result = BmpEvent(received_time=bgp_t,
+                                  received_host=addr[0],
+                                  event_type="adj_rib_in_changed",
+                                  peer_as=msg.peer_as,
+                                  peer_bgp_id=msg.peer_bgp_id,
+                                  prefix=add_nlri.prefix,
+                                  route_dist=None,
+                                  vpnv4_prefix=None,
+                                  nexthop=nexthop)
+            bmp_results.append(bmp_result)
+            LOG.debug("bmp_result=%s"%(bmp_result,))
+        return bmp_results
+
+    def extract_mpbgp(self, msg, addr, bgp_t):
+        bmp_results = []
         for data in msg.bgp_update.path_attributes:
             if isinstance(data, bgp.BGPPathAttributeMpUnreachNLRI):
                 for del_nlri in data.withdrawn_routes:
-                    bmp_result['event_type'] = "adj_rib_in_changed(withdraw)"
-                    bmp_result['prefix'] = del_nlri.prefix
-                    bmp_result['route_dist'] = del_nlri.route_dist
-                    bmp_result['vpnv4_prefix'] = del_nlri.formatted_nlri_str
-                    bmp_result['nexthop'] = None
-                    self.bmp_q.put(bmp_result)
-                    LOG.debug("bmp_result=%s"%bmp_result)
+                    bmp_result = BmpEvent(
+                        received_time=bgp_t,
+                        received_host=addr[0],
+                        event_type="adj_rib_in_changed(withdraw)",
+                        peer_as=msg.peer_as,
+                        peer_bgp_id=msg.peer_bgp_id,
+                        prefix=del_nlri.prefix,
+                        route_dist=del_nlri.route_dist,
+                        vpnv4_prefix=del_nlri.formatted_nlri_str,
+                        nexthop=None)
+                    bmp_results.append(bmp_result)
+                    LOG.debug("bmp_result=%s"%(bmp_result,))
             elif isinstance(data, bgp.BGPPathAttributeMpReachNLRI):
                 for add_nlri in data.nlri:
-                    bmp_result['event_type'] = "adj_rib_in_changed"
-                    bmp_result['prefix'] = add_nlri.prefix
-                    bmp_result['route_dist'] = add_nlri.route_dist
-                    bmp_result['vpnv4_prefix'] = add_nlri.formatted_nlri_str
-                    bmp_result['nexthop'] = data.next_hop
-                    self.bmp_q.put(bmp_result)
-                    LOG.debug("bmp_result=%s"%bmp_result)
+                    bmp_result = BmpEvent(
+                        received_time=bgp_t,
+                        received_host=addr[0],
+                        event_type="adj_rib_in_changed",
+                        peer_as=msg.peer_as,
+                        peer_bgp_id=msg.peer_bgp_id,
+                        prefix=add_nlri.prefix,
+                        route_dist=add_nlri.route_dist,
+                        vpnv4_prefix=add_nlri.formatted_nlri_str,
+                        nexthop=data.next_hop)
+                    bmp_results.append(bmp_result)
+                    LOG.debug("bmp_result=%s"%(bmp_result,))
+        return bmp_results
+
+    def extract_fast(self, rm, addr, bgp_t):
+        received_host = addr[0]
+        peer_as = rm.peer_as
+        peer_bgp_id = rm.peer_bgp_id
+        if rm.withdrawn:
+            return [BmpEvent(bgp_t, received_host,
+                             "adj_rib_in_changed(withdraw)", peer_as,
+                             peer_bgp_id, prefix, None, None, None)
+                    for prefix in rm.withdrawn]
+        elif rm.nlri:
+            return [BmpEvent(bgp_t, received_host, "adj_rib_in_changed",
+                             peer_as, peer_bgp_id, prefix, None, None,
+                             rm.nexthop)
+                    for prefix in rm.nlri]
+        bmp_results = []
+        for type_, nexthop, prefixes in rm.mp_attributes:
+            if type_ == BGP_ATTR_TYPE_MP_REACH_NLRI:
+                event_type = "adj_rib_in_changed"
+            else:
+                event_type = "adj_rib_in_changed(withdraw)"
+            for prefix, route_dist, vpnv4_prefix in prefixes:
+                bmp_results.append(BmpEvent(bgp_t, received_host, event_type,
+                                            peer_as, peer_bgp_id, prefix,
+                                            route_dist, vpnv4_prefix,
+                                            nexthop))
+        return bmp_results
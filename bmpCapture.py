@@ -0,0 +1,98 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import gzip
+import struct
+
+from bmpStream import BMP_HDR_LEN, BMP_HDR_PACK_STR
+
+# A capture is CAPTURE_MAGIC followed by one record per BMP message: the
+# wall clock time it was received, the number of the BMP session (TCP
+# connection) it came on, its length and the message itself.  Files ending
+# in ".gz" are gzip compressed.  A raw BMP stream, such as a dump of the
+# socket or ryu_bmp_failed.dump, reads as one session without timestamps.
+CAPTURE_MAGIC = "APGWBMP1"
+RECORD_HDR_PACK_STR = '!dHI'
+RECORD_HDR_LEN = struct.calcsize(RECORD_HDR_PACK_STR)
+
+
+class CaptureError(Exception):
+    pass
+
+
+def open_file(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+class CaptureWriter(object):
+    def __init__(self, path):
+        self.path = path
+        self._file = open_file(path, 'wb')
+        self._file.write(CAPTURE_MAGIC)
+        self.messages = 0
+        self.bytes = 0
+
+    def write(self, session, timestamp, data):
+        self._file.write(struct.pack(RECORD_HDR_PACK_STR, timestamp,
+                                     session & 0xffff, len(data)))
+        self._file.write(data)
+        self.messages += 1
+        self.bytes += len(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def stats(self):
+        return {'path': self.path, 'messages': self.messages,
+                'bytes': self.bytes}
+
+
+def read_capture(path):
+    # Yields (timestamp, session, message); timestamp is None for a raw
+    # stream.
+    f = open_file(path, 'rb')
+    try:
+        head = f.read(len(CAPTURE_MAGIC))
+        if head == CAPTURE_MAGIC:
+            records = _read_records(f)
+        else:
+            records = _read_raw(f, head)
+        for record in records:
+            yield record
+    finally:
+        f.close()
+
+
+def _read_records(f):
+    while True:
+        try:
+            hdr = f.read(RECORD_HDR_LEN)
+        except IOError:
+            # A gzip capture whose writer never closed it lacks the trailer.
+            return
+        if not hdr:
+            return
+        if len(hdr) < RECORD_HDR_LEN:
+            raise CaptureError("truncated record header")
+        timestamp, session, length = struct.unpack(RECORD_HDR_PACK_STR, hdr)
+        data = f.read(length)
+        if len(data) < length:
+            raise CaptureError("truncated record")
+        yield timestamp, session, data
+
+
+def _read_raw(f, head):
+    buf = head + f.read()
+    pos = 0
+    while pos + BMP_HDR_LEN <= len(buf):
+        _, length, _ = struct.unpack_from(BMP_HDR_PACK_STR, buf, pos)
+        if length < BMP_HDR_LEN or pos + length > len(buf):
+            raise CaptureError("truncated message at offset %d" % pos)
+        yield None, 0, buf[pos:pos + length]
+        pos += length
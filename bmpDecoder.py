@@ -0,0 +1,208 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import socket
+import struct
+
+from collections import namedtuple
+from bmpStream import BMP_HDR_LEN, PER_PEER_HDR_LEN
+
+# Decodes only what BgpMonitor reports from a Route Monitoring message: the
+# peer, the timestamp, the withdrawn and announced prefixes and the next
+# hop.  Path attributes other than NEXT_HOP, MP_REACH_NLRI and
+# MP_UNREACH_NLRI are skipped over without being looked at.  Anything it
+# does not handle the way the Ryu parser would raises DecodeFallback, and
+# the caller parses that message with Ryu instead.
+
+BGP_HDR_LEN = 19
+BGP_MARKER = '\xff' * 16
+BGP_MSG_UPDATE = 2
+
+BGP_ATTR_FLAG_EXTENDED_LENGTH = 0x10
+BGP_ATTR_TYPE_NEXT_HOP = 3
+BGP_ATTR_TYPE_MP_REACH_NLRI = 14
+BGP_ATTR_TYPE_MP_UNREACH_NLRI = 15
+
+AFI_IPV4 = 1
+SAFI_MPLS_VPN = 128
+
+PEER_FLAG_IPV6 = 0x80
+LABEL_BOTTOM_OF_STACK = 0x000001
+LABEL_WITHDRAW = 0x800000
+# The Ryu prefix length of a VPNv4 NLRI always discounts one label.
+VPNV4_OVERHEAD_BITS = 24 + 64
+
+# An MP attribute as (type, next hop or None, [(prefix, route_dist,
+# vpnv4_prefix), ...]), in the order they appear in the UPDATE.
+# attributes holds the raw path attributes other than NEXT_HOP and the MP
+# ones, and is only filled in for decode_route_monitoring(data, rib=True).
+RouteMonitoring = namedtuple('RouteMonitoring', ['peer_as', 'peer_bgp_id',
+                                                 'peer_address', 'timestamp',
+                                                 'withdrawn', 'nlri',
+                                                 'nexthop', 'mp_attributes',
+                                                 'attributes'])
+
+
+class DecodeFallback(Exception):
+    pass
+
+
+def decode_route_monitoring(data, rib=False):
+    # data is one framed Route Monitoring message.  rib decodes all of an
+    # UPDATE for the Adj-RIB-In, not only what BgpMonitor reports.
+    if len(data) < BMP_HDR_LEN + PER_PEER_HDR_LEN + BGP_HDR_LEN:
+        raise DecodeFallback("short message")
+    (peer_flags, peer_address, peer_as, peer_bgp_id, ts_sec,
+     ts_usec) = struct.unpack_from('!xB8x16sI4sII', data, BMP_HDR_LEN)
+    if peer_flags & PEER_FLAG_IPV6:
+        peer_address = socket.inet_ntop(socket.AF_INET6, peer_address)
+    else:
+        peer_address = socket.inet_ntoa(peer_address[-4:])
+    peer_bgp_id = socket.inet_ntoa(peer_bgp_id)
+    timestamp = ts_sec + ts_usec * (10 ** -6)
+
+    pos = BMP_HDR_LEN + PER_PEER_HDR_LEN
+    if data[pos:pos + 16] != BGP_MARKER:
+        raise DecodeFallback("bad marker")
+    bgp_len, bgp_type = struct.unpack_from('!HB', data, pos + 16)
+    if bgp_type != BGP_MSG_UPDATE:
+        raise DecodeFallback("bgp message type %d" % bgp_type)
+    end = pos + bgp_len
+    if bgp_len < BGP_HDR_LEN + 4 or end > len(data):
+        raise DecodeFallback("bad bgp length")
+    pos += BGP_HDR_LEN
+
+    (withdrawn_len,) = struct.unpack_from('!H', data, pos)
+    pos += 2
+    if pos + withdrawn_len > end:
+        raise DecodeFallback("bad withdrawn routes length")
+    withdrawn = ipv4_prefixes(data, pos, pos + withdrawn_len)
+    pos += withdrawn_len
+    if withdrawn and not rib:
+        # BgpMonitor reports nothing else from an UPDATE with withdrawals.
+        return RouteMonitoring(peer_as, peer_bgp_id, peer_address, timestamp,
+                               withdrawn, [], None, [], None)
+
+    if pos + 2 > end:
+        raise DecodeFallback("bad withdrawn routes length")
+    (attrs_len,) = struct.unpack_from('!H', data, pos)
+    pos += 2
+    attrs_end = pos + attrs_len
+    if attrs_end > end:
+        raise DecodeFallback("bad path attributes length")
+    nexthop = None
+    mp_attributes = []
+    others = []
+    while pos < attrs_end:
+        attr_start = pos
+        if pos + 3 > attrs_end:
+            raise DecodeFallback("truncated path attribute")
+        flags = ord(data[pos])
+        type_ = ord(data[pos + 1])
+        if flags & BGP_ATTR_FLAG_EXTENDED_LENGTH:
+            if pos + 4 > attrs_end:
+                raise DecodeFallback("truncated path attribute")
+            (length,) = struct.unpack_from('!H', data, pos + 2)
+            pos += 4
+        else:
+            length = ord(data[pos + 2])
+            pos += 3
+        value_end = pos + length
+        if value_end > attrs_end:
+            raise DecodeFallback("truncated path attribute")
+        if type_ == BGP_ATTR_TYPE_NEXT_HOP:
+            if length != 4:
+                raise DecodeFallback("next hop length %d" % length)
+            nexthop = socket.inet_ntoa(data[pos:value_end])
+        elif type_ == BGP_ATTR_TYPE_MP_REACH_NLRI:
+            mp_attributes.append(mp_reach(data, pos, value_end))
+        elif type_ == BGP_ATTR_TYPE_MP_UNREACH_NLRI:
+            mp_attributes.append(mp_unreach(data, pos, value_end))
+        elif rib:
+            others.append(data[attr_start:value_end])
+        pos = value_end
+    nlri = ipv4_prefixes(data, attrs_end, end)
+    return RouteMonitoring(peer_as, peer_bgp_id, peer_address, timestamp,
+                           withdrawn, nlri, nexthop, mp_attributes,
+                           ''.join(others) if rib else None)
+
+
+def ipv4_prefixes(data, pos, end):
+    prefixes = []
+    while pos < end:
+        length = ord(data[pos])
+        size = (length + 7) // 8
+        pos += 1
+        if length > 32 or pos + size > end:
+            raise DecodeFallback("bad ipv4 prefix")
+        addr = data[pos:pos + size] + '\x00' * (4 - size)
+        prefixes.append("%s/%d" % (socket.inet_ntoa(addr), length))
+        pos += size
+    return prefixes
+
+
+def mp_reach(data, pos, end):
+    if pos + 4 > end:
+        raise DecodeFallback("truncated mp_reach")
+    afi, safi, nexthop_len = struct.unpack_from('!HBB', data, pos)
+    pos += 4
+    if afi != AFI_IPV4 or safi != SAFI_MPLS_VPN:
+        raise DecodeFallback("mp_reach afi %d safi %d" % (afi, safi))
+    if nexthop_len < 12 or nexthop_len % 12:
+        raise DecodeFallback("vpnv4 next hop length %d" % nexthop_len)
+    if pos + nexthop_len > end:
+        raise DecodeFallback("truncated mp_reach next hop")
+    # The first of the (route distinguisher, IPv4 address) next hops.
+    nexthop = socket.inet_ntoa(data[pos + 8:pos + 12])
+    pos += nexthop_len
+    if pos >= end or data[pos] != '\x00':
+        raise DecodeFallback("bad mp_reach reserved octet")
+    return (BGP_ATTR_TYPE_MP_REACH_NLRI, nexthop,
+            vpnv4_prefixes(data, pos + 1, end))
+
+
+def mp_unreach(data, pos, end):
+    if pos + 3 > end:
+        raise DecodeFallback("truncated mp_unreach")
+    afi, safi = struct.unpack_from('!HB', data, pos)
+    if afi != AFI_IPV4 or safi != SAFI_MPLS_VPN:
+        raise DecodeFallback("mp_unreach afi %d safi %d" % (afi, safi))
+    return (BGP_ATTR_TYPE_MP_UNREACH_NLRI, None,
+            vpnv4_prefixes(data, pos + 3, end))
+
+
+def vpnv4_prefixes(data, pos, end):
+    prefixes = []
+    while pos < end:
+        length = ord(data[pos])
+        size = (length + 7) // 8
+        pos += 1
+        if length < VPNV4_OVERHEAD_BITS or size > 15 or pos + size > end:
+            raise DecodeFallback("bad vpnv4 prefix")
+        label_hi, label_lo = struct.unpack_from('!BH', data, pos)
+        label = (label_hi << 16) | label_lo
+        if not (label & LABEL_BOTTOM_OF_STACK or label == LABEL_WITHDRAW):
+            raise DecodeFallback("label stack")
+        rd = route_dist(data, pos + 3)
+        addr = data[pos + 11:pos + size]
+        addr += '\x00' * (4 - len(addr))
+        prefix = "%s/%d" % (socket.inet_ntoa(addr),
+                            length - VPNV4_OVERHEAD_BITS)
+        prefixes.append((prefix, rd, "%s:%s" % (rd, prefix)))
+        pos += size
+    return prefixes
+
+
+def route_dist(data, pos):
+    (type_,) = struct.unpack_from('!H', data, pos)
+    if type_ == 0:
+        admin, assigned = struct.unpack_from('!HI', data, pos + 2)
+    elif type_ == 1:
+        admin = socket.inet_ntoa(data[pos + 2:pos + 6])
+        (assigned,) = struct.unpack_from('!H', data, pos + 6)
+    elif type_ == 2:
+        admin, assigned = struct.unpack_from('!IH', data, pos + 2)
+    else:
+        raise DecodeFallback("route distinguisher type %d" % type_)
+    return "%s:%s" % (admin, assigned)
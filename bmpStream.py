@@ -0,0 +1,137 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import struct
+
+from latency import monotonic
+
+BMP_VERSION = 3
+BMP_HDR_LEN = 6
+BMP_HDR_PACK_STR = '!BIB'
+
+BMP_MSG_ROUTE_MONITORING = 0
+BMP_MSG_STATISTICS_REPORT = 1
+BMP_MSG_PEER_DOWN_NOTIFICATION = 2
+BMP_MSG_PEER_UP_NOTIFICATION = 3
+BMP_MSG_INITIATION = 4
+BMP_MSG_TERMINATION = 5
+BMP_MSG_ROUTE_MIRRORING = 6
+
+# Message types that start with the 42 byte per-peer header.
+PEER_MESSAGE_TYPES = (BMP_MSG_ROUTE_MONITORING, BMP_MSG_STATISTICS_REPORT,
+                      BMP_MSG_PEER_DOWN_NOTIFICATION,
+                      BMP_MSG_PEER_UP_NOTIFICATION, BMP_MSG_ROUTE_MIRRORING)
+PER_PEER_HDR_LEN = 42
+# Peer AS and timestamp seconds, skipping the peer BGP ID between them.
+PER_PEER_AS_TS_OFFSET = BMP_HDR_LEN + 26
+PER_PEER_AS_TS_PACK_STR = '!I4xI'
+
+RECV_BUFSIZE = 256 * 1024
+MIN_RECV_LEN = 64 * 1024
+
+
+class BMPStreamError(Exception):
+    pass
+
+
+def peek_header(pkt):
+    # (type, peer AS, timestamp seconds) read straight from a framed
+    # message; peer AS and timestamp are None without a per-peer header.
+    msg_type = ord(pkt[5])
+    if (msg_type in PEER_MESSAGE_TYPES and
+            len(pkt) >= BMP_HDR_LEN + PER_PEER_HDR_LEN):
+        peer_as, timestamp = struct.unpack_from(PER_PEER_AS_TS_PACK_STR, pkt,
+                                                PER_PEER_AS_TS_OFFSET)
+        return msg_type, peer_as, timestamp
+    return msg_type, None, None
+
+
+class BMPStreamReader(object):
+    # Frames BMP messages out of a stream socket.  The socket is drained with
+    # large recv_into() calls into one reusable buffer and every message is
+    # handed out as a memoryview on that buffer, so neither the message nor
+    # the rest of the stream is copied.  A yielded view is only valid until
+    # the next message is requested.  recv_time and read_time are the
+    # monotonic times the first and the last byte of that message arrived.
+    def __init__(self, sock, bufsize=RECV_BUFSIZE):
+        self.sock = sock
+        self._buf = bytearray(bufsize)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        self.recv_count = 0
+        self.recv_bytes = 0
+        self.recv_time = None
+        self.read_time = None
+        self._pending_time = None
+        self._last_recv = None
+
+    def __iter__(self):
+        return self.messages()
+
+    def messages(self):
+        while True:
+            while self._end - self._start >= BMP_HDR_LEN:
+                version, len_, _ = struct.unpack_from(BMP_HDR_PACK_STR,
+                                                      self._buf, self._start)
+                if version != BMP_VERSION:
+                    raise BMPStreamError("unsupported bmp version: %d"
+                                         % version)
+                if len_ < BMP_HDR_LEN:
+                    raise BMPStreamError("invalid bmp message length: %d"
+                                         % len_)
+                if self._end - self._start < len_:
+                    self._reserve(len_)
+                    break
+                start = self._start
+                self._start += len_
+                self.recv_time = self._pending_time
+                self.read_time = self._last_recv
+                # The next message began no later than the last recv.
+                self._pending_time = self._last_recv
+                yield self._view[start:start + len_]
+
+            if not self._fill():
+                return
+
+    def has_message(self):
+        # True when the next message is already complete in the buffer, so
+        # asking for it will not wait on the socket.
+        if self._end - self._start < BMP_HDR_LEN:
+            return False
+        _, len_, _ = struct.unpack_from(BMP_HDR_PACK_STR, self._buf,
+                                        self._start)
+        return self._end - self._start >= len_
+
+    def _reserve(self, len_):
+        if len_ <= len(self._buf):
+            return
+        pending = self._end - self._start
+        buf = bytearray(max(len_, len(self._buf) * 2))
+        buf[:pending] = self._buf[self._start:self._end]
+        self._buf = buf
+        self._view = memoryview(buf)
+        self._start = 0
+        self._end = pending
+
+    def _fill(self):
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif len(self._buf) - self._end < MIN_RECV_LEN:
+            # Only the unfinished tail message is moved back to the front.
+            pending = self._end - self._start
+            self._buf[:pending] = self._buf[self._start:self._end]
+            self._start = 0
+            self._end = pending
+
+        n = self.sock.recv_into(self._view[self._end:])
+        if n == 0:
+            return False
+        self._last_recv = monotonic()
+        if self._start == self._end:
+            self._pending_time = self._last_recv
+        self._end += n
+        self.recv_count += 1
+        self.recv_bytes += n
+        return True
@@ -0,0 +1,294 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import logging
+import re
+import socket
+import time
+
+from eventlet import patcher
+from latency import monotonic
+from ryu.lib import hub
+
+# Green sockets and select even when the process was not monkey patched, so
+# a session waiting on a router only ever parks its own greenthread.
+telnetlib = patcher.import_patched('telnetlib')
+
+LOG = logging.getLogger('CliCollector')
+LOG.setLevel(logging.INFO)
+
+# Only the end of the output is searched for the prompt.
+PROMPT_WINDOW = 256
+
+LOGIN_PROMPT = re.compile(r'(?i)(login|username|password): ?$')
+LOGIN_ATTEMPTS = 3
+
+# Stands in for the answers to pipelined commands after a truncated one.
+NOT_READ = "% not read, the output before it was truncated\n"
+
+
+class CliTimeout(Exception):
+    pass
+
+
+class CliLoginError(Exception):
+    pass
+
+
+class _Session(object):
+    __slots__ = ('telnet', 'prompt', 'marker', 'last_used')
+
+    def __init__(self, telnet, prompt):
+        self.telnet = telnet
+        self.prompt = prompt
+        # The prompt as it starts a line, to split pipelined answers at.
+        self.marker = prompt.strip() or None
+        self.last_used = time.time()
+
+
+class CliCollector(object):
+    # Runs CLI commands on routers over telnet.  Up to maxsize sessions per
+    # host are kept logged in, with paging disabled, and reused for later
+    # commands until they have been idle for idle_timeout seconds.  An answer
+    # is read until the router prints its prompt again, connect and every
+    # command have a deadline and the output kept per command is capped at
+    # max_bytes.
+    def __init__(self, port=23, connect_timeout=10, read_timeout=30,
+                 max_bytes=8 * 1024 * 1024, prompt=r'[\w.\-@:()/]+[>#] ?$',
+                 username="", password="", paging_command="terminal length 0",
+                 maxsize=4, idle_timeout=120):
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_bytes = max_bytes
+        self.prompt = re.compile(prompt)
+        self.username = username
+        self.password = password
+        self.paging_command = paging_command
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self._slots = {}
+        self.sessions = 0
+        self.commands = 0
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.truncated = 0
+        self.bytes = 0
+        self.reaper_thread = hub.spawn(self._reaper)
+
+    def run(self, host, command):
+        return self.run_many(host, [command])[0]
+
+    def run_many(self, host, commands):
+        # The commands are written back to back and their answers read in
+        # order, one round trip for all of them on a pooled session.
+        slot = self._slots.get(host)
+        if slot is None:
+            slot = self._slots[host] = hub.BoundedSemaphore(self.maxsize)
+
+        with slot:
+            session, reused = self._get(host)
+            try:
+                outputs, complete = self._send(session, host, commands)
+            except (EOFError, socket.error), e:
+                session.telnet.close()
+                if not reused:
+                    raise
+                # The router dropped the idle session, retry once on a fresh
+                # one.
+                LOG.debug("stale session to %s: %r" % (host, e))
+                self.reconnects += 1
+                session = self._new(host)
+                try:
+                    outputs, complete = self._send(session, host, commands)
+                except:
+                    session.telnet.close()
+                    raise
+            except:
+                session.telnet.close()
+                raise
+
+            if complete:
+                session.last_used = time.time()
+                self._idle.setdefault(host, []).append(session)
+            else:
+                # The rest of a truncated answer is still on its way.
+                session.telnet.close()
+        return [session.prompt + output for output in outputs]
+
+    def _send(self, session, host, commands):
+        session.telnet.write("".join(command + "\n" for command in commands))
+        self.commands += len(commands)
+        outputs = []
+        rest = ""
+        for command in commands:
+            output, rest, complete = self.read_prompt(
+                session.telnet, host, marker=session.marker, data=rest)
+            outputs.append(output)
+            if not complete:
+                outputs += [NOT_READ] * (len(commands) - len(outputs))
+                return outputs, False
+        return outputs, True
+
+    def _get(self, host):
+        idle = self._idle.get(host)
+        while idle:
+            session = idle.pop()
+            try:
+                # Drops whatever the router printed since, and raises EOFError
+                # when it closed the session.
+                session.telnet.read_very_eager()
+            except (EOFError, socket.error):
+                self.evictions += 1
+                session.telnet.close()
+                continue
+            self.hits += 1
+            return session, True
+        self.misses += 1
+        return self._new(host), False
+
+    def _new(self, host):
+        self.sessions += 1
+        try:
+            telnet = telnetlib.Telnet(host, self.port, self.connect_timeout)
+        except socket.timeout:
+            self.timeouts += 1
+            raise CliTimeout("connect to %s:%s timed out after %ss"
+                             % (host, self.port, self.connect_timeout))
+        except socket.error:
+            self.errors += 1
+            raise
+        try:
+            session = _Session(telnet, self._login(telnet, host))
+            if self.paging_command:
+                telnet.write(self.paging_command + "\n")
+                self.read_prompt(telnet, host, marker=session.marker)
+        except:
+            telnet.close()
+            raise
+        return session
+
+    def _login(self, telnet, host):
+        for attempt in range(LOGIN_ATTEMPTS + 1):
+            output, _, _ = self.read_prompt(telnet, host, LOGIN_PROMPT)
+            tail = output[-PROMPT_WINDOW:]
+            match = LOGIN_PROMPT.search(tail)
+            if match is None:
+                return output[output.rfind('\n') + 1:]
+            if match.group(1).lower() == 'password':
+                telnet.write(self.password + "\n")
+            else:
+                telnet.write(self.username + "\n")
+        self.errors += 1
+        raise CliLoginError("login to %s failed" % host)
+
+    def read_prompt(self, telnet, host, login=None, marker=None, data=""):
+        # Reads one answer.  With marker, the exact prompt of a logged-in
+        # session, the answer ends at the first line starting with it, and
+        # whatever follows belongs to the next pipelined command.  Without
+        # it the answer ends when its last line matches the prompt pattern,
+        # or login.  data was read before and is looked at first.  Returns
+        # (answer up to and including the prompt, the rest, True), or (the
+        # first max_bytes of the answer, "", False) when it went on longer.
+        deadline = monotonic() + self.read_timeout
+        if marker is not None:
+            marker = "\n" + marker
+        chunks = []
+        size = 0
+        # An answer starts on a line of its own, maybe with the prompt
+        # right away.
+        tail = "\n"
+        while True:
+            if not data:
+                data = self._read(telnet, host, deadline)
+            stop = None
+            if marker is not None:
+                index = (tail + data).find(marker)
+                if index >= 0:
+                    stop = index + len(marker) - len(tail)
+                    if data[stop:stop + 1] == ' ':
+                        stop += 1
+            piece = data if stop is None else data[:stop]
+            if size + len(piece) > self.max_bytes:
+                chunks.append(piece[:self.max_bytes - size])
+                self.truncated += 1
+                LOG.warning("output from %s truncated at %d bytes"
+                            % (host, self.max_bytes))
+                return ("".join(chunks) + "\n%% output truncated at %d "
+                        "bytes\n" % self.max_bytes), "", False
+            chunks.append(piece)
+            size += len(piece)
+            if stop is not None:
+                return "".join(chunks), data[stop:], True
+            if marker is not None:
+                tail = (tail + data)[-len(marker):]
+            else:
+                tail = (tail + data)[-PROMPT_WINDOW:]
+                if (self.prompt.search(tail) or
+                        (login is not None and login.search(tail))):
+                    return "".join(chunks), "", True
+            data = ""
+
+    def _read(self, telnet, host, deadline):
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                self.timeouts += 1
+                raise CliTimeout("no prompt from %s within %ss"
+                                 % (host, self.read_timeout))
+            telnet.sock.settimeout(remaining)
+            try:
+                data = telnet.read_some()
+            except socket.timeout:
+                continue
+            except (EOFError, socket.error):
+                self.errors += 1
+                raise
+            if not data:
+                self.errors += 1
+                raise EOFError("%s closed the session before its prompt"
+                               % host)
+            self.bytes += len(data)
+            return data
+
+    def evict_idle(self):
+        now = time.time()
+        for host, idle in self._idle.items():
+            for session in idle[:]:
+                if now - session.last_used > self.idle_timeout:
+                    LOG.info("closing idle CLI session to %s" % host)
+                    self.evictions += 1
+                    idle.remove(session)
+                    session.telnet.close()
+
+    def _reaper(self):
+        while True:
+            hub.sleep(min(self.idle_timeout, 30) or 1)
+            self.evict_idle()
+
+    def stats(self):
+        return {
+            'connections': sum(len(idle) for idle in self._idle.values()),
+            'sessions': self.sessions,
+            'commands': self.commands,
+            'hits': self.hits,
+            'misses': self.misses,
+            'reconnects': self.reconnects,
+            'evictions': self.evictions,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'truncated': self.truncated,
+            'bytes': self.bytes,
+        }
+
+    def close(self):
+        hub.kill(self.reaper_thread)
+        for idle in self._idle.values():
+            while idle:
+                idle.pop().telnet.close()
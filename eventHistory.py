@@ -0,0 +1,219 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import logging
+import sqlite3
+import time
+
+from eventlet import tpool
+from ryu.lib import hub
+
+LOG = logging.getLogger('EventHistory')
+LOG.setLevel(logging.INFO)
+
+FIELDS = ('event_id', 'event_ts', 'event_time', 'received_time',
+          'peer_bgp_id', 'event_type', 'peer_as', 'vpnv4_prefix', 'nexthop',
+          'ping_result', 'ping_recv', 'show_neighbor_result',
+          'show_rib_result')
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS events ("
+    " event_id INTEGER PRIMARY KEY, event_ts REAL, event_time TEXT,"
+    " received_time TEXT, peer_bgp_id TEXT, event_type TEXT, peer_as TEXT,"
+    " vpnv4_prefix TEXT, nexthop TEXT, ping_result TEXT, ping_recv TEXT,"
+    " show_neighbor_result TEXT, show_rib_result TEXT)",
+    "CREATE INDEX IF NOT EXISTS events_ts ON events (event_ts)",
+    "CREATE INDEX IF NOT EXISTS events_peer_as ON events (peer_as, event_id)",
+    "CREATE INDEX IF NOT EXISTS events_prefix"
+    " ON events (vpnv4_prefix, event_id)",
+    "CREATE INDEX IF NOT EXISTS events_type ON events (event_type, event_id)",
+    "CREATE INDEX IF NOT EXISTS events_ping_result"
+    " ON events (ping_result, event_id)",
+]
+
+QUERY_FILTERS = ('peer_as', 'vpnv4_prefix', 'event_type', 'ping_result')
+QUERY_MAX_LIMIT = 1000
+
+
+class EventHistory(object):
+    # Append-only SQLite log of finished EventResults.  append() only queues
+    # the row; a writer thread commits queued rows in batches on a separate
+    # connection inside eventlet's OS thread pool, so neither the insert nor
+    # the commit runs on the hub.
+    def __init__(self, path, batch_size=500, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._db = self._connect()
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+        self._writer_db = self._connect()
+        self._q = hub.Queue()
+        self._batch = []
+        self._closing = False
+        self.written = 0
+        self.batches = 0
+        self.writer_thread = hub.spawn(self._writer)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def append(self, eventResult):
+        event = eventResult.get_all()
+        row = []
+        for field in FIELDS:
+            if field == 'event_ts':
+                row.append(time.mktime(time.strptime(event['event_time'],
+                                                     "%Y/%m/%d %H:%M:%S")))
+            elif field == 'event_id':
+                row.append(int(event['event_id']))
+            else:
+                value = event.get(field)
+                if isinstance(value, str):
+                    value = value.decode('utf-8', 'replace')
+                elif value is not None:
+                    value = unicode(value)
+                row.append(value)
+        self._q.put(tuple(row))
+
+    def _writer(self):
+        # close() queues None to wake it.
+        while not self._closing:
+            row = self._q.get()
+            if row is not None:
+                self._batch.append(row)
+            deadline = time.time() + self.flush_interval
+            while len(self._batch) < self.batch_size and not self._closing:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._q.get(timeout=timeout)
+                except hub.QueueEmpty:
+                    break
+                if row is not None:
+                    self._batch.append(row)
+            rows, self._batch = self._batch, []
+            if not rows:
+                continue
+            try:
+                tpool.execute(self._write, rows)
+            except Exception, e:
+                LOG.error("failed to write %d events: %s" % (len(rows), e))
+
+    def _write(self, rows):
+        self._writer_db.executemany(
+            "INSERT OR REPLACE INTO events VALUES (%s)"
+            % ",".join("?" * len(FIELDS)), rows)
+        self._writer_db.commit()
+        self.written += len(rows)
+        self.batches += 1
+
+    def flush(self):
+        rows, self._batch = self._batch, []
+        while True:
+            try:
+                row = self._q.get_nowait()
+            except hub.QueueEmpty:
+                break
+            if row is not None:
+                rows.append(row)
+        if rows:
+            self._write(rows)
+
+    def get(self, event_id):
+        try:
+            event_id = int(event_id)
+        except (TypeError, ValueError):
+            return None
+        cursor = self._db.execute("SELECT * FROM events WHERE event_id = ?",
+                                  (event_id,))
+        return self._to_event(cursor.fetchone())
+
+    def latest(self):
+        cursor = self._db.execute("SELECT * FROM events"
+                                  " ORDER BY event_id DESC LIMIT 1")
+        return self._to_event(cursor.fetchone())
+
+    def max_event_id(self):
+        cursor = self._db.execute("SELECT MAX(event_id) FROM events")
+        return cursor.fetchone()[0] or 0
+
+    def query(self, filters, since=None, until=None, cursor=None, limit=100,
+              fields=None):
+        # Newest first.  The returned cursor is the last event_id of the
+        # page; passing it back continues below it, so every page is an
+        # index range scan whatever its depth.
+        if fields:
+            fields = [field for field in FIELDS
+                      if field in fields and field != 'event_ts']
+            if 'event_id' not in fields:
+                fields.insert(0, 'event_id')
+        else:
+            fields = [field for field in FIELDS if field != 'event_ts']
+        limit = max(1, min(int(limit), QUERY_MAX_LIMIT))
+
+        where = []
+        args = []
+        for field in QUERY_FILTERS:
+            value = filters.get(field)
+            if value is not None:
+                where.append("%s = ?" % field)
+                args.append(unicode(value))
+        if since is not None:
+            where.append("event_ts >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("event_ts < ?")
+            args.append(until)
+        if cursor is not None:
+            where.append("event_id < ?")
+            args.append(int(cursor))
+
+        sql = "SELECT %s FROM events" % ", ".join(fields)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY event_id DESC LIMIT ?"
+        args.append(limit + 1)
+        rows = self._db.execute(sql, args).fetchall()
+
+        events = []
+        for row in rows[:limit]:
+            event = dict(zip(fields, row))
+            event['event_id'] = str(event['event_id'])
+            events.append(event)
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = events[-1]['event_id']
+        return events, next_cursor
+
+    def _to_event(self, row):
+        if row is None:
+            return None
+        event = dict(zip(FIELDS, row))
+        del event['event_ts']
+        event['event_id'] = str(event['event_id'])
+        return event
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'pending': self._q.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+        }
+
+    def close(self):
+        # Lets a commit in progress finish instead of killing the writer
+        # while its tpool thread still uses the connection.
+        self._closing = True
+        self._q.put(None)
+        hub.joinall([self.writer_thread])
+        self.flush()
+        self._writer_db.close()
+        self._db.close()
@@ -0,0 +1,146 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import logging
+
+from collections import deque
+from latency import monotonic
+from ryu.lib import hub
+
+LOG = logging.getLogger('EventQueue')
+LOG.setLevel(logging.INFO)
+
+POLICY_BLOCK = "block"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_COALESCE = "coalesce"
+
+
+def coalesce_key(bmp_result):
+    if bmp_result.prefix is None:
+        return None
+    return bmp_result.peer_as, bmp_result.route_dist, bmp_result.prefix
+
+
+class EventQueue(object):
+    # Queue of BmpBatches bounded by the number of events they hold
+    # (maxsize 0 leaves it unbounded).  When a put() would overflow it:
+    #   block        waits for the consumer, which stops the session's
+    #                socket reads and pushes back on the router over TCP
+    #   drop_oldest  drops the oldest queued batches
+    #   coalesce     overwrites queued events for the same (peer_as,
+    #                route_dist, prefix) in place with the newer ones, then
+    #                drops the oldest batches if that was not enough
+    # A batch larger than maxsize is still accepted into an empty queue.
+    def __init__(self, maxsize=0, policy=POLICY_BLOCK):
+        if policy not in (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_COALESCE):
+            raise ValueError("unknown queue policy: %s" % policy)
+        self.maxsize = maxsize
+        self.policy = policy
+        self._batches = deque()
+        self._size = 0
+        self._index = {}
+        self._not_empty = hub.Event()
+        self._not_full = hub.Event()
+        self.dropped = 0
+        self.coalesced = 0
+        self.blocked = 0
+        self.blocked_time = 0.0
+
+    def qsize(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._batches)
+
+    def full(self, count=1):
+        return bool(self.maxsize and self._size and
+                    self._size + count > self.maxsize)
+
+    def put(self, batch):
+        if self.full(len(batch.events)):
+            if self.policy == POLICY_BLOCK:
+                self._wait_not_full(len(batch.events))
+            else:
+                if self.policy == POLICY_COALESCE:
+                    batch = self._coalesce(batch)
+                    if batch is None:
+                        return
+                while self.full(len(batch.events)):
+                    self._drop_oldest()
+        self._batches.append(batch)
+        self._size += len(batch.events)
+        if self.policy == POLICY_COALESCE:
+            for position, bmp_result in enumerate(batch.events):
+                key = coalesce_key(bmp_result)
+                if key is not None:
+                    self._index[key] = (batch, position)
+        self._not_empty.set()
+
+    def _wait_not_full(self, count):
+        self.blocked += 1
+        start = monotonic()
+        while self.full(count):
+            self._not_full.clear()
+            self._not_full.wait()
+        self.blocked_time += monotonic() - start
+
+    def _coalesce(self, batch):
+        # Returns the part of batch that found nothing to overwrite.
+        rest = []
+        for bmp_result in batch.events:
+            entry = self._index.get(coalesce_key(bmp_result))
+            if entry is None:
+                rest.append(bmp_result)
+            else:
+                queued, position = entry
+                queued.events[position] = bmp_result
+                self.coalesced += 1
+        if not rest:
+            return None
+        if len(rest) < len(batch.events):
+            batch = batch._replace(events=rest)
+        return batch
+
+    def _drop_oldest(self):
+        batch = self._batches.popleft()
+        self._forget(batch)
+        self.dropped += len(batch.events)
+
+    def _forget(self, batch):
+        self._size -= len(batch.events)
+        if self._index:
+            for bmp_result in batch.events:
+                key = coalesce_key(bmp_result)
+                entry = self._index.get(key)
+                if entry is not None and entry[0] is batch:
+                    del self._index[key]
+
+    def get(self):
+        while not self._batches:
+            self._not_empty.clear()
+            self._not_empty.wait()
+        return self._pop()
+
+    def get_nowait(self):
+        if not self._batches:
+            raise hub.QueueEmpty()
+        return self._pop()
+
+    def _pop(self):
+        batch = self._batches.popleft()
+        self._forget(batch)
+        self._not_full.set()
+        return batch
+
+    def stats(self):
+        return {
+            'events': self._size,
+            'batches': len(self._batches),
+            'maxsize': self.maxsize,
+            'policy': self.policy,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'blocked': self.blocked,
+            'blocked_time': self.blocked_time,
+        }
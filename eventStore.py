@@ -0,0 +1,82 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import time
+
+from collections import OrderedDict
+
+
+class EventStore(object):
+    # EventResults keyed by event_id in arrival order.  The oldest events are
+    # dropped once the store holds more than capacity events or once they
+    # are older than max_age seconds (0 disables either bound).
+    def __init__(self, capacity=100000, max_age=0):
+        self.capacity = capacity
+        self.max_age = max_age
+        self._events = OrderedDict()
+        self.latest_id = None
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def __contains__(self, event_id):
+        return self.get(event_id) is not None
+
+    def __getitem__(self, event_id):
+        eventResult = self.get(event_id)
+        if eventResult is None:
+            raise KeyError(event_id)
+        return eventResult
+
+    def __setitem__(self, event_id, eventResult):
+        self.add(event_id, eventResult)
+
+    def add(self, event_id, eventResult):
+        self._events[int(event_id)] = (time.time(), eventResult)
+        self.latest_id = int(event_id)
+        self.evict()
+
+    def get(self, event_id, default=None):
+        try:
+            entry = self._events.get(int(event_id))
+        except (TypeError, ValueError):
+            return default
+        if entry is None:
+            return default
+        return entry[1]
+
+    def latest(self):
+        if self.latest_id is None:
+            return None
+        return self.get(self.latest_id)
+
+    def evict(self):
+        while self.capacity and len(self._events) > self.capacity:
+            self._events.popitem(last=False)
+            self.evicted += 1
+        if self.max_age:
+            expire = time.time() - self.max_age
+            while self._events:
+                event_id = next(iter(self._events))
+                if self._events[event_id][0] >= expire:
+                    break
+                del self._events[event_id]
+                self.evicted += 1
+        if self.latest_id not in self._events:
+            self.latest_id = None
+
+    def stats(self):
+        self.evict()
+        result_bytes = 0
+        for _, eventResult in self._events.itervalues():
+            result_bytes += eventResult.nbytes
+        return {
+            'events': len(self._events),
+            'capacity': self.capacity,
+            'max_age': self.max_age,
+            'evicted': self.evicted,
+            'latest_id': self.latest_id,
+            'result_bytes': result_bytes,
+        }
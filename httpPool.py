@@ -0,0 +1,104 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import errno
+import logging
+import socket
+
+from httplib import HTTPConnection, HTTPException, BadStatusLine
+from ryu.lib import hub
+
+LOG = logging.getLogger('HTTPConnectionPool')
+LOG.setLevel(logging.INFO)
+
+
+def stale_connection(e):
+    # Whether e shows a kept-alive connection the server has closed.  A
+    # timeout means a slow server, and is not worth sending the request
+    # again.
+    if isinstance(e, BadStatusLine):
+        return True
+    return (isinstance(e, socket.error) and
+            e.errno in (errno.ECONNRESET, errno.EPIPE))
+
+
+class HTTPConnectionPool(object):
+    # Per-host pool of persistent HTTP/1.1 connections.  At most maxsize
+    # requests run against one host at a time and the connections are put
+    # back for reuse once their response has been read.
+    def __init__(self, port=8080, maxsize=4, timeout=10, debuglevel=0):
+        self.port = port
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.debuglevel = debuglevel
+        self._idle = {}
+        self._slots = {}
+        self.hits = 0
+        self.misses = 0
+        self.retries = 0
+
+    def request(self, host, method, url_path, body="", headers=None):
+        if headers is None:
+            headers = {}
+        slot = self._slots.get(host)
+        if slot is None:
+            slot = self._slots[host] = hub.BoundedSemaphore(self.maxsize)
+
+        with slot:
+            conn, reused = self._get(host)
+            keep = False
+            try:
+                try:
+                    response, data = self._send(conn, method, url_path, body,
+                                                headers)
+                except (HTTPException, socket.error), e:
+                    if not reused or not stale_connection(e):
+                        raise
+                    # The server closed the kept-alive connection, retry once
+                    # on a fresh one.
+                    LOG.debug("stale connection to %s: %r" % (host, e))
+                    self.retries += 1
+                    conn.close()
+                    conn = self._new(host)
+                    response, data = self._send(conn, method, url_path, body,
+                                                headers)
+                keep = not response.will_close
+            finally:
+                if keep:
+                    self._idle.setdefault(host, []).append(conn)
+                else:
+                    conn.close()
+        return response.status, data
+
+    def _send(self, conn, method, url_path, body, headers):
+        conn.request(method, url_path, body, headers)
+        response = conn.getresponse()
+        return response, response.read()
+
+    def _get(self, host):
+        idle = self._idle.get(host)
+        if idle:
+            self.hits += 1
+            return idle.pop(), True
+        self.misses += 1
+        return self._new(host), False
+
+    def _new(self, host):
+        conn = HTTPConnection(host, self.port, timeout=self.timeout)
+        conn.set_debuglevel(self.debuglevel)
+        return conn
+
+    def stats(self):
+        return {
+            'idle': sum(len(idle) for idle in self._idle.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'retries': self.retries,
+        }
+
+    def close(self):
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
@@ -0,0 +1,169 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import bisect
+import ctypes
+import ctypes.util
+import os
+import time
+
+# Monotonic stamps taken along the path of one event, kept in a list in
+# this order, and the stages measured between two of them.
+STAMPS = ('recv', 'read', 'parsed', 'queued', 'dequeued', 'matched',
+          'ping_start', 'ping_end', 'show_start', 'show_neighbor', 'show_rib')
+STAMP_INDEX = dict((name, index) for index, name in enumerate(STAMPS))
+
+STAGES = (
+    ('read', 'recv', 'read'),
+    ('parse', 'read', 'parsed'),
+    ('queue', 'queued', 'dequeued'),
+    ('match', 'dequeued', 'matched'),
+    ('ping_wait', 'matched', 'ping_start'),
+    ('ping', 'ping_start', 'ping_end'),
+    ('show_wait', 'matched', 'show_start'),
+    ('show_neighbor', 'show_start', 'show_neighbor'),
+    ('show_rib', 'show_neighbor', 'show_rib'),
+)
+TOTAL_STAGE = 'total'
+
+PERCENTILES = (50, 95, 99)
+
+
+def _clock_gettime():
+    # CLOCK_MONOTONIC through libc for Python 2, which lacks time.monotonic.
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                       use_errno=True)
+    clock_gettime = libc.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    CLOCK_MONOTONIC = 1
+    ts = timespec()
+
+    def monotonic():
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    monotonic()
+    return monotonic
+
+
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    try:
+        from monotonic import monotonic
+    except ImportError:
+        try:
+            monotonic = _clock_gettime()
+        except Exception:
+            monotonic = time.time
+
+
+def _bucket_bounds(low=1e-6, high=3600.0, per_octave=8):
+    # Upper bounds growing by 2**(1/per_octave), about 9% apart, so a
+    # percentile read from the buckets is off by at most that much.
+    bounds = []
+    bound = low
+    factor = 2.0 ** (1.0 / per_octave)
+    while bound < high:
+        bounds.append(bound)
+        bound *= factor
+    bounds.append(high)
+    return bounds
+
+BUCKET_BOUNDS = _bucket_bounds()
+
+
+class LatencyHistogram(object):
+    # Fixed log-scale buckets: recording is a bisect and an increment, and
+    # the memory used does not grow with the number of samples.
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        if seconds < 0:
+            seconds = 0.0
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        rank = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index >= len(BUCKET_BOUNDS):
+                    return self.max
+                return min(BUCKET_BOUNDS[index], self.max)
+        return self.max
+
+    def summary(self):
+        result = {'count': self.count}
+        if not self.count:
+            return result
+        result['mean_ms'] = round(self.total / self.count * 1000, 3)
+        result['min_ms'] = round(self.min * 1000, 3)
+        result['max_ms'] = round(self.max * 1000, 3)
+        for percent in PERCENTILES:
+            result['p%d_ms' % percent] = round(self.percentile(percent) * 1000,
+                                               3)
+        return result
+
+
+def stage_breakdown(stamps):
+    # {stage: seconds} for every stage whose two stamps are both taken.
+    breakdown = {}
+    for stage, start, end in STAGES:
+        start = stamps[STAMP_INDEX[start]]
+        end = stamps[STAMP_INDEX[end]]
+        if start is not None and end is not None:
+            breakdown[stage] = end - start
+    recv = stamps[0]
+    if recv is not None:
+        breakdown[TOTAL_STAGE] = max(stamp for stamp in stamps
+                                     if stamp is not None) - recv
+    return breakdown
+
+
+class LatencyRecorder(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.histograms = {}
+        self.since = time.time()
+
+    def record(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def record_stamps(self, stamps):
+        for stage, seconds in stage_breakdown(stamps).iteritems():
+            self.record(stage, seconds)
+
+    def stats(self):
+        stages = {}
+        for stage, histogram in self.histograms.iteritems():
+            stages[stage] = histogram.summary()
+        return {
+            'since': time.strftime("%Y/%m/%d %H:%M:%S",
+                                   time.localtime(self.since)),
+            'stages': stages,
+        }
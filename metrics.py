@@ -0,0 +1,151 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import logging
+
+LOG = logging.getLogger('Metrics')
+LOG.setLevel(logging.INFO)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+SUMMARY = "summary"
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class Metric(object):
+    # A counter or gauge.  Values are kept per tuple of label values, so an
+    # update on the hot path is a dict lookup and an add.
+    def __init__(self, name, help, type_, labelnames=()):
+        self.name = name
+        self.help = help
+        self.type = type_
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount=1, labels=()):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount=1, labels=()):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value, labels=()):
+        self._values[labels] = value
+
+    def get(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def values(self):
+        return dict(self._values)
+
+    def samples(self):
+        for labels, value in self._values.iteritems():
+            yield self.name, labels, value
+
+
+class CallbackMetric(Metric):
+    # Read from its owner when the metrics are rendered; callback returns
+    # [(label values, value), ...] or a single value for an unlabelled one.
+    def __init__(self, name, help, type_, callback, labelnames=()):
+        super(CallbackMetric, self).__init__(name, help, type_, labelnames)
+        self.callback = callback
+
+    def samples(self):
+        result = self.callback()
+        if not isinstance(result, (list, tuple)):
+            result = [((), result)]
+        for labels, value in result:
+            if value is None:
+                continue
+            if self.type == SUMMARY and isinstance(value, dict):
+                for key, sample in sorted(value.iteritems()):
+                    if isinstance(key, str):
+                        yield self.name + key, labels, sample
+                    else:
+                        yield self.name, labels + ('%s' % key,), sample
+            else:
+                yield self.name, labels, value
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = []
+        self._names = {}
+
+    def _register(self, metric):
+        existing = self._names.get(metric.name)
+        if existing is not None:
+            if (existing.type != metric.type or
+                    existing.labelnames != metric.labelnames):
+                raise ValueError("metric %s already registered as %s"
+                                 % (metric.name, existing.type))
+            if isinstance(metric, CallbackMetric):
+                # A restarted component takes over its callback.
+                self._metrics[self._metrics.index(existing)] = metric
+                self._names[metric.name] = metric
+                return metric
+            return existing
+        self._metrics.append(metric)
+        self._names[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Metric(name, help, COUNTER, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Metric(name, help, GAUGE, labelnames))
+
+    def callback(self, name, help, type_, callback, labelnames=()):
+        return self._register(CallbackMetric(name, help, type_, callback,
+                                             labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception, e:
+                LOG.error("failed to collect %s: %s" % (metric.name, e))
+                continue
+            lines.append("# HELP %s %s" % (metric.name,
+                                           escape_help(metric.help)))
+            lines.append("# TYPE %s %s" % (metric.name, metric.type))
+            labelnames = metric.labelnames
+            if metric.type == SUMMARY:
+                labelnames += ('quantile',)
+            for name, labels, value in sorted(samples):
+                lines.append("%s%s %s" % (name,
+                                          format_labels(labelnames, labels),
+                                          format_value(value)))
+        lines.append("")
+        return "\n".join(lines)
+
+
+def escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def escape_label(value):
+    return ('%s' % value).replace('\\', '\\\\').replace('\n', '\\n') \
+                         .replace('"', '\\"')
+
+
+def format_labels(labelnames, labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, escape_label(value))
+                             for name, value in zip(labelnames, labels))
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, float):
+        return repr(value)
+    return "%s" % value
+
+
+REGISTRY = Registry()
@@ -0,0 +1,178 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import logging
+import marshal
+import multiprocessing
+import signal
+
+from eventlet import tpool
+from eventlet.hubs import trampoline
+from ryu.lib import hub
+
+LOG = logging.getLogger('ParserPool')
+LOG.setLevel(logging.INFO)
+
+
+def _worker_main(decode, task_conn, result_conn, parent_conns):
+    # Runs in the forked parser process.  Tasks arrive in batches and the
+    # results of a batch are sent back in one message, in task order.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for parent_conn in parent_conns:
+        parent_conn.close()
+    while True:
+        try:
+            tasks = marshal.loads(task_conn.recv_bytes())
+        except (EOFError, IOError):
+            return
+        results = []
+        for task in tasks:
+            try:
+                results.append(decode(task))
+            except Exception, e:
+                LOG.error("failed to decode task: %s" % e)
+                results.append(None)
+        result_conn.send_bytes(marshal.dumps(results))
+
+
+class _Worker(object):
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.task_conn = None
+        self.result_conn = None
+        self.tasks = []
+        self.batches = None
+        self.in_flight = 0
+
+
+class ParserPool(object):
+    # Spreads CPU-bound decoding over forked processes.  Every task carries a
+    # shard key and tasks with the same key always go to the same process,
+    # so their results come back to handle_result in submission order.
+    # decode runs in the child and must take and return marshal-able values.
+    # Tasks are sent in batches of batch_size (or on flush()), and at most
+    # max_batches batches may wait per process before submit() blocks the
+    # caller.
+    def __init__(self, decode, handle_result, processes=2, batch_size=64,
+                 max_batches=64):
+        self.decode = decode
+        self.handle_result = handle_result
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.submitted = 0
+        self.completed = 0
+        self.restarts = 0
+        self._workers = [_Worker(index) for index in range(processes)]
+        for worker in self._workers:
+            self._start(worker)
+
+    def _start(self, worker):
+        # Two one-way os.pipe()s: a duplex Pipe is a socketpair, which a
+        # monkey-patched socket module would hand out non-blocking.
+        task_reader, task_writer = multiprocessing.Pipe(duplex=False)
+        result_reader, result_writer = multiprocessing.Pipe(duplex=False)
+        parent_conns = [task_writer, result_reader]
+        for other in self._workers:
+            if other.task_conn is not None:
+                parent_conns += [other.task_conn, other.result_conn]
+        process = multiprocessing.Process(
+            target=_worker_main,
+            args=(self.decode, task_reader, result_writer, parent_conns),
+            name="bmp-parser-%d" % worker.index)
+        process.daemon = True
+        process.start()
+        task_reader.close()
+        result_writer.close()
+        worker.process = process
+        worker.task_conn = task_writer
+        worker.result_conn = result_reader
+        if worker.batches is None:
+            # Batches queued for a crashed process go to its replacement.
+            worker.batches = hub.Queue(self.max_batches)
+        worker.in_flight = 0
+        worker.writer_thread = hub.spawn(self._writer, worker)
+        worker.reader_thread = hub.spawn(self._reader, worker)
+        LOG.info("started parser process %d (pid %d)"
+                 % (worker.index, process.pid))
+
+    def submit(self, key, task):
+        worker = self._workers[hash(key) % len(self._workers)]
+        worker.tasks.append(task)
+        self.submitted += 1
+        if len(worker.tasks) >= self.batch_size:
+            self._send(worker)
+
+    def flush(self):
+        for worker in self._workers:
+            if worker.tasks:
+                self._send(worker)
+
+    def _send(self, worker):
+        tasks, worker.tasks = worker.tasks, []
+        worker.batches.put(tasks)
+
+    def _writer(self, worker):
+        conn = worker.task_conn
+        while True:
+            tasks = worker.batches.get()
+            worker.in_flight += len(tasks)
+            try:
+                # A full pipe must not stall the hub, so the blocking write
+                # is done from a native thread.
+                tpool.execute(conn.send_bytes, marshal.dumps(tasks))
+            except (IOError, OSError), e:
+                LOG.error("parser process %d is gone: %s" % (worker.index, e))
+                return
+
+    def _reader(self, worker):
+        conn = worker.result_conn
+        while True:
+            try:
+                trampoline(conn.fileno(), read=True)
+                results = marshal.loads(conn.recv_bytes())
+            except (EOFError, IOError, OSError):
+                break
+            worker.in_flight -= len(results)
+            self.completed += len(results)
+            for result in results:
+                if result is None:
+                    continue
+                try:
+                    self.handle_result(result)
+                except Exception, e:
+                    LOG.error("failed to handle result: %s" % e)
+        if self._workers is None:
+            return
+        LOG.error("parser process %d exited (exitcode %s), %d tasks lost"
+                  % (worker.index, worker.process.exitcode, worker.in_flight))
+        hub.kill(worker.writer_thread)
+        worker.task_conn.close()
+        conn.close()
+        worker.process.join(0)
+        worker.task_conn = worker.result_conn = None
+        self.restarts += 1
+        self._start(worker)
+
+    def stats(self):
+        return {
+            'processes': len(self._workers),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'restarts': self.restarts,
+            'queued_batches': sum(worker.batches.qsize()
+                                  for worker in self._workers),
+            'in_flight': sum(worker.in_flight for worker in self._workers),
+        }
+
+    def close(self):
+        workers, self._workers = self._workers, None
+        for worker in workers:
+            hub.kill(worker.writer_thread)
+            hub.kill(worker.reader_thread)
+            worker.task_conn.close()
+            worker.result_conn.close()
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.process.terminate()
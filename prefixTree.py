@@ -0,0 +1,190 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import socket
+
+
+def parse_prefix(prefix):
+    addr, _, plen = prefix.partition('/')
+    if ':' in addr:
+        family, width = socket.AF_INET6, 128
+    else:
+        family, width = socket.AF_INET, 32
+    value = int(socket.inet_pton(family, addr).encode('hex'), 16)
+    if plen:
+        plen = int(plen)
+    else:
+        plen = width
+    if plen < 0 or plen > width:
+        raise ValueError("invalid prefix length: %s" % prefix)
+    return width, mask(value, plen, width), plen
+
+
+def format_prefix(width, value, plen):
+    if width == 32:
+        family = socket.AF_INET
+    else:
+        family = socket.AF_INET6
+    packed = ('%0*x' % (width // 4, value)).decode('hex')
+    return "%s/%d" % (socket.inet_ntop(family, packed), plen)
+
+
+def mask(value, plen, width):
+    return value & (((1 << plen) - 1) << (width - plen))
+
+
+def common_len(a, b, limit, width):
+    diff = a ^ b
+    if diff == 0:
+        return limit
+    return min(limit, width - diff.bit_length())
+
+
+def bit_at(value, pos, width):
+    return (value >> (width - 1 - pos)) & 1
+
+
+class _Node(object):
+    __slots__ = ('key', 'plen', 'value', 'children')
+
+    def __init__(self, key, plen, value=None):
+        self.key = key
+        self.plen = plen
+        self.value = value
+        self.children = [None, None]
+
+
+class PrefixTree(object):
+    # Path-compressed binary radix tree (Patricia trie) over IPv4 and IPv6
+    # prefixes.  Only nodes that carry a value or join two branches exist,
+    # so a tree of N prefixes holds at most 2N nodes.
+    def __init__(self):
+        self._roots = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, prefix):
+        return self.get(prefix) is not None
+
+    def insert(self, prefix, value):
+        width, key, plen = parse_prefix(prefix)
+        parent = None
+        node = self._roots.get(width)
+        while (node is not None and node.plen <= plen and
+               mask(key, node.plen, width) == node.key):
+            if node.plen == plen:
+                if node.value is None:
+                    self._count += 1
+                node.value = value
+                return
+            parent = node
+            node = node.children[bit_at(key, node.plen, width)]
+
+        new = _Node(key, plen, value)
+        self._count += 1
+        if node is not None:
+            clen = common_len(key, node.key, min(plen, node.plen), width)
+            if clen == plen:
+                new.children[bit_at(node.key, plen, width)] = node
+            else:
+                glue = _Node(mask(key, clen, width), clen)
+                glue.children[bit_at(key, clen, width)] = new
+                glue.children[bit_at(node.key, clen, width)] = node
+                new = glue
+        self._attach(width, parent, key, new)
+
+    def get(self, prefix, default=None):
+        width, key, plen = parse_prefix(prefix)
+        node = self._roots.get(width)
+        while (node is not None and node.plen <= plen and
+               mask(key, node.plen, width) == node.key):
+            if node.plen == plen:
+                if node.value is None:
+                    return default
+                return node.value
+            node = node.children[bit_at(key, node.plen, width)]
+        return default
+
+    def longest_match(self, prefix):
+        width, key, plen = parse_prefix(prefix)
+        best = None
+        node = self._roots.get(width)
+        while (node is not None and node.plen <= plen and
+               mask(key, node.plen, width) == node.key):
+            if node.value is not None:
+                best = node
+            if node.plen == plen:
+                break
+            node = node.children[bit_at(key, node.plen, width)]
+        if best is None:
+            return None
+        return format_prefix(width, best.key, best.plen), best.value
+
+    def delete(self, prefix):
+        width, key, plen = parse_prefix(prefix)
+        grandparent = parent = None
+        node = self._roots.get(width)
+        while (node is not None and node.plen <= plen and
+               mask(key, node.plen, width) == node.key):
+            if node.plen == plen:
+                break
+            grandparent, parent = parent, node
+            node = node.children[bit_at(key, node.plen, width)]
+        else:
+            return None
+        if node.value is None:
+            return None
+
+        value = node.value
+        node.value = None
+        self._count -= 1
+        if node.children[0] is None or node.children[1] is None:
+            child = node.children[0] or node.children[1]
+            self._attach(width, parent, key, child)
+            if (child is None and parent is not None and
+                    parent.value is None):
+                # The parent was only joining two branches.
+                other = parent.children[0] or parent.children[1]
+                self._attach(width, grandparent, parent.key, other)
+        return value
+
+    def covered(self, prefix):
+        # Entries equal to or more specific than prefix.
+        width, key, plen = parse_prefix(prefix)
+        node = self._roots.get(width)
+        while node is not None and node.plen < plen:
+            if mask(key, node.plen, width) != node.key:
+                return
+            node = node.children[bit_at(key, node.plen, width)]
+        if node is None or mask(node.key, plen, width) != key:
+            return
+        for item in self._walk(width, node):
+            yield item
+
+    def items(self):
+        for width in sorted(self._roots):
+            for item in self._walk(width, self._roots[width]):
+                yield item
+
+    def _walk(self, width, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.children[1] is not None:
+                stack.append(node.children[1])
+            if node.children[0] is not None:
+                stack.append(node.children[0])
+            if node.value is not None:
+                yield format_prefix(width, node.key, node.plen), node.value
+
+    def _attach(self, width, parent, key, node):
+        if parent is None:
+            if node is None:
+                self._roots.pop(width, None)
+            else:
+                self._roots[width] = node
+        else:
+            parent.children[bit_at(key, parent.plen, width)] = node
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import sys
+from common_func import request_info
+
+STAGES = ('read', 'parse', 'queue', 'match', 'ping_wait', 'ping',
+          'show_wait', 'show_neighbor', 'show_rib', 'total')
+
+##################
+# get_latency
+##################
+
+def start_get_latency(reset):
+    operation = "get_latency"
+    url_path = "/apgw/latency"
+    if reset:
+        method = "DELETE"
+    else:
+        method = "GET"
+
+    latency_result = request_info(operation, url_path, method, "")
+
+    if latency_result:
+        print_latency_result(latency_result)
+
+def print_latency_result(latency_result):
+    stages = latency_result['stages']
+    print "-------------------------------------"
+    print "Latency since [%s] (msec)"%latency_result['since']
+    print "-------------------------------------"
+    print "%-14s %8s %10s %10s %10s %10s" % ("stage", "count", "p50", "p95",
+                                            "p99", "max")
+    for stage in STAGES:
+        if stage not in stages or not stages[stage]['count']:
+            continue
+        result = stages[stage]
+        print "%-14s %8d %10.3f %10.3f %10.3f %10.3f" % (
+            stage, result['count'], result['p50_ms'], result['p95_ms'],
+            result['p99_ms'], result['max_ms'])
+
+
+
+##############
+# main
+##############
+
+def main(argv):
+    start_get_latency(len(argv) > 1 and argv[1] == "reset")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import json
+import sys
+import urllib
+from common_func import request_info
+
+##################
+# get_rib
+##################
+
+def start_get_rib(params):
+    operation = "get_rib"
+    url_path = "/apgw/rib"
+    if params:
+        url_path += "?" + urllib.urlencode(params)
+    method = "GET"
+
+    rib_result = request_info(operation, url_path, method, "")
+
+    if rib_result:
+        print json.dumps(rib_result, sort_keys=False, indent=4)
+
+
+
+##############
+# main
+##############
+
+def main(argv):
+    params = []
+    for arg in argv[1:]:
+        key, _, value = arg.partition('=')
+        params.append((key, value))
+    start_get_rib(params)
+
+if __name__ == "__main__":
+    if (len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help")):
+        print "Usage: get_rib.sh [key=value] ..."
+        print "  keys: router prefix route_dist peer"
+        print "  without prefix, lists the monitored neighbors"
+        sys.exit()
+    else:
+        main(sys.argv)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import json
+import sys
+from httplib import HTTPConnection
+from common_func import HOST, PORT
+
+##################
+# bulk_target
+##################
+
+def start_bulk_target(target_file):
+    url_path = "/apgw/targets"
+    with open(target_file) as f:
+        request = f.read()
+
+    session = HTTPConnection("%s:%s" % (HOST, PORT))
+    header = {
+        "Content-Type": "application/json"
+        }
+    session.request("POST", url_path, request, header)
+    target_result = json.load(session.getresponse())
+    print "----------"
+    print "targets [%s] items [%s] errors [%s]" % (target_result['targets'],
+                                                   target_result['items'],
+                                                   target_result['errors'])
+    for result in target_result['results']:
+        if result['status'] == 'error':
+            print json.dumps(result, sort_keys=False)
+    print ""
+
+
+
+##############
+# main
+##############
+
+def main(argv):
+    target_file = argv[1]
+    start_bulk_target(target_file)
+
+if __name__ == "__main__":
+    if (len(sys.argv) != 2):
+        print "Usage: post_targets.sh [target_file(JSON array or NDJSON)]"
+        print '  item: {"op": "add|update|delete", "target": {"peer_as": ...,'
+        print '         "vpnv4_prefix": ..., "ping_srcip": ..., ...}}'
+        sys.exit()
+    else:
+        main(sys.argv)
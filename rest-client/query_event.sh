@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import json
+import sys
+import urllib
+from common_func import request_info
+
+##################
+# query_event
+##################
+
+def start_query_event(params):
+    operation = "query_event"
+    url_path = "/apgw/events?" + urllib.urlencode(params)
+    method = "GET"
+
+    event_result = request_info(operation, url_path, method, "")
+
+    if event_result:
+        print json.dumps(event_result, sort_keys=False, indent=4)
+
+
+
+##############
+# main
+##############
+
+def main(argv):
+    params = []
+    for arg in argv[1:]:
+        key, _, value = arg.partition('=')
+        params.append((key, value))
+    start_query_event(params)
+
+if __name__ == "__main__":
+    if (len(sys.argv) < 2):
+        print "Usage: query_event.sh [key=value] ..."
+        print "  keys: peer_as vpnv4_prefix event_type ping_result since until"
+        print "        cursor limit fields"
+        sys.exit()
+    else:
+        main(sys.argv)
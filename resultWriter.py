@@ -0,0 +1,148 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import gzip
+import logging
+import os
+import shutil
+import time
+
+from eventlet import tpool
+from ryu.lib import hub
+
+LOG = logging.getLogger('ResultWriter')
+LOG.setLevel(logging.INFO)
+
+SYNC_NONE = "none"
+SYNC_FLUSH = "flush"
+SYNC_FSYNC = "fsync"
+
+
+class ResultWriter(object):
+    # Group-commit writer for Test_result.txt.  write() only buffers the
+    # line; the buffer is written out once batch_lines lines are pending or
+    # flush_interval seconds have passed.  sync selects how far each group
+    # is pushed: "none" leaves it in the file object, "flush" hands it to
+    # the OS and "fsync" waits for the disk.  The file is only touched from
+    # a tpool thread, so a slow disk never blocks the hub.
+    def __init__(self, path, batch_lines=256, flush_interval=1.0,
+                 sync=SYNC_FLUSH, rotate_bytes=0, rotate_interval=0,
+                 compress=False):
+        if sync not in (SYNC_NONE, SYNC_FLUSH, SYNC_FSYNC):
+            raise ValueError("unknown sync mode: %s" % sync)
+        self.path = path
+        self.batch_lines = batch_lines
+        self.flush_interval = flush_interval
+        self.sync = sync
+        self.rotate_bytes = rotate_bytes
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self._lines = []
+        self._wakeup = hub.Event()
+        self._open()
+        self.lines = 0
+        self.commits = 0
+        self.rotations = 0
+        self._closing = False
+        self.writer_thread = hub.spawn(self._writer)
+
+    def _open(self):
+        self._file = open(self.path, 'a')
+        self._size = os.path.getsize(self.path)
+        self._opened = time.time()
+
+    def write(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= self.batch_lines:
+            self._wakeup.set()
+
+    def _writer(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._closing:
+                return
+            try:
+                self.commit()
+            except Exception, e:
+                LOG.error("failed to write %s: %s" % (self.path, e))
+
+    def commit(self):
+        if self._lines:
+            lines, self._lines = self._lines, []
+            data = "".join(lines)
+            tpool.execute(self._write, data)
+            self._size += len(data)
+            self.lines += len(lines)
+            self.commits += 1
+        if self._should_rotate():
+            self.rotate()
+
+    def _write(self, data):
+        self._file.write(data)
+        if self.sync != SYNC_NONE:
+            self._file.flush()
+        if self.sync == SYNC_FSYNC:
+            os.fsync(self._file.fileno())
+
+    def _should_rotate(self):
+        if self._size == 0:
+            return False
+        if self.rotate_bytes and self._size >= self.rotate_bytes:
+            return True
+        if (self.rotate_interval and
+                time.time() - self._opened >= self.rotate_interval):
+            return True
+        return False
+
+    def rotate(self):
+        self._file.close()
+        segment = "%s.%s" % (self.path, time.strftime("%Y%m%d-%H%M%S"))
+        suffix = 0
+        while os.path.exists(segment) or os.path.exists(segment + ".gz"):
+            suffix += 1
+            segment = "%s.%s.%d" % (self.path, time.strftime("%Y%m%d-%H%M%S"),
+                                    suffix)
+        os.rename(self.path, segment)
+        self._open()
+        self.rotations += 1
+        LOG.info("rotated %s to %s" % (self.path, segment))
+        if self.compress:
+            hub.spawn(self._compress, segment)
+
+    def _compress(self, segment):
+        try:
+            tpool.execute(gzip_file, segment)
+        except Exception, e:
+            LOG.error("failed to compress %s: %s" % (segment, e))
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'pending': len(self._lines),
+            'lines': self.lines,
+            'commits': self.commits,
+            'rotations': self.rotations,
+            'size': self._size,
+        }
+
+    def close(self):
+        # Lets a commit in progress finish instead of killing the writer
+        # while its tpool thread still writes to the file.
+        self._closing = True
+        self._wakeup.set()
+        hub.joinall([self.writer_thread])
+        self.commit()
+        tpool.execute(self._file.flush)
+        self._file.close()
+
+
+def gzip_file(path):
+    with open(path, 'rb') as src:
+        dst = gzip.open(path + ".gz", 'wb')
+        try:
+            shutil.copyfileobj(src, dst)
+        finally:
+            dst.close()
+    os.remove(path)
@@ -0,0 +1,85 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import time
+
+from ryu.lib import hub
+
+
+class _Fetch(object):
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = hub.Event()
+        self.result = None
+        self.error = None
+
+
+class RibSnapshotCache(object):
+    # RIB snapshots keyed by (host, show_type).  While a fetch is in flight
+    # every other request for the same key waits for it instead of starting
+    # its own, and a snapshot younger than ttl seconds is served as is.
+    def __init__(self, fetch, ttl=2.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self._snapshots = {}
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, host, show_type, fetch=None):
+        # fetch stands in for the cache's own when the snapshot has to be
+        # fetched, e.g. to fetch it along with something else.
+        key = (host, show_type)
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and time.time() - snapshot[1] <= self.ttl:
+            self.hits += 1
+            return snapshot[0]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            inflight.event.wait()
+            if isinstance(inflight.error, Exception):
+                raise inflight.error
+            if inflight.error is not None:
+                # The fetch was interrupted, e.g. by the test timeout of the
+                # event that started it, so try again.
+                return self.get(host, show_type, fetch)
+            return inflight.result
+
+        self.misses += 1
+        inflight = self._inflight[key] = _Fetch()
+        try:
+            inflight.result = (fetch or self.fetch)(host, show_type)
+            self._snapshots[key] = (inflight.result, time.time())
+        except BaseException, e:
+            inflight.error = e
+            raise
+        finally:
+            del self._inflight[key]
+            inflight.event.set()
+        return inflight.result
+
+    def has(self, host, show_type):
+        # Whether get() would be answered without a fetch of its own.
+        key = (host, show_type)
+        if key in self._inflight:
+            return True
+        snapshot = self._snapshots.get(key)
+        return snapshot is not None and time.time() - snapshot[1] <= self.ttl
+
+    def invalidate(self, host=None):
+        for key in self._snapshots.keys():
+            if host is None or key[0] == host:
+                del self._snapshots[key]
+
+    def stats(self):
+        return {
+            'snapshots': len(self._snapshots),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
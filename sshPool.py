@@ -0,0 +1,121 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import logging
+import socket
+import time
+import paramiko
+
+from ryu.lib import hub
+
+LOG = logging.getLogger('SSHTransportPool')
+LOG.setLevel(logging.INFO)
+
+
+class _PoolEntry(object):
+    __slots__ = ('transport', 'last_used')
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.last_used = time.time()
+
+
+class SSHTransportPool(object):
+    # Keeps one authenticated paramiko Transport per (ssh_host, ssh_user) and
+    # opens a new session channel on it for every command.
+    def __init__(self, port=22, idle_timeout=300, keepalive=30,
+                 connect_timeout=10):
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self._entries = {}
+        self._locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+        self.reaper_thread = hub.spawn(self._reaper)
+
+    def open_session(self, ssh_host, ssh_user, ssh_pass):
+        transport = self._transport(ssh_host, ssh_user, ssh_pass)
+        try:
+            return transport.open_session()
+        except (paramiko.SSHException, EOFError, socket.error), e:
+            # The peer dropped the connection since it was last used.
+            LOG.info("reconnecting %s@%s: %s" % (ssh_user, ssh_host, e))
+            self.reconnects += 1
+            self._discard((ssh_host, ssh_user), transport)
+            transport = self._transport(ssh_host, ssh_user, ssh_pass)
+            return transport.open_session()
+
+    def _transport(self, ssh_host, ssh_user, ssh_pass):
+        key = (ssh_host, ssh_user)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = hub.Semaphore()
+        # Only one login per key is in flight, later callers reuse it.
+        with lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.transport.is_active():
+                    self.hits += 1
+                    entry.last_used = time.time()
+                    return entry.transport
+                self._discard(key, entry.transport)
+            self.misses += 1
+            transport = self._connect(ssh_host, ssh_user, ssh_pass)
+            self._entries[key] = _PoolEntry(transport)
+            return transport
+
+    def _connect(self, ssh_host, ssh_user, ssh_pass):
+        sock = socket.create_connection((ssh_host, self.port),
+                                        self.connect_timeout)
+        transport = paramiko.Transport(sock)
+        try:
+            transport.connect(username=ssh_user, password=ssh_pass,
+                              hostkey=None)
+        except paramiko.AuthenticationException:
+            transport.close()
+            raise paramiko.AuthenticationException(
+                "Bad username or password.")
+        except:
+            transport.close()
+            raise
+        transport.set_keepalive(self.keepalive)
+        return transport
+
+    def _discard(self, key, transport):
+        entry = self._entries.get(key)
+        if entry is not None and entry.transport is transport:
+            del self._entries[key]
+        transport.close()
+
+    def evict_idle(self):
+        now = time.time()
+        for key, entry in self._entries.items():
+            if (now - entry.last_used > self.idle_timeout or
+                    not entry.transport.is_active()):
+                LOG.info("closing idle transport %s@%s" % (key[1], key[0]))
+                self.evictions += 1
+                self._discard(key, entry.transport)
+
+    def _reaper(self):
+        while True:
+            hub.sleep(min(self.idle_timeout, self.keepalive) or 1)
+            self.evict_idle()
+
+    def stats(self):
+        return {
+            'connections': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'reconnects': self.reconnects,
+            'evictions': self.evictions,
+        }
+
+    def close(self):
+        hub.kill(self.reaper_thread)
+        for key, entry in self._entries.items():
+            self._discard(key, entry.transport)
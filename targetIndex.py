@@ -0,0 +1,110 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+from prefixTree import PrefixTree
+
+MATCH_EXACT = "exact"
+MATCH_LONGEST = "longest"
+
+
+def split_vpnv4_prefix(vpnv4_prefix):
+    # "65010:101:192.168.2.101/32" -> ("65010:101", "192.168.2.101/32")
+    # "192.168.2.101/32"           -> (None, "192.168.2.101/32")
+    route_dist, sep, prefix = vpnv4_prefix.rpartition(':')
+    if sep and '.' in prefix:
+        return route_dist, prefix
+    return None, vpnv4_prefix
+
+
+class TargetIndex(object):
+    def __init__(self, match_mode=MATCH_EXACT):
+        if match_mode not in (MATCH_EXACT, MATCH_LONGEST):
+            raise ValueError("unknown match mode: %s" % match_mode)
+        self.match_mode = match_mode
+        self._exact = {}
+        self._trees = {}
+        self._shared = set()
+        # peer_as -> number of targets registered for it.
+        self._peer_ases = {}
+
+    def __len__(self):
+        return len(self._exact)
+
+    def __contains__(self, key):
+        vpnv4_prefix, peer_as = key
+        route_dist, prefix = split_vpnv4_prefix(vpnv4_prefix)
+        return (route_dist, prefix, str(peer_as)) in self._exact
+
+    def copy(self):
+        # The copy shares the prefix trees with this index until either side
+        # writes to one, so copying a large index stays cheap.
+        index = TargetIndex(self.match_mode)
+        index._exact = dict(self._exact)
+        index._trees = dict(self._trees)
+        index._shared = set(self._trees)
+        index._peer_ases = dict(self._peer_ases)
+        self._shared = set(self._trees)
+        return index
+
+    def _tree(self, key):
+        tree = self._trees.get(key)
+        if tree is None:
+            tree = self._trees[key] = PrefixTree()
+        elif key in self._shared:
+            shared = tree
+            tree = self._trees[key] = PrefixTree()
+            for prefix, target in shared.items():
+                tree.insert(prefix, target)
+            self._shared.discard(key)
+        return tree
+
+    def add(self, vpnv4_prefix, target):
+        peer_as = str(target.get_all()['peer_as'])
+        route_dist, prefix = split_vpnv4_prefix(vpnv4_prefix)
+        if self.match_mode == MATCH_LONGEST:
+            self._tree((route_dist, peer_as)).insert(prefix, target)
+        key = (route_dist, prefix, peer_as)
+        if key not in self._exact:
+            self._peer_ases[peer_as] = self._peer_ases.get(peer_as, 0) + 1
+        self._exact[key] = target
+
+    def remove(self, vpnv4_prefix, peer_as):
+        peer_as = str(peer_as)
+        route_dist, prefix = split_vpnv4_prefix(vpnv4_prefix)
+        target = self._exact.pop((route_dist, prefix, peer_as), None)
+        if target is not None:
+            count = self._peer_ases[peer_as] - 1
+            if count:
+                self._peer_ases[peer_as] = count
+            else:
+                del self._peer_ases[peer_as]
+        if target is not None and self.match_mode == MATCH_LONGEST:
+            tree = self._tree((route_dist, peer_as))
+            tree.delete(prefix)
+            if not tree:
+                del self._trees[(route_dist, peer_as)]
+                self._shared.discard((route_dist, peer_as))
+        return target
+
+    def lookup(self, route_dist, prefix, peer_as):
+        if prefix is None:
+            return None
+        peer_as = str(peer_as)
+        target = self._exact.get((route_dist, prefix, peer_as))
+        if target is not None or self.match_mode == MATCH_EXACT:
+            return target
+        tree = self._trees.get((route_dist, peer_as))
+        if tree is None:
+            return None
+        match = tree.longest_match(prefix)
+        if match is not None:
+            return match[1]
+        # An event for an aggregate also concerns the registrations under
+        # it; the first of them is tested.
+        for _, target in tree.covered(prefix):
+            return target
+        return None
+
+    def peer_ases(self):
+        return self._peer_ases.keys()
@@ -4,15 +4,29 @@
 
 import json
 import logging
+import os
 import datetime
+import socket
+import sys
 import time
 import getpass
-import paramiko
-import telnetlib
 
+from adjRibIn import format_routes
+from cliCollector import CliCollector, NOT_READ
 from bgpMonitor import BgpMonitor
+from eventHistory import EventHistory, QUERY_FILTERS
+from eventStore import EventStore
+from httpPool import HTTPConnectionPool
+from latency import LatencyRecorder, STAMPS, STAMP_INDEX, monotonic
+from latency import stage_breakdown, PERCENTILES
+from metrics import REGISTRY, COUNTER, GAUGE, SUMMARY
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from resultWriter import ResultWriter
+from ribCache import RibSnapshotCache
+from testExecutor import TestExecutor
+from sshPool import SSHTransportPool
+from targetIndex import TargetIndex
 from webob import Response
-from httplib import HTTPConnection
 from ryu.base import app_manager
 from ryu.app.wsgi import ControllerBase, WSGIApplication, route
 from ryu.lib import hub
@@ -23,6 +37,126 @@ LOG.setLevel(logging.INFO)
 PING_OK = "5 received, 0% packet loss"
 PING_NG = "0 received, 100% packet loss"
 
+# "exact" matches (route_dist, prefix, peer_as) only, "longest" also lets a
+# registered aggregate watch every more-specific prefix under it.
+TARGET_MATCH_MODE = os.environ.get('APGW_TARGET_MATCH_MODE', 'exact')
+
+PING_MAX_WORKERS = int(os.environ.get('APGW_PING_MAX_WORKERS', 32))
+PING_MAX_PER_HOST = int(os.environ.get('APGW_PING_MAX_PER_HOST', 4))
+PING_TIMEOUT = int(os.environ.get('APGW_PING_TIMEOUT', 30))
+
+SSH_PORT = int(os.environ.get('APGW_SSH_PORT', 22))
+SSH_IDLE_TIMEOUT = int(os.environ.get('APGW_SSH_IDLE_TIMEOUT', 300))
+SSH_KEEPALIVE = int(os.environ.get('APGW_SSH_KEEPALIVE', 30))
+
+REST_PORT = int(os.environ.get('APGW_REST_PORT', 8080))
+REST_POOL_SIZE = int(os.environ.get('APGW_REST_POOL_SIZE', 4))
+REST_TIMEOUT = int(os.environ.get('APGW_REST_TIMEOUT', 10))
+REST_DEBUG = int(os.environ.get('APGW_REST_DEBUG', 0))
+
+TELNET_PORT = int(os.environ.get('APGW_TELNET_PORT', 23))
+CLI_CONNECT_TIMEOUT = int(os.environ.get('APGW_CLI_CONNECT_TIMEOUT', 10))
+CLI_READ_TIMEOUT = int(os.environ.get('APGW_CLI_READ_TIMEOUT', 30))
+CLI_MAX_BYTES = int(os.environ.get('APGW_CLI_MAX_BYTES', 8 * 1024 * 1024))
+CLI_PROMPT = os.environ.get('APGW_CLI_PROMPT', r'[\w.\-@:()/]+[>#] ?$')
+CLI_USER = os.environ.get('APGW_CLI_USER', '')
+CLI_PASS = os.environ.get('APGW_CLI_PASS', '')
+CLI_PAGING_COMMAND = os.environ.get('APGW_CLI_PAGING_COMMAND',
+                                    'terminal length 0')
+CLI_POOL_SIZE = int(os.environ.get('APGW_CLI_POOL_SIZE', 4))
+CLI_IDLE_TIMEOUT = int(os.environ.get('APGW_CLI_IDLE_TIMEOUT', 120))
+CLI_RIB_COMMAND = "show bgp vpnv4 unicast all"
+CLI_NEIGHBOR_COMMAND = ("show bgp vpnv4 unicast all neighbors %s "
+                        "received-routes")
+
+SHOW_MAX_WORKERS = int(os.environ.get('APGW_SHOW_MAX_WORKERS', 32))
+SHOW_MAX_PER_HOST = int(os.environ.get('APGW_SHOW_MAX_PER_HOST', 4))
+SHOW_TIMEOUT = int(os.environ.get('APGW_SHOW_TIMEOUT', 60))
+RIB_CACHE_TTL = float(os.environ.get('APGW_RIB_CACHE_TTL', 2.0))
+
+EVENT_CAPACITY = int(os.environ.get('APGW_EVENT_CAPACITY', 100000))
+EVENT_MAX_AGE = int(os.environ.get('APGW_EVENT_MAX_AGE', 0))
+EVENT_DB = os.environ.get('APGW_EVENT_DB', 'event_history.db')
+
+# Events for the same (peer_as, route_dist, prefix) arriving within
+# FLAP_WINDOW seconds of each other are merged into one event, tested once
+# the prefix has been quiet for FLAP_WINDOW seconds or FLAP_MAX_HOLD seconds
+# after its first event (0 disables merging).
+FLAP_WINDOW = float(os.environ.get('APGW_FLAP_WINDOW', 0))
+FLAP_MAX_HOLD = float(os.environ.get('APGW_FLAP_MAX_HOLD', 60))
+
+RESULT_FILE = os.environ.get('APGW_RESULT_FILE', 'Test_result.txt')
+RESULT_BATCH_LINES = int(os.environ.get('APGW_RESULT_BATCH_LINES', 256))
+RESULT_FLUSH_INTERVAL = float(os.environ.get('APGW_RESULT_FLUSH_INTERVAL',
+                                             1.0))
+RESULT_SYNC = os.environ.get('APGW_RESULT_SYNC', 'flush')
+RESULT_ROTATE_BYTES = int(os.environ.get('APGW_RESULT_ROTATE_BYTES', 0))
+RESULT_ROTATE_INTERVAL = int(os.environ.get('APGW_RESULT_ROTATE_INTERVAL', 0))
+RESULT_COMPRESS = os.environ.get('APGW_RESULT_COMPRESS', '0') == '1'
+
+
+def drain_queue(q):
+    # Block until work arrives, then take everything already queued so a
+    # burst is handled in one pass before the consumer yields.
+    items = [q.get()]
+    while True:
+        try:
+            items.append(q.get_nowait())
+        except hub.QueueEmpty:
+            return items
+
+
+def iter_json_documents(body):
+    # Yields the items of a JSON array, or every document of a
+    # newline-delimited JSON body, decoding one item at a time.
+    decoder = json.JSONDecoder()
+    end = len(body)
+    pos = skip_whitespace(body, 0)
+    if pos < end and body[pos] == '[':
+        pos = skip_whitespace(body, pos + 1)
+        if pos < end and body[pos] == ']':
+            pos += 1
+        else:
+            while True:
+                item, pos = decoder.raw_decode(body, pos)
+                yield item
+                pos = skip_whitespace(body, pos)
+                if pos >= end:
+                    raise ValueError("unterminated JSON array")
+                if body[pos] == ']':
+                    pos += 1
+                    break
+                if body[pos] != ',':
+                    raise ValueError("expected ',' or ']' at %d" % pos)
+                pos = skip_whitespace(body, pos + 1)
+        pos = skip_whitespace(body, pos)
+        if pos < end:
+            raise ValueError("unexpected data after the JSON array at %d"
+                             % pos)
+        return
+    while pos < end:
+        item, pos = decoder.raw_decode(body, pos)
+        yield item
+        pos = skip_whitespace(body, pos)
+
+
+def skip_whitespace(body, pos):
+    end = len(body)
+    while pos < end and body[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+
+def parse_event_time(value):
+    # Accepts the event_time format ("2015/01/01 12:00:00") or epoch seconds.
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(time.strptime(value, "%Y/%m/%d %H:%M:%S"))
+
+
 class TargetTable(object):
     def __init__(self, peer_as, ping_srcip, ping_destip, ssh_host, ssh_user,
                  ssh_pass, show_type):
@@ -39,41 +173,88 @@ class TargetTable(object):
         return self.targetInfo
 
 class EventResult(object):
-    def __init__(self, received_time, peer_bgp_id, event_type, peer_as,
-                 vpnv4_prefix, nexthop, event_time, event_id):
-        self.EventResult = {}
-        self.EventResult['received_time'] = received_time
-        self.EventResult['peer_bgp_id'] = peer_bgp_id
-        self.EventResult['event_type'] = event_type
-        self.EventResult['peer_as'] = peer_as
-        self.EventResult['vpnv4_prefix'] = vpnv4_prefix
-        self.EventResult['nexthop'] = nexthop
-        self.EventResult['event_time'] = event_time
-        self.EventResult['event_id'] = str(event_id)
+    __slots__ = ('bmp_event', 'event_time', 'event_id', 'ping_recv',
+                 'ping_result', 'show_neighbor_result', 'show_rib_result',
+                 'stamps', 'flap_count', 'last_event_time')
+
+    def __init__(self, bmp_event, event_time, event_id, stamps=None):
+        self.bmp_event = bmp_event
+        self.event_time = event_time
+        self.event_id = event_id
+        self.stamps = [None] * len(STAMPS)
+        if stamps:
+            self.stamps[:len(stamps)] = stamps
+        self.flap_count = 1
+        self.last_event_time = event_time
+        self.ping_recv = None
+        self.ping_result = None
+        self.show_neighbor_result = None
+        self.show_rib_result = None
 
     def add_ping_recv(self, ping_recv):
-        self.EventResult['ping_recv'] = ping_recv
+        self.ping_recv = ping_recv
 
     def add_ping_result(self, ping_result):
-        self.EventResult['ping_result'] = ping_result
+        self.ping_result = ping_result
 
     def add_show_neighbor_result(self, show_neighbor_result):
-        self.EventResult['show_neighbor_result'] = show_neighbor_result
+        self.show_neighbor_result = show_neighbor_result
 
     def add_show_rib_result(self, show_rib_result):
-        self.EventResult['show_rib_result'] = show_rib_result
+        self.show_rib_result = show_rib_result
 
-    @property
-    def event_time(self):
-        return self.EventResult['event_time']
+    def merge(self, bmp_event, event_time):
+        # A later event for the same prefix; the test runs against it.
+        self.bmp_event = bmp_event
+        self.flap_count += 1
+        self.last_event_time = event_time
+
+    def stamp(self, name):
+        self.stamps[STAMP_INDEX[name]] = monotonic()
 
     @property
     def event_type(self):
-        return self.EventResult['event_type']
+        return self.bmp_event.event_type
 
+    @property
+    def is_complete(self):
+        return (self.ping_result is not None and
+                self.show_neighbor_result is not None and
+                self.show_rib_result is not None)
+
+    @property
+    def latency(self):
+        return dict((stage, round(seconds * 1000, 3)) for stage, seconds
+                    in stage_breakdown(self.stamps).iteritems())
+
+    @property
+    def nbytes(self):
+        # show_rib_result is usually a snapshot shared with other events.
+        return (sys.getsizeof(self) + sys.getsizeof(self.bmp_event) +
+                sum(sys.getsizeof(v) for v in self.bmp_event) +
+                sum(sys.getsizeof(getattr(self, name))
+                    for name in self.__slots__[1:]))
 
     def get_all(self):
-        return self.EventResult
+        bmp_event = self.bmp_event
+        EventResult = {}
+        EventResult['received_time'] = bmp_event.received_time
+        EventResult['peer_bgp_id'] = bmp_event.peer_bgp_id
+        EventResult['event_type'] = bmp_event.event_type
+        EventResult['peer_as'] = bmp_event.peer_as
+        EventResult['vpnv4_prefix'] = bmp_event.vpnv4_prefix
+        EventResult['nexthop'] = bmp_event.nexthop
+        EventResult['event_time'] = self.event_time
+        EventResult['event_id'] = str(self.event_id)
+        EventResult['flap_count'] = self.flap_count
+        EventResult['first_event_time'] = self.event_time
+        EventResult['last_event_time'] = self.last_event_time
+        for name in ('ping_recv', 'ping_result', 'show_neighbor_result',
+                     'show_rib_result'):
+            if getattr(self, name) is not None:
+                EventResult[name] = getattr(self, name)
+        EventResult['latency'] = self.latency
+        return EventResult
 
 class TestAutomation(app_manager.RyuApp):
     _CONTEXTS = {
@@ -86,141 +267,448 @@ class TestAutomation(app_manager.RyuApp):
         self.bmp = kwargs['bmp']
         wsgi = kwargs['wsgi']
         wsgi.register(TestController, {'TestAutomation' : self})
+        self.targetIndex = TargetIndex(TARGET_MATCH_MODE)
+        self.bmp.set_peer_filter(self.targetIndex.peer_ases())
+        self.eventList = EventStore(capacity=EVENT_CAPACITY,
+                                    max_age=EVENT_MAX_AGE)
+        self.history = EventHistory(EVENT_DB)
+        self.event_id = self.history.max_event_id()
+        self.ping_target_q = hub.Queue()
+        self.show_target_q = hub.Queue()
+        self.test_result = ResultWriter(RESULT_FILE,
+                                        batch_lines=RESULT_BATCH_LINES,
+                                        flush_interval=RESULT_FLUSH_INTERVAL,
+                                        sync=RESULT_SYNC,
+                                        rotate_bytes=RESULT_ROTATE_BYTES,
+                                        rotate_interval=RESULT_ROTATE_INTERVAL,
+                                        compress=RESULT_COMPRESS)
+        self.ping_executor = TestExecutor(self.ping_failed,
+                                          max_workers=PING_MAX_WORKERS,
+                                          max_per_host=PING_MAX_PER_HOST,
+                                          timeout=PING_TIMEOUT)
+        self.ssh_pool = SSHTransportPool(port=SSH_PORT,
+                                         idle_timeout=SSH_IDLE_TIMEOUT,
+                                         keepalive=SSH_KEEPALIVE)
+        self.http_pool = HTTPConnectionPool(port=REST_PORT,
+                                            maxsize=REST_POOL_SIZE,
+                                            timeout=REST_TIMEOUT,
+                                            debuglevel=REST_DEBUG)
+        self.cli = CliCollector(port=TELNET_PORT,
+                                connect_timeout=CLI_CONNECT_TIMEOUT,
+                                read_timeout=CLI_READ_TIMEOUT,
+                                max_bytes=CLI_MAX_BYTES, prompt=CLI_PROMPT,
+                                username=CLI_USER, password=CLI_PASS,
+                                paging_command=CLI_PAGING_COMMAND,
+                                maxsize=CLI_POOL_SIZE,
+                                idle_timeout=CLI_IDLE_TIMEOUT)
+        self.show_executor = TestExecutor(self.show_failed,
+                                          max_workers=SHOW_MAX_WORKERS,
+                                          max_per_host=SHOW_MAX_PER_HOST,
+                                          timeout=SHOW_TIMEOUT)
+        self.rib_cache = RibSnapshotCache(self.get_rib, ttl=RIB_CACHE_TTL)
+        self.flapping = {}
+        self.latency = LatencyRecorder()
+        self.register_metrics()
         self.bmp_thread = hub.spawn(self.lookup_bmp_result)
         self.ping_thread = hub.spawn(self.loop_ping)
         self.show_thread = hub.spawn(self.loop_show)
-        self.targetInfoList = {}
-        self.eventList = {}
-        self.ping_target_q = hub.Queue()
-        self.show_target_q = hub.Queue()
-        self.test_result = open("Test_result.txt", 'w')
+        if FLAP_WINDOW > 0:
+            self.flap_thread = hub.spawn(self.loop_flap)
+
+    def register_metrics(self):
+        self.matched_total = REGISTRY.counter(
+            'apgw_events_matched_total', 'BMP events matching a target.')
+        self.flap_merged_total = REGISTRY.counter(
+            'apgw_events_flap_merged_total',
+            'Matching events merged into a pending event for the prefix.')
+        REGISTRY.callback(
+            'apgw_flapping_prefixes',
+            'Prefixes holding a merged event until they settle.',
+            GAUGE, lambda: len(self.flapping))
+        self.completed_total = REGISTRY.counter(
+            'apgw_events_completed_total',
+            'Events with ping, neighbor and rib results attached.')
+        self.busy_seconds = REGISTRY.counter(
+            'apgw_worker_busy_seconds_total',
+            'Time spent working by each pipeline greenthread.', ('worker',))
+        REGISTRY.callback(
+            'apgw_queue_depth',
+            'Items waiting in each pipeline queue (events for bmp_q).',
+            GAUGE, self.queue_depths, ('queue',))
+        for metric_name, name, type_, help in (
+                ('apgw_executor_pending', 'pending', GAUGE,
+                 'Tests waiting for a worker slot.'),
+                ('apgw_executor_running', 'running', GAUGE, 'Tests running.'),
+                ('apgw_executor_max_workers', 'max_workers', GAUGE,
+                 'Worker slots.'),
+                ('apgw_executor_completed_total', 'completed', COUNTER,
+                 'Tests completed.'),
+                ('apgw_executor_failed_total', 'failed', COUNTER,
+                 'Tests failed with an error.'),
+                ('apgw_executor_timeouts_total', 'timeouts', COUNTER,
+                 'Tests timed out.'),
+                ('apgw_executor_busy_seconds_total', 'busy_time', COUNTER,
+                 'Time spent running tests.')):
+            REGISTRY.callback(metric_name, help, type_,
+                              self.executor_stats(name), ('executor',))
+        for name, help in (('hits', 'Requests served from a pool.'),
+                           ('misses', 'Requests that had to connect.')):
+            REGISTRY.callback('apgw_pool_%s_total' % name, help, COUNTER,
+                              self.pool_stats(name), ('pool',))
+        REGISTRY.callback(
+            'apgw_event_store_events', 'Events held in memory.', GAUGE,
+            lambda: len(self.eventList))
+        REGISTRY.callback(
+            'apgw_event_store_evicted_total', 'Events evicted from memory.',
+            COUNTER, lambda: self.eventList.evicted)
+        REGISTRY.callback(
+            'apgw_history_pending', 'Events waiting to be written to history.',
+            GAUGE, lambda: self.history.stats()['pending'])
+        REGISTRY.callback(
+            'apgw_result_pending', 'Lines waiting to be written to %s.'
+            % RESULT_FILE, GAUGE, lambda: self.test_result.stats()['pending'])
+        REGISTRY.callback(
+            'apgw_event_stage_seconds', 'Per-stage latency of completed events.',
+            SUMMARY, self.stage_latencies, ('stage',))
+
+    def queue_depths(self):
+        return [(('bmp_q',), self.bmp.bmp_q.qsize()),
+                (('ping_target_q',), self.ping_target_q.qsize()),
+                (('show_target_q',), self.show_target_q.qsize())]
+
+    def executor_stats(self, name):
+        def collect():
+            return [(('ping',), self.ping_executor.stats()[name]),
+                    (('show',), self.show_executor.stats()[name])]
+        return collect
+
+    def pool_stats(self, name):
+        def collect():
+            return [(('ssh',), self.ssh_pool.stats()[name]),
+                    (('http',), self.http_pool.stats()[name]),
+                    (('cli',), self.cli.stats()[name]),
+                    (('rib_cache',), self.rib_cache.stats()[name])]
+        return collect
+
+    def stage_latencies(self):
+        result = []
+        for stage, histogram in self.latency.histograms.iteritems():
+            summary = {'_count': histogram.count, '_sum': histogram.total}
+            if histogram.count:
+                for percent in PERCENTILES:
+                    summary[percent / 100.0] = histogram.percentile(percent)
+            result.append(((stage,), summary))
+        return result
 
     def regist_pingTarget(self, peer_as, vpnv4_prefix, ping_srcip, ping_destip,
                           ssh_host, ssh_user, ssh_pass, show_type):
-        self.targetInfoList[vpnv4_prefix] = TargetTable(peer_as, ping_srcip,
-                                                        ping_destip, ssh_host,
-                                                        ssh_user, ssh_pass, show_type)
+        self.targetIndex.add(vpnv4_prefix,
+                             TargetTable(peer_as, ping_srcip, ping_destip,
+                                         ssh_host, ssh_user, ssh_pass,
+                                         show_type))
+        self.bmp.set_peer_filter(self.targetIndex.peer_ases())
+
+    def close(self):
+        self.history.close()
+        self.test_result.close()
+
+    def bulk_pingTarget(self, items):
+        # All changes are applied to a copy of the index which then replaces
+        # the live one, so lookups never see a half-applied batch.
+        targetIndex = self.targetIndex.copy()
+        results = []
+        for item in items:
+            try:
+                results.append(self.apply_pingTarget(targetIndex, item))
+            except (KeyError, TypeError, ValueError, AttributeError,
+                    socket.error), e:
+                results.append({'status': 'error', 'error': '%s' % e})
+        self.targetIndex = targetIndex
+        self.bmp.set_peer_filter(targetIndex.peer_ases())
+        LOG.info("bulk target update: %d items, %d targets"
+                 % (len(results), len(targetIndex)))
+        return results
+
+    def apply_pingTarget(self, targetIndex, item):
+        op = item.get('op', 'add')
+        target = item['target']
+        vpnv4_prefix = target['vpnv4_prefix']
+        peer_as = target['peer_as']
+        result = {'vpnv4_prefix': vpnv4_prefix, 'peer_as': '%s' % peer_as}
+        exists = (vpnv4_prefix, peer_as) in targetIndex
+        if op == 'delete':
+            if not exists:
+                result['status'] = 'not_found'
+                return result
+            targetIndex.remove(vpnv4_prefix, peer_as)
+            result['status'] = 'deleted'
+            return result
+        if op == 'update' and not exists:
+            result['status'] = 'not_found'
+            return result
+        if op not in ('add', 'update'):
+            raise ValueError("unknown op: %s" % op)
+        targetIndex.add(vpnv4_prefix,
+                        TargetTable(peer_as, target['ping_srcip'],
+                                    target['ping_destip'], target['ssh_host'],
+                                    target['ssh_user'], target['ssh_pass'],
+                                    target['show_type']))
+        if exists:
+            result['status'] = 'updated'
+        else:
+            result['status'] = 'added'
+        return result
+
     def show_eventDetail(self, search_event_id=0):
         if search_event_id == 0:
-            eventResult = max(self.eventList.items())[1]
-            LOG.info("match_event_id=[%s]"%max(self.eventList.items())[0])
+            eventResult = self.eventList.latest()
+        else:
+            eventResult = self.eventList.get(search_event_id)
+        if eventResult is not None:
             search_info = eventResult.get_all()
+        elif search_event_id == 0:
+            search_info = self.history.latest()
         else:
-            for event_id, eventResult in self.eventList.items():
-                if str(event_id) == search_event_id:
-                    search_info = eventResult.get_all()
-                    break
+            search_info = self.history.get(search_event_id)
+        if search_info is None:
+            return None
+        LOG.info("match_event_id=[%s]"%search_info['event_id'])
         return search_info
 
+    def query_events(self, filters, since=None, until=None, cursor=None,
+                     limit=100, fields=None):
+        return self.history.query(filters, since, until, cursor, limit,
+                                  fields)
+
+    def event_updated(self, eventResult):
+        if eventResult.is_complete:
+            self.completed_total.inc()
+            self.latency.record_stamps(eventResult.stamps)
+            self.history.append(eventResult)
+
+    def stamp_event(self, event_id, name):
+        eventResult = self.eventList.get(event_id)
+        if eventResult is not None:
+            eventResult.stamp(name)
+
+    def show_eventStore(self):
+        result = self.eventList.stats()
+        result['history'] = self.history.stats()
+        result['bmp_q'] = self.bmp.bmp_q.stats()
+        result['bmp'] = self.bmp.stats()
+        result['test_result'] = self.test_result.stats()
+        return result
+
+    def show_adjRibIn(self, router=None, prefix=None, route_dist=None,
+                      peer_address=None):
+        adj_rib_in = self.bmp.adj_rib_in
+        if adj_rib_in is None:
+            raise ValueError("adj-rib-in is disabled (APGW_ADJ_RIB_IN=1)")
+        if prefix is None:
+            return {'stats': adj_rib_in.stats(),
+                    'neighbors': adj_rib_in.neighbors(router)}
+        if router is None:
+            raise ValueError("router is required with prefix")
+        return {'routes': adj_rib_in.lookup(router, route_dist, prefix,
+                                            peer_address)}
+
+    def show_latency(self):
+        return self.latency.stats()
+
+    def reset_latency(self):
+        self.latency.reset()
+        return self.latency.stats()
+
+    def show_poolStats(self):
+        return {'ssh': self.ssh_pool.stats(),
+                'http': self.http_pool.stats(),
+                'cli': self.cli.stats(),
+                'rib_cache': self.rib_cache.stats()}
+
     def lookup_bmp_result(self):
-        event_id = 0
         while True:
-            if not self.bmp.bmp_q.empty():
-                bmp_result = self.bmp.bmp_q.get()
-                LOG.debug("bmp_result=[%s]"%bmp_result)
-                if bmp_result['vpnv4_prefix'] == None:
-                    target_prefix = bmp_result['prefix']
-                else:
-                    target_prefix = bmp_result['vpnv4_prefix']
-
-                for vpnv4_prefix, target in self.targetInfoList.items():
-                    if vpnv4_prefix == target_prefix:
-                        target_info = target.get_all()
-                        if target_info['peer_as'] == str(bmp_result['peer_as']):
-                            buf_info1 = []
-                            buf_info2 = []
-                            event_id += 1
-                            buf_info1.append(event_id)
-                            buf_info1.append(target_info)
-                            self.ping_target_q.put(buf_info1)
-                            buf_info2.append(event_id)
-                            buf_info2.append(bmp_result)
-                            buf_info2.append(target_info['show_type'])
-                            self.show_target_q.put(buf_info2)
-                            event_time = time.strftime("%Y/%m/%d %H:%M:%S",
-                                                       time.localtime())
-                            self.eventList[event_id] = EventResult(
-                                                   bmp_result['received_time'],
-                                                   bmp_result['peer_bgp_id'],
-                                                   bmp_result['event_type'],
-                                                   bmp_result['peer_as'],
-                                                   bmp_result['vpnv4_prefix'],
-                                                   bmp_result['nexthop'],
-                                                   event_time,
-                                                   event_id)
-                            LOG.debug("eventList=[%s]"%self.eventList[event_id].get_all())
-            hub.sleep(1)
+            for batch in drain_queue(self.bmp.bmp_q):
+                dequeue_time = monotonic()
+                for bmp_result in batch.events:
+                    self.match_bmp_result(bmp_result, batch, dequeue_time)
+                self.busy_seconds.inc(monotonic() - dequeue_time,
+                                      labels=('match',))
+            hub.sleep(0)
+
+    def match_bmp_result(self, bmp_result, batch, dequeue_time):
+        LOG.debug("bmp_result=[%s]"%(bmp_result,))
+        target = self.targetIndex.lookup(bmp_result.route_dist,
+                                         bmp_result.prefix,
+                                         bmp_result.peer_as)
+        if target is None:
+            return
+
+        self.matched_total.inc()
+        target_info = target.get_all()
+        if FLAP_WINDOW > 0:
+            key = (bmp_result.peer_as, bmp_result.route_dist,
+                   bmp_result.prefix)
+            flap = self.flapping.get(key)
+            if flap is not None:
+                eventResult = self.eventList.get(flap[0])
+                if eventResult is not None:
+                    eventResult.merge(bmp_result, time.strftime(
+                        "%Y/%m/%d %H:%M:%S", time.localtime()))
+                    flap[3] = monotonic()
+                    self.flap_merged_total.inc()
+                    return
+        self.event_id += 1
+        event_id = self.event_id
+        event_time = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime())
+        self.eventList[event_id] = EventResult(bmp_result, event_time,
+                                               event_id,
+                                               (batch.recv_time,
+                                                batch.read_time,
+                                                batch.parse_time,
+                                                batch.queue_time,
+                                                dequeue_time, monotonic()))
+        LOG.debug("eventList=[%s]"%self.eventList[event_id].get_all())
+        if FLAP_WINDOW > 0:
+            now = monotonic()
+            self.flapping[key] = [event_id, target_info, now, now]
+            return
+        self.start_test(event_id, bmp_result, target_info)
+
+    def loop_flap(self):
+        while True:
+            hub.sleep(min(FLAP_WINDOW / 4, 1.0))
+            now = monotonic()
+            for key, flap in self.flapping.items():
+                event_id, target_info, first, last = flap
+                if (now - last < FLAP_WINDOW and
+                        now - first < FLAP_MAX_HOLD):
+                    continue
+                del self.flapping[key]
+                eventResult = self.eventList.get(event_id)
+                if eventResult is None:
+                    LOG.info("event already evicted [%s]"%event_id)
+                    continue
+                if eventResult.flap_count > 1:
+                    LOG.info("event [%s] merged %d events for %s"
+                             % (event_id, eventResult.flap_count, key[2]))
+                self.start_test(event_id, eventResult.bmp_event, target_info)
+
+    def start_test(self, event_id, bmp_result, target_info):
+        buf_info1 = []
+        buf_info2 = []
+        buf_info1.append(event_id)
+        buf_info1.append(target_info)
+        self.ping_target_q.put(buf_info1)
+        buf_info2.append(event_id)
+        buf_info2.append(bmp_result)
+        buf_info2.append(target_info['show_type'])
+        self.show_target_q.put(buf_info2)
 
     def loop_ping(self):
-        port = 22
         while True:
-            buf_info = []
-            if not self.ping_target_q.empty():
-                buf_info = self.ping_target_q.get()
+            for buf_info in drain_queue(self.ping_target_q):
                 event_id = buf_info[0]
                 target_info = buf_info[1]
-                username = target_info['ssh_user']
-                password = target_info['ssh_pass']
-                ipaddress = target_info['ssh_host']
-                srcip = target_info['ping_srcip']
-                destip = target_info['ping_destip']
-                ping_cmd = "ping -c 5 " + destip + " -I " + srcip
-
-                tp = paramiko.Transport((ipaddress, int(port)))
-
-                try:
-                    tp.connect(username=username, password=password,
-                               hostkey=None)
-                except:
-                    tp.close()
-                    raise SystemExit("Bad username or password.")
-                ch = tp.open_channel("session")
-                ch.exec_command(ping_cmd)
-                ping_recv = None
-                ping_result = None
-
-                while not ch.closed:
-                    if ch.recv_stderr_ready:
-                        ping_recv = ch.recv_stderr(1024)
-                        ping_result = "internal test error"
-                    if ch.recv_ready:
-                        ping_recv = ch.recv(1024)
-                        ping_recv = "$ " + ping_cmd + '\n' + ping_recv
-                        if (PING_OK in ping_recv):
-                            ping_result = "OK"
-                        elif (PING_NG in ping_recv):
-                            ping_result = "NG"
-                        else:
-                            ping_result = "??"
-                        LOG.info(ping_recv)
-                        self.eventList[event_id].add_ping_recv(ping_recv)
-                        self.eventList[event_id].add_ping_result(ping_result)
-                        event_time = self.eventList[event_id].event_time
-                        event_type = self.eventList[event_id].event_type
-                        output = "%s [%s] [%s] [%s]\n"%(event_time, event_id,
-                                  ping_result, event_type)
-                        self.test_result.write(output)
-                        self.test_result.flush()
-                        LOG.info("EventResult: [%s]"%output)
-                        tp.close()
-            hub.sleep(1)
+                self.ping_executor.submit(target_info['ssh_host'],
+                                          self.ping_target, event_id,
+                                          target_info)
+            hub.sleep(0)
+
+    def ping_target(self, event_id, target_info):
+        username = target_info['ssh_user']
+        password = target_info['ssh_pass']
+        ipaddress = target_info['ssh_host']
+        srcip = target_info['ping_srcip']
+        destip = target_info['ping_destip']
+        ping_cmd = "ping -c 5 " + destip + " -I " + srcip
+
+        self.stamp_event(event_id, 'ping_start')
+        ch = self.ssh_pool.open_session(ipaddress, username, password)
+        try:
+            ch.settimeout(PING_TIMEOUT)
+            ch.exec_command(ping_cmd)
+
+            recv_buf = []
+            while True:
+                data = ch.recv(1024)
+                if not data:
+                    break
+                recv_buf.append(data)
+            ping_recv = "".join(recv_buf)
+            if not ping_recv and ch.recv_stderr_ready():
+                ping_recv = ch.recv_stderr(1024)
+                ping_result = "internal test error"
+            else:
+                ping_recv = "$ " + ping_cmd + '\n' + ping_recv
+                if (PING_OK in ping_recv):
+                    ping_result = "OK"
+                elif (PING_NG in ping_recv):
+                    ping_result = "NG"
+                else:
+                    ping_result = "??"
+        finally:
+            ch.close()
+
+        LOG.info(ping_recv)
+        self.add_ping_result(event_id, ping_recv, ping_result)
+
+    def ping_failed(self, reason, event_id, target_info):
+        self.add_ping_result(event_id, reason, "internal test error")
+
+    def add_ping_result(self, event_id, ping_recv, ping_result):
+        eventResult = self.eventList.get(event_id)
+        if eventResult is None:
+            LOG.info("event already evicted [%s]"%event_id)
+            return
+        eventResult.stamp('ping_end')
+        eventResult.add_ping_recv(ping_recv)
+        eventResult.add_ping_result(ping_result)
+        event_time = eventResult.event_time
+        event_type = eventResult.event_type
+        output = "%s [%s] [%s] [%s]\n"%(event_time, event_id,
+                  ping_result, event_type)
+        self.test_result.write(output)
+        LOG.info("EventResult: [%s]"%output)
+        self.event_updated(eventResult)
 
     def loop_show(self):
         while True:
-            if not self.show_target_q.empty():
-                buf_info = self.show_target_q.get()
+            for buf_info in drain_queue(self.show_target_q):
                 event_id = buf_info[0]
                 bmp_result = buf_info[1]
                 show_type = buf_info[2]
-                target_host = bmp_result['received_host']
-                neighbor_address = bmp_result['nexthop']
-                if neighbor_address:
-                    self.show_neighbor(show_type, target_host, neighbor_address,                    event_id)
-                else:
-                    self.eventList[event_id].add_show_neighbor_result("N/A")
-                    
-                self.show_rib(show_type, target_host, event_id)
-            hub.sleep(1)
+                self.show_executor.submit(bmp_result.received_host,
+                                          self.show_target, event_id,
+                                          bmp_result, show_type)
+            hub.sleep(0)
+
+    def show_target(self, event_id, bmp_result, show_type):
+        if event_id not in self.eventList:
+            LOG.info("event already evicted [%s]"%event_id)
+            return
+        self.eventList[event_id].stamp('show_start')
+        target_host = bmp_result.received_host
+        neighbor_address = bmp_result.nexthop
+        if neighbor_address:
+            self.show_neighbor(show_type, target_host, neighbor_address,
+                               event_id)
+        else:
+            self.eventList[event_id].add_show_neighbor_result("N/A")
+        self.stamp_event(event_id, 'show_neighbor')
+
+        self.show_rib(show_type, target_host, event_id)
+        self.stamp_event(event_id, 'show_rib')
+        self.event_updated(self.eventList[event_id])
+
+    def show_failed(self, reason, event_id, bmp_result, show_type):
+        eventResult = self.eventList.get(event_id)
+        if eventResult is None:
+            return
+        if eventResult.show_neighbor_result is None:
+            eventResult.add_show_neighbor_result(reason)
+        if eventResult.show_rib_result is None:
+            eventResult.add_show_rib_result(reason)
+        self.event_updated(eventResult)
 
     def show_neighbor(self, show_type, target_host, neighbor_address, event_id):
         if show_type == "rest":
@@ -232,6 +720,10 @@ class TestAutomation(app_manager.RyuApp):
         elif show_type == "cli":
             show_neighbor_result = self.cli_get_neighbor(target_host,
                                                          neighbor_address)
+        elif show_type == "local":
+            show_neighbor_result = self.local_get_neighbor(
+                target_host, neighbor_address,
+                self.eventList[event_id].bmp_event)
         else:
             show_neighbor_result = "N/A"
 
@@ -241,6 +733,18 @@ class TestAutomation(app_manager.RyuApp):
         self.eventList[event_id].add_show_neighbor_result(show_neighbor_result)
 
     def show_rib(self, show_type, target_host, event_id):
+        if show_type == "local":
+            show_rib_result = self.local_get_rib(
+                target_host, self.eventList[event_id].bmp_event)
+        else:
+            show_rib_result = self.rib_cache.get(target_host, show_type)
+
+        LOG.info("------------------")
+        LOG.info(show_rib_result)
+        LOG.info("------------------")
+        self.eventList[event_id].add_show_rib_result(show_rib_result)
+
+    def get_rib(self, target_host, show_type):
         if show_type == "rest":
             show_cmd = "bgpd> show rib vpnv4\n" 
             show_rib_result = self.rest_get_rib(target_host)
@@ -249,11 +753,7 @@ class TestAutomation(app_manager.RyuApp):
             show_rib_result = self.cli_get_rib(target_host)
         else:
             show_rib_result = "N/A"
-
-        LOG.info("------------------")
-        LOG.info(show_rib_result)
-        LOG.info("------------------")
-        self.eventList[event_id].add_show_rib_result(show_rib_result)
+        return show_rib_result
 
     def rest_get_neighbor(self, rest_host, address):
         dpid = "0000000000000001"
@@ -273,7 +773,24 @@ class TestAutomation(app_manager.RyuApp):
         return result
 
     def cli_get_neighbor(self, cli_host, address):
-        return "N/A"
+        # Unless the rib snapshot is fresh, or being fetched, the rib command
+        # goes out right behind this one on the same session, as the fetch
+        # show_rib and other events for the router then wait for.
+        command = CLI_NEIGHBOR_COMMAND % address
+        if self.rib_cache.has(cli_host, "cli"):
+            return self.cli.run(cli_host, command)
+        neighbor = []
+
+        def fetch(host, show_type):
+            outputs = self.cli.run_many(host, [command, CLI_RIB_COMMAND])
+            neighbor.append(outputs[0])
+            if outputs[1].endswith(NOT_READ):
+                # Not sent after a truncated neighbor answer.
+                return self.cli_get_rib(host)
+            return outputs[1]
+
+        self.rib_cache.get(cli_host, "cli", fetch)
+        return neighbor[0]
 
     def rest_get_rib(self, rest_host):
         dpid = "0000000000000001"
@@ -287,33 +804,44 @@ class TestAutomation(app_manager.RyuApp):
         return result
 
     def cli_get_rib(self, cli_host):
-        session = telnetlib.Telnet(cli_host)
-        cli_content = "show bgp vpnv4 unicast all\n"
-        session.write(cli_content)
-        session.write("exit\n")
-        return session.read_all()
+        return self.cli.run(cli_host, CLI_RIB_COMMAND)
+
+    def local_get_neighbor(self, target_host, address, bmp_result):
+        # Answered from the Adj-RIB-In mirror instead of the router.
+        adj_rib_in = self.bmp.adj_rib_in
+        if adj_rib_in is None or bmp_result.prefix is None:
+            return "N/A"
+        show_cmd = "adj-rib-in> show neighbor received-routes " + \
+                   address + " " + bmp_result.prefix + "\n"
+        if not adj_rib_in.has_peer(target_host, address):
+            return show_cmd + "neighbor %s is not monitored\n" % address
+        return show_cmd + format_routes(adj_rib_in.lookup(
+            target_host, bmp_result.route_dist, bmp_result.prefix, address))
+
+    def local_get_rib(self, target_host, bmp_result):
+        adj_rib_in = self.bmp.adj_rib_in
+        if adj_rib_in is None or bmp_result.prefix is None:
+            return "N/A"
+        show_cmd = "adj-rib-in> show rib " + \
+                   (bmp_result.vpnv4_prefix or bmp_result.prefix) + "\n"
+        return show_cmd + format_routes(adj_rib_in.lookup(
+            target_host, bmp_result.route_dist, bmp_result.prefix))
 
     def request_info(self, operator, url_path, method, request, host):
-        port = "8080"
         LOG.info("=" *70)
         LOG.info("%s" % operator)
         LOG.info("=" *70)
-        session = HTTPConnection("%s:%s" % (host, port))
 
         header = {
             "Content-Type": "application/json"
             }
-        if method == "GET":
-            if request:
-                LOG.info(url_path)
-                LOG.info(request)
-                session.request("GET", url_path, request, header)
-            else:
-                LOG.info(url_path)
-                session.request("GET", url_path, "", header)
-        session.set_debuglevel(4)
+        LOG.info(url_path)
+        if request:
+            LOG.info(request)
+        status, body = self.http_pool.request(host, method, url_path,
+                                              request, header)
         LOG.info("----------")
-        return json.load(session.getresponse())
+        return json.loads(body)
 
 
 class TestController(ControllerBase):
@@ -323,16 +851,29 @@ class TestController(ControllerBase):
 
     @route('router', '/apgw/test', methods=['POST'])
     def test_ping(self, req, **kwargs):
-        pingTarget_param = eval(req.body)
+        pingTarget_param = json.loads(req.body)
         result = self.pingTarget(pingTarget_param)
         message = json.dumps(result)
         return Response(status=200,
                         content_type = 'application/json',
                         body = message)
 
+    @route('router', '/apgw/targets', methods=['POST'])
+    def bulk_target(self, req, **kwargs):
+        try:
+            result = self.bulkTarget(req.body)
+        except ValueError, e:
+            return Response(status=400,
+                            content_type = 'application/json',
+                            body = json.dumps({'error': '%s' % e}))
+        message = json.dumps(result)
+        return Response(status=200,
+                        content_type = 'application/json',
+                        body = message)
+
     @route('router', '/apgw/event', methods=['POST'])
     def show_event(self, req, **kwargs):
-        event_param = eval(req.body)
+        event_param = json.loads(req.body)
 
         result = self.showEvent(event_param)
         message = json.dumps(result)
@@ -348,6 +889,71 @@ class TestController(ControllerBase):
                         content_type = 'application/json',
                         body = message)
 
+    @route('router', '/apgw/events', methods=['GET'])
+    def query_event(self, req, **kwargs):
+        try:
+            result = self.queryEvent(req.GET)
+        except ValueError, e:
+            return Response(status=400,
+                            content_type = 'application/json',
+                            body = json.dumps({'error': '%s' % e}))
+        message = json.dumps(result)
+        return Response(status=200,
+                        content_type = 'application/json',
+                        body = message)
+
+    @route('router', '/apgw/event/store', methods=['GET'])
+    def show_event_store(self, req, **kwargs):
+        result = self.test_spp.show_eventStore()
+        message = json.dumps(result)
+        return Response(status=200,
+                        content_type = 'application/json',
+                        body = message)
+
+    @route('router', '/apgw/rib', methods=['GET'])
+    def show_rib(self, req, **kwargs):
+        try:
+            result = self.showAdjRibIn(req.GET)
+        except ValueError, e:
+            return Response(status=400,
+                            content_type = 'application/json',
+                            body = json.dumps({'error': '%s' % e}))
+        message = json.dumps(result)
+        return Response(status=200,
+                        content_type = 'application/json',
+                        body = message)
+
+    @route('router', '/apgw/latency', methods=['GET'])
+    def show_latency(self, req, **kwargs):
+        result = self.test_spp.show_latency()
+        message = json.dumps(result)
+        return Response(status=200,
+                        content_type = 'application/json',
+                        body = message)
+
+    @route('router', '/apgw/latency', methods=['DELETE'])
+    def reset_latency(self, req, **kwargs):
+        result = self.test_spp.reset_latency()
+        message = json.dumps(result)
+        return Response(status=200,
+                        content_type = 'application/json',
+                        body = message)
+
+    @route('router', '/metrics', methods=['GET'])
+    def show_metrics(self, req, **kwargs):
+        return Response(status=200,
+                        content_type = METRICS_CONTENT_TYPE,
+                        charset = 'utf-8',
+                        body = REGISTRY.render())
+
+    @route('router', '/apgw/pool', methods=['GET'])
+    def show_pool(self, req, **kwargs):
+        result = self.test_spp.show_poolStats()
+        message = json.dumps(result)
+        return Response(status=200,
+                        content_type = 'application/json',
+                        body = message)
+
     def pingTarget(self, pingTarget_param):
         testCtrl = self.test_spp
         peer_as = pingTarget_param['target']['peer_as']
@@ -373,6 +979,20 @@ class TestController(ControllerBase):
             }
         }
 
+    def bulkTarget(self, body):
+        testCtrl = self.test_spp
+        items = list(iter_json_documents(body))
+        results = testCtrl.bulk_pingTarget(items)
+        for index, result in enumerate(results):
+            result['index'] = index
+        errors = sum(1 for result in results if result['status'] == 'error')
+        return {
+            'targets': len(testCtrl.targetIndex),
+            'items': len(results),
+            'errors': errors,
+            'results': results,
+        }
+
     def showEvent(self, event_param):
         testCtrl = self.test_spp
         event_id = event_param['event']['event_id']
@@ -406,10 +1026,42 @@ class TestController(ControllerBase):
                     'ping_recv': '%s' % ping_recv,
                     'show_neighbor_result': '%s' % show_neighbor_result,
                     'show_rib_result': '%s' % show_rib_result,
+                    'flap_count': '%s' % search_info.get('flap_count', 1),
+                    'latency': search_info.get('latency', {}),
                 }
             }
 
 
+    def queryEvent(self, query_param):
+        testCtrl = self.test_spp
+        filters = {}
+        for field in QUERY_FILTERS:
+            if field in query_param:
+                filters[field] = query_param[field]
+        since = parse_event_time(query_param.get('since'))
+        until = parse_event_time(query_param.get('until'))
+        cursor = query_param.get('cursor')
+        if cursor is not None:
+            cursor = int(cursor)
+        limit = int(query_param.get('limit', 100))
+        fields = query_param.get('fields')
+        if fields:
+            fields = fields.split(',')
+
+        events, next_cursor = testCtrl.query_events(filters, since, until,
+                                                    cursor, limit, fields)
+        return {
+            'events': events,
+            'next_cursor': next_cursor,
+        }
+
+    def showAdjRibIn(self, query_param):
+        testCtrl = self.test_spp
+        return testCtrl.show_adjRibIn(query_param.get('router'),
+                                      query_param.get('prefix'),
+                                      query_param.get('route_dist'),
+                                      query_param.get('peer'))
+
     def showEventLatest(self):
         testCtrl = self.test_spp
         search_info = testCtrl.show_eventDetail()
@@ -442,5 +1094,7 @@ class TestController(ControllerBase):
                     'ping_recv': '%s' % ping_recv,
                     'show_neighbor_result': '%s' % show_neighbor_result,
                     'show_rib_result': '%s' % show_rib_result,
+                    'flap_count': '%s' % search_info.get('flap_count', 1),
+                    'latency': search_info.get('latency', {}),
                 }
             }
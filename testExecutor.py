@@ -0,0 +1,80 @@
+# Copyright (c) 2014-2015 ttsubo
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+
+import logging
+
+from eventlet.timeout import Timeout
+from latency import monotonic
+from ryu.lib import hub
+
+LOG = logging.getLogger('TestExecutor')
+LOG.setLevel(logging.INFO)
+
+
+class TestExecutor(object):
+    # Runs test jobs concurrently.  A job first waits for a slot on its
+    # target host and only then for a global slot, so a busy host never
+    # holds workers that other hosts could use.  Every job runs under its own
+    # timeout and failures are handed to error_handler instead of killing the
+    # worker.
+    def __init__(self, error_handler, max_workers=32, max_per_host=4,
+                 timeout=30):
+        self.error_handler = error_handler
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._workers = hub.BoundedSemaphore(max_workers)
+        self._hosts = {}
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.busy_time = 0.0
+
+    def submit(self, host, func, *args):
+        self.pending += 1
+        return hub.spawn(self._run, host, func, args)
+
+    def _host_slot(self, host):
+        slot = self._hosts.get(host)
+        if slot is None:
+            slot = self._hosts[host] = \
+                hub.BoundedSemaphore(self.max_per_host)
+        return slot
+
+    def _run(self, host, func, args):
+        with self._host_slot(host):
+            with self._workers:
+                self.pending -= 1
+                self.running += 1
+                start = monotonic()
+                try:
+                    with Timeout(self.timeout):
+                        func(*args)
+                    self.completed += 1
+                except Timeout:
+                    self.timeouts += 1
+                    LOG.error("test timed out after %ss [%s]"
+                              % (self.timeout, host))
+                    self.error_handler("timeout after %ss" % self.timeout,
+                                       *args)
+                except Exception, e:
+                    self.failed += 1
+                    LOG.error("test failed [%s]: %s" % (host, e))
+                    self.error_handler(str(e), *args)
+                finally:
+                    self.running -= 1
+                    self.busy_time += monotonic() - start
+
+    def stats(self):
+        return {
+            'max_workers': self.max_workers,
+            'pending': self.pending,
+            'running': self.running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'busy_time': self.busy_time,
+        }
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import gc
+import logging
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import bmp_synth
+import bgpMonitor
+from adjRibIn import AdjRibIn
+from bgpMonitor import BgpMonitor
+
+ROUTER = "172.16.0.1"
+ADDR = (ROUTER, 11019)
+
+##################
+# benchmark
+##################
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+def prefix(index):
+    return "%d.%d.%d.0/24" % (10 + (index >> 16), (index >> 8) & 0xff,
+                              index & 0xff)
+
+def fill(adj_rib_in, routes, peers, paths):
+    # routes spread over peers, sharing paths distinct attribute sets.
+    attributes = [bmp_synth.rich_attributes(65010, as_path_len=3 + i % 4)[0] +
+                  bmp_synth.rich_attributes(65010)[1] + "%06d" % i
+                  for i in range(paths)]
+    start = time.time()
+    for index in xrange(0, routes, 100):
+        peer = (index // 100) % peers
+        adj_rib_in.update(ROUTER, "192.168.%d.1" % peer, 65010 + peer,
+                          "10.0.%d.1" % peer, [],
+                          [("65010:101", prefix(i), "192.168.%d.1" % peer)
+                           for i in xrange(index, min(index + 100, routes))],
+                          attributes[(index // 100) % paths])
+    return time.time() - start
+
+def measure_memory(routes, peers, paths):
+    gc.collect()
+    before = rss_bytes()
+    adj_rib_in = AdjRibIn()
+    elapsed = fill(adj_rib_in, routes, peers, paths)
+    gc.collect()
+    used = rss_bytes() - before
+    print "%d routes, %d peers, %d paths: %.1f MB, %.0f MB per million" \
+          " routes, %.0f routes/s" % (routes, peers, paths,
+                                      used / 1e6, used / 1e6 * 1e6 / routes,
+                                      routes / elapsed)
+    return adj_rib_in
+
+def measure_lookup(adj_rib_in, routes, count=20000):
+    rand = random.Random(1)
+    queries = [("65010:101", prefix(rand.randrange(routes)))
+               for _ in xrange(count)]
+    start = time.time()
+    for route_dist, query in queries:
+        adj_rib_in.lookup(ROUTER, route_dist, query)
+    print "lookup (all peers): %.1f usec" % (
+        (time.time() - start) / count * 1e6)
+    start = time.time()
+    for route_dist, query in queries:
+        adj_rib_in.lookup(ROUTER, route_dist, query, "192.168.0.1")
+    print "lookup (one peer):  %.1f usec" % (
+        (time.time() - start) / count * 1e6)
+
+def check_feed(count):
+    # Announce a table through BgpMonitor, withdraw every other prefix and
+    # check what the mirror holds.
+    bgpMonitor.ADJ_RIB_IN = True
+    bgpMonitor.QUEUE_SIZE = 0
+    monitor = BgpMonitor()
+    stale = time.time() - 3600
+    msgs = bmp_synth.full_table_dump(count, timestamp=stale, rich=True)
+    prefixes = ["10.%d.%d.0/24" % ((i >> 8) & 0xff, i & 0xff)
+                for i in xrange(count)]
+    msgs.append(bmp_synth.vpnv4_update(65010, "10.0.0.1", "192.168.0.1",
+                                       "65010:101", prefixes[::2],
+                                       "192.168.0.1", withdraw=True))
+    for data in msgs:
+        monitor.publish(monitor.decode((ADDR, data, 0.0, 0.0)))
+    stats = monitor.adj_rib_in.stats()
+    assert stats['routes'] == count - len(prefixes[::2]), stats
+    routes = monitor.adj_rib_in.lookup(ROUTER, "65010:101", prefixes[1])
+    assert routes and routes[0]['nexthop'] == "192.168.0.1", routes
+    assert not monitor.adj_rib_in.lookup(ROUTER, "65010:101", prefixes[0])
+    print "feed check: %s" % stats
+
+def main(argv):
+    logging.getLogger('BgpMonitor').setLevel(logging.WARN)
+    routes = int(argv[1]) if len(argv) > 1 else 1000000
+    peers = int(argv[2]) if len(argv) > 2 else 4
+    paths = int(argv[3]) if len(argv) > 3 else 1000
+    check_feed(2000)
+    adj_rib_in = measure_memory(routes, peers, paths)
+    measure_lookup(adj_rib_in, routes)
+
+if __name__ == "__main__":
+    main(sys.argv)
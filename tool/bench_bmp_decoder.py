@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import bmp_synth
+import bgpMonitor
+from bgpMonitor import BgpMonitor
+from validate_bmp_decoder import load_dump
+
+ADDR = ("172.16.0.1", 11019)
+
+##################
+# benchmark
+##################
+
+def run(msgs, fast):
+    bgpMonitor.FAST_DECODER = fast
+    monitor = BgpMonitor()
+    events = 0
+    start = time.time()
+    for data in msgs:
+        events += len(monitor.decode((ADDR, data, 0.0, 0.0))[-1])
+    return time.time() - start, events
+
+def main(argv):
+    logging.getLogger('BgpMonitor').setLevel(logging.WARN)
+    if len(argv) > 1 and not argv[1].isdigit():
+        corpora = [(argv[1], load_dump(argv[1]))]
+    else:
+        prefixes = int(argv[1]) if len(argv) > 1 else 20000
+        corpora = []
+        for per_update in (1, 10):
+            for rich in (False, True):
+                name = "%d prefix/update%s" % (per_update,
+                                               ", rich" if rich else "")
+                corpora.append((name, bmp_synth.full_table_dump(
+                    prefixes, prefixes_per_update=per_update, rich=rich)))
+    for name, msgs in corpora:
+        ryu, ryu_events = run(msgs, False)
+        fast, fast_events = run(msgs, True)
+        assert ryu_events == fast_events, (ryu_events, fast_events)
+        print "%-24s %7d msgs  ryu %7.3f sec  fast %7.3f sec  %5.1fx" % (
+            name, len(msgs), ryu, fast, ryu / fast)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import bmp_synth
+from bmpStream import BMPStreamReader, BMP_HDR_LEN
+
+##################
+# framing loops
+##################
+
+def legacy_framing(sock):
+    # The framing loop BgpMonitor.handler used before BMPStreamReader.
+    count = 0
+    buf = bytearray()
+    required_len = BMP_HDR_LEN
+    while True:
+        ret = sock.recv(required_len)
+        if len(ret) == 0:
+            break
+        buf += ret
+        while len(buf) >= required_len:
+            _, len_, _ = struct.unpack_from('!BIB', buf)
+            required_len = len_
+            if len(buf) < required_len:
+                break
+            pkt = buf[:len_]
+            buf = buf[len_:]
+            count += 1
+            required_len = BMP_HDR_LEN
+    return count
+
+def stream_framing(sock):
+    count = 0
+    for pkt in BMPStreamReader(sock):
+        count += 1
+    return count
+
+##################
+# benchmark
+##################
+
+def run(name, framing, stream, expected):
+    reader, writer = socket.socketpair()
+    sender = threading.Thread(target=send_stream, args=(writer, stream))
+    sender.start()
+    start = time.time()
+    count = framing(reader)
+    elapsed = time.time() - start
+    sender.join()
+    reader.close()
+    assert count == expected, (name, count, expected)
+    print "%-8s %8d msgs %10.3f sec %12.0f msgs/s %8.1f MB/s" % (
+        name, count, elapsed, count / elapsed,
+        len(stream) / elapsed / 1024 / 1024)
+    return elapsed
+
+def send_stream(sock, stream):
+    sock.sendall(stream)
+    sock.close()
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 50000
+    msgs = bmp_synth.full_table_dump(count)
+    stream = ''.join(msgs)
+    print "stream: %d messages, %.1f MB" % (len(msgs),
+                                            len(stream) / 1024.0 / 1024.0)
+    legacy = run("legacy", legacy_framing, stream, len(msgs))
+    ring = run("stream", stream_framing, stream, len(msgs))
+    print "speedup: %.1fx" % (legacy / ring)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import json
+import optparse
+import os
+import subprocess
+import sys
+import tempfile
+
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TOOL_DIR, '..'))
+
+# Every scenario runs in a fresh process so peak RSS and CPU are its own.
+SCENARIOS = [
+    ('default', {}),
+    ('ryu_decoder', {'APGW_BMP_FAST_DECODER': '0'}),
+    ('no_prefilter', {'APGW_BMP_PREFILTER': '0'}),
+    ('parser_pool', {'APGW_BMP_PARSER_PROCESSES': '2'}),
+    ('adj_rib_in', {'APGW_ADJ_RIB_IN': '1'}),
+]
+
+# Checked against --baseline: (field, True when higher is better).
+REGRESSION_FIELDS = (('msgs_per_sec', True), ('events_per_sec', True),
+                     ('peak_rss_mb', False))
+
+##################
+# scenario (child process)
+##################
+
+def run_scenario(capture, peers):
+    import eventlet
+    eventlet.monkey_patch()
+    import logging
+    import resource
+    import time
+    import bgpMonitor
+    from bgpMonitor import BgpMonitor
+    from parserPool import ParserPool
+    from ryu.lib import hub
+    from ryu.lib.hub import StreamServer
+
+    logging.getLogger('BgpMonitor').setLevel(logging.WARN)
+    logging.getLogger('ParserPool').setLevel(logging.WARN)
+    monitor = BgpMonitor()
+    if bgpMonitor.PARSER_PROCESSES > 0:
+        monitor.parser_pool = ParserPool(monitor.decode_remote,
+                                         monitor.publish_remote,
+                                         processes=bgpMonitor.PARSER_PROCESSES,
+                                         batch_size=bgpMonitor.PARSER_BATCH)
+    counts = {'events': 0, 'first': None}
+
+    def handler(sock, addr):
+        if counts['first'] is None:
+            counts['first'] = time.time()
+        monitor.handler(sock, addr)
+
+    def consume():
+        while True:
+            counts['events'] += len(monitor.bmp_q.get().events)
+
+    server = StreamServer(('127.0.0.1', 0), handler)
+    port = server.server.getsockname()[1]
+    hub.spawn(server.serve_forever)
+    hub.spawn(consume)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_start = usage.ru_utime + usage.ru_stime
+    replayer = subprocess.Popen(
+        [sys.executable, os.path.join(TOOL_DIR, 'bmp_replay.py'), capture,
+         '--port', str(port), '--speed', '0', '--peers', str(peers),
+         '--json'], stdout=subprocess.PIPE)
+    while replayer.poll() is None:
+        hub.sleep(0.01)
+    sent = json.loads(replayer.stdout.read().splitlines()[-1])
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_children = children.ru_utime + children.ru_stime
+
+    def busy():
+        if monitor.sessions.get() or len(monitor.bmp_q):
+            return True
+        pool = monitor.parser_pool
+        if pool is not None:
+            stats = pool.stats()
+            return stats['submitted'] > stats['completed']
+        return False
+
+    while busy():
+        hub.sleep(0.001)
+    elapsed = time.time() - counts['first']
+    if monitor.parser_pool is not None:
+        monitor.parser_pool.close()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (usage.ru_utime + usage.ru_stime - cpu_start +
+           children.ru_utime + children.ru_stime - cpu_children)
+    stats = monitor.stats()
+    messages = (sum(monitor.messages_total.values().itervalues()) +
+                sum(stats['prefilter_skipped'].values()) +
+                stats['failed_pkt_count'])
+    return {
+        'sessions': sent['sessions'],
+        'messages': messages,
+        'sent': sent['messages'],
+        'events': counts['events'],
+        'elapsed': elapsed,
+        'msgs_per_sec': messages / elapsed,
+        'events_per_sec': counts['events'] / elapsed,
+        'cpu_sec': cpu,
+        'cpu_util': cpu / elapsed,
+        'peak_rss_mb': usage.ru_maxrss / 1024.0,
+    }
+
+##################
+# benchmark
+##################
+
+def spawn_scenario(name, env, capture, peers):
+    child_env = dict(os.environ)
+    child_env.update(env)
+    child_env.setdefault('APGW_BMP_QUEUE_SIZE', '0')
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                             '--child', '--capture', capture,
+                             '--peers', str(peers)],
+                            stdout=subprocess.PIPE, env=child_env)
+    out = proc.communicate()[0]
+    if proc.returncode:
+        raise RuntimeError("scenario %s failed (exit %d)"
+                           % (name, proc.returncode))
+    return json.loads(out.splitlines()[-1])
+
+def check_regressions(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.iteritems():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for field, higher_is_better in REGRESSION_FIELDS:
+            if higher_is_better:
+                limit = base[field] * (1 - tolerance)
+                bad = result[field] < limit
+            else:
+                limit = base[field] * (1 + tolerance)
+                bad = result[field] > limit
+            if bad:
+                regressions.append("%s %s: %.1f (baseline %.1f)"
+                                   % (name, field, result[field],
+                                      base[field]))
+    return regressions
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--capture", help="bmpCapture file or raw BMP dump to "
+                      "replay (default: a synthetic table)")
+    parser.add_option("--prefixes", type="int", default=20000,
+                      help="size of the synthetic table")
+    parser.add_option("--prefixes-per-update", type="int", default=1)
+    parser.add_option("--peers", type="int", default=4,
+                      help="concurrent copies of every captured session")
+    parser.add_option("--scenario", action="append",
+                      help="run only this scenario (repeatable)")
+    parser.add_option("--output", metavar="PATH",
+                      help="write the results as JSON to PATH")
+    parser.add_option("--baseline", metavar="PATH",
+                      help="fail on a regression against these results")
+    parser.add_option("--tolerance", type="float", default=0.2)
+    parser.add_option("--child", action="store_true", help=optparse.SUPPRESS_HELP)
+    options, _ = parser.parse_args(argv[1:])
+
+    if options.child:
+        print json.dumps(run_scenario(options.capture, options.peers))
+        return 0
+
+    capture = options.capture
+    if capture is None:
+        import bmp_replay
+        capture = tempfile.mktemp(suffix='.bmpcap')
+        bmp_replay.synthetic_capture(capture, options.prefixes,
+                                     options.prefixes_per_update)
+    try:
+        results = {}
+        print "%-14s %9s %9s %8s %10s %10s %8s %8s" % (
+            "scenario", "messages", "events", "sec", "msgs/s", "events/s",
+            "cpu", "rss MB")
+        for name, env in SCENARIOS:
+            if options.scenario and name not in options.scenario:
+                continue
+            result = results[name] = spawn_scenario(name, env, capture,
+                                                    options.peers)
+            print "%-14s %9d %9d %8.3f %10.0f %10.0f %7.0f%% %8.1f" % (
+                name, result['messages'], result['events'],
+                result['elapsed'], result['msgs_per_sec'],
+                result['events_per_sec'], result['cpu_util'] * 100,
+                result['peak_rss_mb'])
+            if result['messages'] != result['sent']:
+                print "  %d of %d messages sent were not seen" % (
+                    result['sent'] - result['messages'], result['sent'])
+    finally:
+        if options.capture is None:
+            os.remove(capture)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = check_regressions(results, baseline, options.tolerance)
+        for regression in regressions:
+            print "REGRESSION %s" % regression
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import eventlet
+eventlet.monkey_patch()
+
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import bmp_synth
+import bgpMonitor
+from bgpMonitor import BgpMonitor
+from parserPool import ParserPool
+from ryu.lib import hub
+
+##################
+# benchmark
+##################
+
+def session_streams(sessions, prefixes):
+    # One full table per route reflector, each from its own peer.
+    streams = []
+    for index in xrange(sessions):
+        msgs = bmp_synth.full_table_dump(
+            prefixes, peer_bgp_id="10.0.%d.1" % index,
+            peer_address="192.168.%d.1" % index)
+        streams.append(''.join(msgs))
+    return streams, len(msgs)
+
+def run(processes, streams, expected, batch_size):
+    monitor = BgpMonitor()
+    if processes:
+        monitor.parser_pool = ParserPool(monitor.decode_remote,
+                                         monitor.publish_remote,
+                                         processes=processes,
+                                         batch_size=batch_size)
+    start = time.time()
+    for index, stream in enumerate(streams):
+        reader, writer = socket.socketpair()
+        hub.spawn(send_stream, writer, stream)
+        hub.spawn(monitor.handler, reader, ("172.16.0.%d" % index, 11019))
+    events = 0
+    while events < expected:
+        events += len(monitor.bmp_q.get().events)
+    elapsed = time.time() - start
+    if processes:
+        monitor.parser_pool.close()
+    return elapsed
+
+def send_stream(sock, stream):
+    sock.sendall(stream)
+    sock.close()
+
+def main(argv):
+    sessions = int(argv[1]) if len(argv) > 1 else 8
+    prefixes = int(argv[2]) if len(argv) > 2 else 5000
+    batch_size = int(argv[3]) if len(argv) > 3 else bgpMonitor.PARSER_BATCH
+    logging.getLogger('BgpMonitor').setLevel(logging.WARN)
+    logging.getLogger('ParserPool').setLevel(logging.WARN)
+    streams, msgs = session_streams(sessions, prefixes)
+    expected = sessions * prefixes
+    print "%d sessions x %d messages, %d cpus" % (sessions, msgs,
+                                                  multiprocessing.cpu_count())
+    base = None
+    for processes in (0, 1, 2, 4, 8):
+        if processes > 2 * multiprocessing.cpu_count():
+            break
+        elapsed = run(processes, streams, expected, batch_size)
+        if base is None:
+            base = elapsed
+        print "processes %d %10.3f sec %10.0f msgs/s %6.2fx" % (
+            processes, elapsed, sessions * msgs / elapsed, base / elapsed)
+
+if __name__ == "__main__":
+    main(sys.argv)
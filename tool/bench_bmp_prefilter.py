@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import eventlet
+eventlet.monkey_patch()
+
+import logging
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import bmp_synth
+import bgpMonitor
+from bgpMonitor import BgpMonitor
+from ryu.lib import hub
+
+##################
+# streams
+##################
+
+def session_start_dump(prefixes, fresh):
+    # What a router sends when the BMP session comes up: its whole table
+    # with the original (stale) timestamps, then a few live updates.
+    stale = time.time() - 3600
+    msgs = bmp_synth.full_table_dump(prefixes, timestamp=stale)
+    msgs += bmp_synth.full_table_dump(fresh)[1:]
+    return ''.join(msgs)
+
+def load_dump(path):
+    # A raw BMP stream as recorded with e.g. "nc -l 11019 > dump.bmp".
+    with open(path, 'rb') as f:
+        return f.read()
+
+##################
+# benchmark
+##################
+
+def run(name, stream, prefilter):
+    bgpMonitor.PREFILTER = prefilter
+    monitor = BgpMonitor()
+    before = counts(monitor)
+    reader, writer = socket.socketpair()
+    hub.spawn(send_stream, writer, stream)
+    start = time.time()
+    monitor.handler(reader, ("172.16.0.1", 11019))
+    elapsed = time.time() - start
+    events = 0
+    while True:
+        try:
+            events += len(monitor.bmp_q.get_nowait().events)
+        except hub.QueueEmpty:
+            break
+    # The counters are shared by every BgpMonitor, so only this run's part.
+    after = counts(monitor)
+    skipped = dict((reason, count - before[1].get(reason, 0))
+                   for reason, count in after[1].iteritems()
+                   if count > before[1].get(reason, 0))
+    print "%-10s %8.3f sec %8d events %8d messages parsed, skipped %s" % (
+        name, elapsed, events, after[0] - before[0], skipped)
+    return elapsed, events
+
+def counts(monitor):
+    # (messages parsed, messages skipped by reason)
+    stats = monitor.stats()
+    return (sum(stats['decoded'].values()) + stats['failed_pkt_count'],
+            stats['prefilter_skipped'])
+
+def send_stream(sock, stream):
+    sock.sendall(stream)
+    sock.close()
+
+def main(argv):
+    logging.getLogger('BgpMonitor').setLevel(logging.WARN)
+    if len(argv) > 1 and not argv[1].isdigit():
+        stream = load_dump(argv[1])
+        print "dump: %s, %.1f MB" % (argv[1], len(stream) / 1024.0 / 1024.0)
+    else:
+        prefixes = int(argv[1]) if len(argv) > 1 else 20000
+        stream = session_start_dump(prefixes, prefixes // 100)
+        print "synthetic session start: %d stale + %d live updates" % (
+            prefixes, prefixes // 100)
+    # The queue would block the handler once full; nothing consumes it here.
+    bgpMonitor.QUEUE_SIZE = 0
+    full, full_events = run("parse all", stream, False)
+    peek, peek_events = run("prefilter", stream, True)
+    assert full_events == peek_events, (full_events, peek_events)
+    print "speedup: %.1fx" % (full / peek)
+
+if __name__ == "__main__":
+    main(sys.argv)
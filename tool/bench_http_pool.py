@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+import threading
+import time
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from httplib import HTTPConnection
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from httpPool import HTTPConnectionPool
+
+HOST = "127.0.0.1"
+DPID = "0000000000000001"
+
+##################
+# stub router REST API
+##################
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Buffer the response so headers and body leave in one segment.
+    wbufsize = -1
+    body = json.dumps({'rib': "Status codes: * valid, > best\n" * 20})
+
+    def do_GET(self):
+        length = int(self.headers.getheader('content-length', 0))
+        if length:
+            self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+##################
+# clients
+##################
+
+def per_request_connection(port, count):
+    url_path = "/openflow/" + DPID + "/rib"
+    header = {"Content-Type": "application/json"}
+    for i in xrange(count):
+        session = HTTPConnection(HOST, port)
+        session.request("GET", url_path, "", header)
+        json.load(session.getresponse())
+        session.close()
+
+def pooled_connection(port, count):
+    url_path = "/openflow/" + DPID + "/rib"
+    header = {"Content-Type": "application/json"}
+    pool = HTTPConnectionPool(port=port)
+    for i in xrange(count):
+        status, body = pool.request(HOST, "GET", url_path, "", header)
+        json.loads(body)
+    print "pool stats: %s" % pool.stats()
+    pool.close()
+
+def run(name, client, port, count):
+    start = time.time()
+    client(port, count)
+    elapsed = time.time() - start
+    print "%-10s %6d requests %8.3f sec %10.0f req/s" % (name, count, elapsed,
+                                                       count / elapsed)
+    return elapsed
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 2000
+    server = StubServer((HOST, 0), StubHandler)
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    fresh = run("fresh", per_request_connection, port, count)
+    pooled = run("pooled", pooled_connection, port, count)
+    print "speedup: %.1fx" % (fresh / pooled)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import json
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TOOL_DIR, '..'))
+
+# Queue wait and execution stages reported per setting.
+STAGES = ('ping_wait', 'ping', 'show_wait', 'show_neighbor', 'show_rib',
+          'total')
+
+##################
+# setting (child process)
+##################
+
+def run_setting(events, routers, show_type, rate, timeout):
+    import eventlet
+    eventlet.monkey_patch()
+    import logging
+    import time
+    import testController
+    from bgpMonitor import BgpMonitor, BmpEvent, BmpBatch
+    from latency import monotonic
+    from ryu.app.wsgi import WSGIApplication
+    from ryu.lib import hub
+
+    logging.basicConfig(level=logging.WARN)
+    for name in ('BgpMonitor', 'TestAutomation', 'TestExecutor',
+                 'SSHTransportPool', 'HTTPConnectionPool', 'paramiko'):
+        logging.getLogger(name).setLevel(logging.ERROR)
+    ta = testController.TestAutomation(bmp=BgpMonitor(),
+                                       wsgi=WSGIApplication())
+    hosts = ["127.0.0.%d" % (index % routers + 1) for index in range(events)]
+    prefixes = ["10.%d.%d.0/24" % ((index >> 8) & 0xff, index & 0xff)
+                for index in range(events)]
+    ta.bulk_pingTarget([{'target': {
+        'peer_as': 65010, 'vpnv4_prefix': "65010:101:" + prefix,
+        'ping_srcip': "192.168.0.1", 'ping_destip': "192.168.0.2",
+        'ssh_host': host, 'ssh_user': "bench", 'ssh_pass': "bench",
+        'show_type': show_type}} for host, prefix in zip(hosts, prefixes)])
+
+    start = time.time()
+    received_time = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime())
+    for index in range(events):
+        if rate:
+            delay = start + float(index) / rate - time.time()
+            if delay > 0:
+                hub.sleep(delay)
+        now = monotonic()
+        event = BmpEvent(received_time, hosts[index], "adj_rib_in_changed",
+                         65010, "10.0.0.1", prefixes[index], "65010:101",
+                         "65010:101:" + prefixes[index], "192.168.0.1")
+        ta.bmp.bmp_q.put(BmpBatch([event], now, now, now, now))
+    while (ta.completed_total.get() < events and
+           time.time() - start < timeout):
+        hub.sleep(0.05)
+    elapsed = time.time() - start
+
+    completed = int(ta.completed_total.get())
+    ping_ok = sum(1 for event_id in range(1, events + 1)
+                  if event_id in ta.eventList and
+                  ta.eventList[event_id].ping_result == "OK")
+    stages = ta.show_latency()['stages']
+    result = {
+        'events': events,
+        'completed': completed,
+        'ping_ok': ping_ok,
+        'elapsed': elapsed,
+        'tests_per_sec': completed / elapsed,
+        'ping_executor': ta.ping_executor.stats(),
+        'show_executor': ta.show_executor.stats(),
+        'pools': ta.show_poolStats(),
+        'stages': dict((stage, stages[stage]) for stage in STAGES
+                       if stage in stages),
+    }
+    ta.close()
+    return result
+
+##################
+# benchmark
+##################
+
+def start_mocks(options):
+    args = [sys.executable, os.path.join(TOOL_DIR, 'mock_routers.py'),
+            '--routers', str(options.routers)]
+    for name in ('ssh_latency', 'ssh_size', 'ssh_fail', 'rest_latency',
+                 'rest_size', 'rest_fail', 'telnet_latency', 'telnet_size',
+                 'telnet_fail'):
+        value = getattr(options, name)
+        if value is not None:
+            args += ['--' + name.replace('_', '-'), str(value)]
+    if options.telnet_login:
+        args.append('--telnet-login')
+    mocks = subprocess.Popen(args, stdout=subprocess.PIPE)
+    ports = json.loads(mocks.stdout.readline())
+    return mocks, ports
+
+def spawn_setting(options, ports, workers, workdir):
+    # A fresh event database per setting, so event ids start at 1 again.
+    workdir = os.path.join(workdir, str(workers))
+    os.mkdir(workdir)
+    env = dict(os.environ)
+    env.update({
+        'APGW_SSH_PORT': str(ports['ssh']),
+        'APGW_REST_PORT': str(ports['rest']),
+        'APGW_TELNET_PORT': str(ports['telnet']),
+        'APGW_PING_MAX_WORKERS': str(workers),
+        'APGW_SHOW_MAX_WORKERS': str(workers),
+        'APGW_PING_MAX_PER_HOST': str(options.per_host or workers),
+        'APGW_SHOW_MAX_PER_HOST': str(options.per_host or workers),
+        'APGW_REST_POOL_SIZE': str(options.per_host or workers),
+        'APGW_CLI_POOL_SIZE': str(options.per_host or workers),
+        'APGW_EVENT_DB': os.path.join(workdir, 'event_history.db'),
+        'APGW_RESULT_FILE': os.path.join(workdir, 'Test_result.txt'),
+    })
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                             '--child', '--events', str(options.events),
+                             '--routers', str(options.routers),
+                             '--show-type', options.show_type,
+                             '--rate', str(options.rate),
+                             '--timeout', str(options.timeout)],
+                            stdout=subprocess.PIPE, env=env, cwd=workdir)
+    out = proc.communicate()[0]
+    if proc.returncode:
+        raise RuntimeError("setting %d workers failed (exit %d)"
+                           % (workers, proc.returncode))
+    return json.loads(out.splitlines()[-1])
+
+def print_result(workers, result):
+    stages = result['stages']
+
+    def p(stage, percentile):
+        if stage not in stages or not stages[stage]['count']:
+            return "-"
+        return "%.0f" % stages[stage]['p%d_ms' % percentile]
+
+    print "%7d %9d %7d %8.1f %9s %9s %9s %9s %9s %9s" % (
+        workers, result['completed'], result['ping_ok'],
+        result['tests_per_sec'], p('ping_wait', 50), p('ping_wait', 95),
+        p('ping', 50), p('show_wait', 50), p('show_wait', 95),
+        p('show_rib', 50))
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--events", type="int", default=500)
+    parser.add_option("--routers", type="int", default=4,
+                      help="mock routers/jump hosts on 127.0.0.1 .. N")
+    parser.add_option("--show-type", default="rest",
+                      help="rest, cli, local or none [%default]")
+    parser.add_option("--rate", type="float", default=0,
+                      help="events per second (0 = all at once)")
+    parser.add_option("--workers", default="8,32,128",
+                      help="ping and show executor sizes to compare")
+    parser.add_option("--per-host", type="int", default=0,
+                      help="per-host limit (0 = same as workers)")
+    parser.add_option("--timeout", type="float", default=600)
+    parser.add_option("--output", metavar="PATH",
+                      help="write the results as JSON to PATH")
+    for service in ('ssh', 'rest', 'telnet'):
+        parser.add_option("--%s-latency" % service, type="float")
+        parser.add_option("--%s-size" % service, type="int")
+        parser.add_option("--%s-fail" % service, type="float")
+    parser.add_option("--telnet-login", action="store_true",
+                      help="make the mock CLI ask for a user and password")
+    parser.add_option("--child", action="store_true", help=optparse.SUPPRESS_HELP)
+    options, _ = parser.parse_args(argv[1:])
+
+    if options.child:
+        print json.dumps(run_setting(options.events, options.routers,
+                                     options.show_type, options.rate,
+                                     options.timeout))
+        return 0
+
+    mocks, ports = start_mocks(options)
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline.')
+    results = {}
+    try:
+        print "%d events over %d routers, show_type %s" % (
+            options.events, options.routers, options.show_type)
+        print "%7s %9s %7s %8s %9s %9s %9s %9s %9s %9s" % (
+            "workers", "completed", "ping_ok", "tests/s", "pwait50",
+            "pwait95", "ping50", "swait50", "swait95", "rib50")
+        for workers in [int(w) for w in options.workers.split(',')]:
+            result = results[workers] = spawn_setting(options, ports,
+                                                      workers, workdir)
+            print_result(workers, result)
+    finally:
+        mocks.kill()
+        shutil.rmtree(workdir)
+    print "(times in msec; wait = queued until started, per stage p50/p95)"
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
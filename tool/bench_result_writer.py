@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from ryu.lib import hub
+from resultWriter import ResultWriter
+
+LINE = "2015/01/01 12:00:00 [%d] [OK] [adj_rib_in_changed]\n"
+
+##################
+# writers
+##################
+
+def flush_per_line(path, count):
+    # What loop_ping did before ResultWriter.
+    test_result = open(path, 'w')
+    for i in xrange(count):
+        test_result.write(LINE % i)
+        test_result.flush()
+    test_result.close()
+
+def fsync_per_line(path, count):
+    test_result = open(path, 'w')
+    for i in xrange(count):
+        test_result.write(LINE % i)
+        test_result.flush()
+        os.fsync(test_result.fileno())
+    test_result.close()
+
+def group_commit(sync, rotate_bytes=0, compress=False):
+    def writer(path, count):
+        test_result = ResultWriter(path, sync=sync, flush_interval=0.01,
+                                   rotate_bytes=rotate_bytes,
+                                   compress=compress)
+        for i in xrange(count):
+            test_result.write(LINE % i)
+            if i % 64 == 0:
+                # Results arrive from many workers, let the writer run.
+                hub.sleep(0)
+        test_result.close()
+        print "  %s" % test_result.stats()
+    return writer
+
+def run(name, writer, count):
+    workdir = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        writer(os.path.join(workdir, "Test_result.txt"), count)
+        elapsed = time.time() - start
+    finally:
+        shutil.rmtree(workdir)
+    print "%-18s %8d lines %8.3f sec %12.0f lines/s" % (name, count, elapsed,
+                                                        count / elapsed)
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 100000
+    run("flush/line", flush_per_line, count)
+    run("fsync/line", fsync_per_line, count // 100)
+    run("group(none)", group_commit("none"), count)
+    run("group(flush)", group_commit("flush"), count)
+    run("group(fsync)", group_commit("fsync"), count)
+    run("group(rotate+gz)", group_commit("flush", 1024 * 1024, True), count)
+
+if __name__ == "__main__":
+    main(sys.argv)
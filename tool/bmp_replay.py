@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import eventlet
+eventlet.monkey_patch()
+
+import json
+import optparse
+import os
+import socket
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import bmp_synth
+from bmpCapture import read_capture, CaptureWriter
+from bmpStream import PEER_MESSAGE_TYPES, BMP_HDR_LEN
+
+# Peer address and peer BGP ID in a message with a per-peer header.
+PEER_ADDRESS_OFFSET = BMP_HDR_LEN + 10
+PEER_BGP_ID_OFFSET = BMP_HDR_LEN + 30
+
+# Messages sent in one sendall() when replaying flat out.
+SEND_BATCH = 256
+
+##################
+# capture
+##################
+
+def load_sessions(paths):
+    # {session: [(timestamp, message), ...]} over every capture, with the
+    # session numbers of later files moved past those of earlier ones.
+    sessions = {}
+    for path in paths:
+        base = max(sessions) + 1 if sessions else 0
+        for timestamp, session, data in read_capture(path):
+            sessions.setdefault(base + session, []).append((timestamp, data))
+    return sessions
+
+def synthetic_capture(path, prefixes, prefixes_per_update=1, interval=0.0):
+    # One session announcing a table, one message every interval seconds.
+    writer = CaptureWriter(path)
+    start = time.time()
+    msgs = bmp_synth.full_table_dump(prefixes,
+                                     prefixes_per_update=prefixes_per_update,
+                                     timestamp=0)
+    for index, data in enumerate(msgs):
+        writer.write(0, start + index * interval, data)
+    writer.close()
+    return len(msgs)
+
+def rewrite_peer(data, copy):
+    # Gives copy its own peer address and BGP ID by replacing their last
+    # two octets, so every copy of a session shows up as different peers.
+    if copy == 0 or ord(data[5]) not in PEER_MESSAGE_TYPES:
+        return data
+    tag = struct.pack('!H', copy)
+    return (data[:PEER_ADDRESS_OFFSET + 14] + tag +
+            data[PEER_ADDRESS_OFFSET + 16:PEER_BGP_ID_OFFSET + 2] + tag +
+            data[PEER_BGP_ID_OFFSET + 4:])
+
+##################
+# replay
+##################
+
+def replay_session(addr, records, speed, copy, start, stats):
+    # speed 0 sends flat out, otherwise the gaps between timestamps are
+    # divided by speed.
+    sock = socket.create_connection(addr)
+    try:
+        first = None
+        pending = []
+        for timestamp, data in records:
+            data = rewrite_peer(data, copy)
+            if speed and timestamp is not None:
+                if first is None:
+                    first = timestamp
+                delay = start + (timestamp - first) / speed - time.time()
+                if delay > 0:
+                    if pending:
+                        sock.sendall(''.join(pending))
+                        pending = []
+                    eventlet.sleep(delay)
+                else:
+                    stats['lag'] = max(stats['lag'], -delay)
+            pending.append(data)
+            stats['messages'] += 1
+            stats['bytes'] += len(data)
+            if len(pending) >= SEND_BATCH:
+                sock.sendall(''.join(pending))
+                pending = []
+        if pending:
+            sock.sendall(''.join(pending))
+    finally:
+        sock.close()
+
+def replay(addr, sessions, speed=0, copies=1):
+    # Every captured session is replayed copies times at once, each copy on
+    # its own connection.
+    stats = {'sessions': 0, 'messages': 0, 'bytes': 0, 'lag': 0.0}
+    pool = eventlet.GreenPool(len(sessions) * copies)
+    start = time.time()
+    for copy in range(copies):
+        for session in sorted(sessions):
+            stats['sessions'] += 1
+            pool.spawn(replay_session, addr, sessions[session], speed, copy,
+                       start, stats)
+    pool.waitall()
+    stats['elapsed'] = time.time() - start
+    return stats
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage="%prog [options] capture ...\n"
+              "       %prog --synthetic PREFIXES --write capture")
+    parser.add_option("--host", default="127.0.0.1")
+    parser.add_option("--port", type="int", default=11019)
+    parser.add_option("--speed", type="float", default=1.0,
+                      help="1 = original speed, 10 = ten times faster, "
+                           "0 = flat out")
+    parser.add_option("--peers", type="int", default=1,
+                      help="concurrent copies of every captured session")
+    parser.add_option("--synthetic", type="int", default=0,
+                      help="replay a synthetic table of this many prefixes")
+    parser.add_option("--prefixes-per-update", type="int", default=1)
+    parser.add_option("--interval", type="float", default=0.0,
+                      help="seconds between synthetic messages")
+    parser.add_option("--write", metavar="PATH",
+                      help="only write the synthetic capture to PATH")
+    parser.add_option("--json", action="store_true",
+                      help="print the result as JSON")
+    options, paths = parser.parse_args(argv[1:])
+
+    if options.synthetic:
+        path = options.write or "synthetic.bmpcap"
+        count = synthetic_capture(path, options.synthetic,
+                                  options.prefixes_per_update,
+                                  options.interval)
+        if options.write:
+            print "wrote %d messages to %s" % (count, path)
+            return 0
+        paths = [path]
+    if not paths:
+        parser.error("no capture given")
+
+    sessions = load_sessions(paths)
+    stats = replay((options.host, options.port), sessions, options.speed,
+                   options.peers)
+    if options.json:
+        print json.dumps(stats)
+    else:
+        print ("%(sessions)d sessions, %(messages)d messages, %(bytes)d bytes"
+               " in %(elapsed).3f sec, max lag %(lag).3f sec" % stats)
+        print "%.0f msgs/s" % (stats['messages'] / stats['elapsed'])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import socket
+import struct
+import time
+
+BMP_VERSION = 3
+
+BMP_MSG_ROUTE_MONITORING = 0
+BMP_MSG_INITIATION = 4
+
+BGP_MSG_UPDATE = 2
+BGP_MSG_ROUTE_REFRESH = 5
+
+##################
+# BMP message builder
+##################
+
+def bmp_message(msg_type, body):
+    return struct.pack('!BIB', BMP_VERSION, 6 + len(body), msg_type) + body
+
+def per_peer_header(peer_as, peer_bgp_id, peer_address, timestamp=None):
+    if timestamp is None:
+        timestamp = time.time()
+    sec = int(timestamp)
+    usec = int((timestamp - sec) * 1000000)
+    return struct.pack('!BB8s12s4sI4sII', 0, 0, '\x00' * 8, '\x00' * 12,
+                       socket.inet_aton(peer_address), int(peer_as),
+                       socket.inet_aton(peer_bgp_id), sec, usec)
+
+def bgp_message(msg_type, body):
+    return '\xff' * 16 + struct.pack('!HB', 19 + len(body), msg_type) + body
+
+def path_attribute(flags, type_, value):
+    if len(value) > 255:
+        return struct.pack('!BBH', flags | 0x10, type_, len(value)) + value
+    return struct.pack('!BBB', flags, type_, len(value)) + value
+
+def route_dist(rd):
+    # Type 0 (2 byte AS), 1 (IPv4 address) or 2 (4 byte AS) by admin.
+    admin, assigned = rd.split(':')
+    if '.' in admin:
+        return struct.pack('!H4sH', 1, socket.inet_aton(admin), int(assigned))
+    if int(admin) > 0xffff:
+        return struct.pack('!HIH', 2, int(admin), int(assigned))
+    return struct.pack('!HHI', 0, int(admin), int(assigned))
+
+def ipv4_prefix(prefix):
+    addr, plen = prefix.split('/')
+    plen = int(plen)
+    return plen, socket.inet_aton(addr)[:(plen + 7) // 8]
+
+def vpnv4_nlri(rd, prefix, labels=(100,)):
+    plen, addr = ipv4_prefix(prefix)
+    stack = ''.join(struct.pack('!I', label << 4)[1:] for label in labels[:-1])
+    stack += struct.pack('!I', (labels[-1] << 4) | 1)[1:]
+    return (struct.pack('!B', len(stack) * 8 + 64 + plen) + stack +
+            route_dist(rd) + addr)
+
+def ipv4_nlri(prefix):
+    plen, addr = ipv4_prefix(prefix)
+    return struct.pack('!B', plen) + addr
+
+def rich_attributes(peer_as, as_path_len=4, communities=4,
+                    route_targets=2):
+    # MED, LOCAL_PREF, COMMUNITIES and extended communities on top of an
+    # AS_PATH of as_path_len 2 byte ASes, like a real Internet route.
+    path = [int(peer_as)] + [64512 + i for i in range(as_path_len - 1)]
+    attrs = path_attribute(0x80, 4, struct.pack('!I', 100))
+    attrs += path_attribute(0x40, 5, struct.pack('!I', 200))
+    attrs += path_attribute(0xc0, 8, ''.join(
+        struct.pack('!HH', int(peer_as) & 0xffff, 1000 + i)
+        for i in range(communities)))
+    attrs += path_attribute(0xc0, 16, ''.join(
+        struct.pack('!HHI', 0x0002, int(peer_as) & 0xffff, 101 + i)
+        for i in range(route_targets)))
+    return as_path(path), attrs
+
+def as_path(path):
+    if not path:
+        return path_attribute(0x40, 2, '')
+    return path_attribute(0x40, 2, struct.pack('!BB', 2, len(path)) +
+                          ''.join(struct.pack('!H', asn) for asn in path))
+
+def initiation(sys_descr="synthetic", sys_name="bmp_synth"):
+    body = (struct.pack('!HH', 1, len(sys_descr)) + sys_descr +
+            struct.pack('!HH', 2, len(sys_name)) + sys_name)
+    return bmp_message(BMP_MSG_INITIATION, body)
+
+def vpnv4_update(peer_as, peer_bgp_id, peer_address, rd, prefixes, nexthop,
+                 withdraw=False, timestamp=None, labels=(100,), rich=False):
+    nlri = ''.join(vpnv4_nlri(rd, p, labels) for p in prefixes)
+    path, extra = rich_attributes(peer_as) if rich else (as_path([]), '')
+    attrs = path_attribute(0x40, 1, '\x00') + path
+    if withdraw:
+        attrs += path_attribute(0x80, 15, struct.pack('!HB', 1, 128) + nlri)
+    else:
+        mp_reach = (struct.pack('!HBB', 1, 128, 12) + '\x00' * 8 +
+                    socket.inet_aton(nexthop) + '\x00' + nlri)
+        attrs += path_attribute(0x80, 14, mp_reach)
+        attrs += path_attribute(0xc0, 16, struct.pack('!HHI', 0x0002,
+                                                      int(peer_as), 101))
+        attrs += extra
+    update = struct.pack('!H', 0) + struct.pack('!H', len(attrs)) + attrs
+    return bmp_message(BMP_MSG_ROUTE_MONITORING,
+                       per_peer_header(peer_as, peer_bgp_id, peer_address,
+                                       timestamp) +
+                       bgp_message(BGP_MSG_UPDATE, update))
+
+def ipv4_update(peer_as, peer_bgp_id, peer_address, prefixes, nexthop,
+                withdraw=False, timestamp=None, rich=False):
+    nlri = ''.join(ipv4_nlri(p) for p in prefixes)
+    if withdraw:
+        update = struct.pack('!H', len(nlri)) + nlri + struct.pack('!H', 0)
+    else:
+        path, extra = rich_attributes(peer_as) if rich else (as_path([]), '')
+        attrs = path_attribute(0x40, 1, '\x00') + path
+        attrs += path_attribute(0x40, 3, socket.inet_aton(nexthop))
+        attrs += extra
+        update = (struct.pack('!H', 0) + struct.pack('!H', len(attrs)) +
+                  attrs + nlri)
+    return bmp_message(BMP_MSG_ROUTE_MONITORING,
+                       per_peer_header(peer_as, peer_bgp_id, peer_address,
+                                       timestamp) +
+                       bgp_message(BGP_MSG_UPDATE, update))
+
+def route_refresh(peer_as, peer_bgp_id, peer_address, timestamp=None):
+    return bmp_message(BMP_MSG_ROUTE_MONITORING,
+                       per_peer_header(peer_as, peer_bgp_id, peer_address,
+                                       timestamp) +
+                       bgp_message(BGP_MSG_ROUTE_REFRESH,
+                                   struct.pack('!HBB', 1, 0, 128)))
+
+def full_table_dump(count, peer_as=65010, peer_bgp_id="10.0.0.1",
+                    peer_address="192.168.0.1", rd="65010:101",
+                    nexthop="192.168.0.1", prefixes_per_update=1,
+                    timestamp=None, rich=False):
+    msgs = [initiation()]
+    prefixes = []
+    for i in xrange(count):
+        prefixes.append("10.%d.%d.0/24" % ((i >> 8) & 0xff, i & 0xff))
+        if len(prefixes) == prefixes_per_update:
+            msgs.append(vpnv4_update(peer_as, peer_bgp_id, peer_address, rd,
+                                     prefixes, nexthop, timestamp=timestamp,
+                                     rich=rich))
+            prefixes = []
+    if prefixes:
+        msgs.append(vpnv4_update(peer_as, peer_bgp_id, peer_address, rd,
+                                 prefixes, nexthop, timestamp=timestamp,
+                                 rich=rich))
+    return msgs
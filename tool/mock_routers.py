@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import eventlet
+eventlet.monkey_patch()
+
+import json
+import logging
+import optparse
+import random
+import socket
+import sys
+
+import paramiko
+from eventlet import wsgi
+
+PING_OK = ("PING %(dest)s (%(dest)s) from %(src)s : 56(84) bytes of data.\n"
+           "%(lines)s\n--- %(dest)s ping statistics ---\n"
+           "5 packets transmitted, 5 received, 0%% packet loss, time 4005ms\n")
+PING_LINE = "64 bytes from %s: icmp_seq=%d ttl=64 time=0.045 ms"
+RIB_HEADER = ("Status codes: * valid, > best\n"
+              "     Network                          Labels   Next Hop"
+              "             Reason          Metric LocPrf Path\n")
+RIB_LINE = (" *>  65010:101:10.%d.%d.0/24          [100]    192.168.0.1"
+            "          Only Path              0        65010 ?\n")
+
+##################
+# behaviour
+##################
+
+class Behaviour(object):
+    # How one mock service answers: after latency seconds (+/- jitter, as a
+    # fraction), with about size bytes of output, failing with probability
+    # fail_rate.
+    def __init__(self, latency=0.0, jitter=0.2, size=0, fail_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.size = size
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self.failures = 0
+
+    def wait(self):
+        self.requests += 1
+        if self.latency:
+            eventlet.sleep(self.latency *
+                           random.uniform(1 - self.jitter, 1 + self.jitter))
+        if random.random() < self.fail_rate:
+            self.failures += 1
+            return False
+        return True
+
+def rib_output(size):
+    lines = [RIB_HEADER]
+    total = len(RIB_HEADER)
+    index = 0
+    while total < size:
+        line = RIB_LINE % ((index >> 8) & 0xff, index & 0xff)
+        lines.append(line)
+        total += len(line)
+        index += 1
+    return "".join(lines)
+
+def ping_output(command, size):
+    args = command.split()
+    dest = args[3] if len(args) > 3 else "0.0.0.0"
+    src = args[5] if len(args) > 5 else "0.0.0.0"
+    count = max(5, size // len(PING_LINE % (dest, 0)))
+    lines = "\n".join(PING_LINE % (dest, seq + 1) for seq in range(count))
+    return PING_OK % {'dest': dest, 'src': src, 'lines': lines}
+
+##################
+# ssh jump host
+##################
+
+class _SSHServer(paramiko.ServerInterface):
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        eventlet.spawn_n(self.run, channel, command)
+        return True
+
+    def run(self, channel, command):
+        try:
+            if self.behaviour.wait():
+                channel.sendall(ping_output(command, self.behaviour.size))
+            else:
+                channel.sendall_stderr("connect: Network is unreachable\n")
+            channel.send_exit_status(0)
+        finally:
+            channel.close()
+
+def serve_ssh(listener, behaviour, host_key):
+    while True:
+        sock, _ = listener.accept()
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(host_key)
+        transport.start_server(server=_SSHServer(behaviour))
+
+##################
+# router REST API
+##################
+
+def rest_app(behaviour):
+    rib = rib_output(behaviour.size)
+
+    def app(environ, start_response):
+        path = environ['PATH_INFO']
+        if environ.get('CONTENT_LENGTH'):
+            environ['wsgi.input'].read(int(environ['CONTENT_LENGTH']))
+        if not behaviour.wait():
+            start_response('500 Internal Server Error',
+                           [('Content-Type', 'application/json')])
+            return ['{"error": "mock failure"}']
+        if path.endswith('/rib'):
+            body = json.dumps({'rib': rib})
+        elif path.endswith('/neighbor'):
+            body = json.dumps({'neighbor': rib})
+        else:
+            start_response('404 Not Found', [])
+            return ['']
+        start_response('200 OK', [('Content-Type', 'application/json'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+    return app
+
+def serve_rest(listener, behaviour):
+    wsgi.server(listener, rest_app(behaviour), log=NullLog(),
+                log_output=False)
+
+class NullLog(object):
+    def write(self, data):
+        pass
+
+##################
+# telnet CLI
+##################
+
+def serve_telnet(listener, behaviour, login=False):
+    rib = rib_output(behaviour.size)
+    while True:
+        sock, _ = listener.accept()
+        eventlet.spawn_n(telnet_session, sock, behaviour, rib, login)
+
+def telnet_session(sock, behaviour, rib, login=False):
+    f = sock.makefile('rw')
+    try:
+        if login:
+            # Any user and password, after a login's worth of delay.
+            for question in ("Username: ", "Password: "):
+                f.write(question)
+                f.flush()
+                if not f.readline():
+                    return
+            eventlet.sleep(behaviour.latency)
+            f.write("\n")
+        f.write("router> ")
+        f.flush()
+        for line in f:
+            line = line.strip()
+            if line == "exit":
+                break
+            if line.startswith("show"):
+                if not behaviour.wait():
+                    # Drop the session before answering.
+                    return
+                f.write(line + "\n" + rib)
+            f.write("router> ")
+            f.flush()
+    except socket.error:
+        pass
+    finally:
+        f.close()
+        sock.close()
+
+##################
+# main
+##################
+
+def listen_all(addresses, port):
+    # The same port on every address, so one port setting reaches them all.
+    listeners = []
+    for address in addresses:
+        listener = eventlet.listen((address, port))
+        port = listener.getsockname()[1]
+        listeners.append(listener)
+    return listeners, port
+
+def serve(addresses, ssh, rest, telnet, ports=(0, 0, 0),
+          telnet_login=False):
+    host_key = paramiko.RSAKey.generate(1024)
+    ssh_listeners, ssh_port = listen_all(addresses, ports[0])
+    rest_listeners, rest_port = listen_all(addresses, ports[1])
+    telnet_listeners, telnet_port = listen_all(addresses, ports[2])
+    for listener in ssh_listeners:
+        eventlet.spawn_n(serve_ssh, listener, ssh, host_key)
+    for listener in rest_listeners:
+        eventlet.spawn_n(serve_rest, listener, rest)
+    for listener in telnet_listeners:
+        eventlet.spawn_n(serve_telnet, listener, telnet, telnet_login)
+    return {'ssh': ssh_port, 'rest': rest_port, 'telnet': telnet_port}
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--routers", type="int", default=1,
+                      help="serve on 127.0.0.1 .. 127.0.0.N")
+    parser.add_option("--ssh-port", type="int", default=0)
+    parser.add_option("--rest-port", type="int", default=0)
+    parser.add_option("--telnet-port", type="int", default=0)
+    parser.add_option("--jitter", type="float", default=0.2)
+    parser.add_option("--telnet-login", action="store_true",
+                      help="ask for a user and password on telnet")
+    for service, latency, size in (('ssh', 4.0, 400), ('rest', 0.05, 20000),
+                                   ('telnet', 0.2, 20000)):
+        parser.add_option("--%s-latency" % service, type="float",
+                          default=latency, help="seconds [%default]")
+        parser.add_option("--%s-size" % service, type="int", default=size,
+                          help="output bytes [%default]")
+        parser.add_option("--%s-fail" % service, type="float", default=0.0,
+                          help="failure rate [%default]")
+    options, _ = parser.parse_args(argv[1:])
+    logging.basicConfig(level=logging.WARN)
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+
+    behaviours = {}
+    for service in ('ssh', 'rest', 'telnet'):
+        behaviours[service] = Behaviour(
+            getattr(options, '%s_latency' % service), options.jitter,
+            getattr(options, '%s_size' % service),
+            getattr(options, '%s_fail' % service))
+    addresses = ["127.0.0.%d" % (index + 1)
+                 for index in range(options.routers)]
+    ports = serve(addresses, behaviours['ssh'], behaviours['rest'],
+                  behaviours['telnet'],
+                  (options.ssh_port, options.rest_port, options.telnet_port),
+                  options.telnet_login)
+    print json.dumps(ports)
+    sys.stdout.flush()
+    while True:
+        eventlet.sleep(3600)
+
+if __name__ == "__main__":
+    main(sys.argv)
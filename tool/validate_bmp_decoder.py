@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+import logging
+import os
+import random
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import bgpMonitor
+import bmp_synth
+from adjRibIn import AdjRibIn, decode_attributes
+from bgpMonitor import BgpMonitor
+from bmpDecoder import decode_route_monitoring, DecodeFallback
+from bmpStream import BMP_HDR_LEN, PER_PEER_HDR_LEN
+from bmpStream import BMP_MSG_ROUTE_MONITORING
+from ryu.lib.packet import bmp
+from ryu.lib.packet import bgp
+
+ADDR = ("172.16.0.1", 11019)
+# Both decoders are compared with the same report time.
+BGP_T = "2015/01/01 00:00:00"
+
+##################
+# corpus
+##################
+
+def split_messages(stream):
+    msgs = []
+    pos = 0
+    while pos + BMP_HDR_LEN <= len(stream):
+        _, length = struct.unpack_from('!BI', stream, pos)
+        msgs.append(stream[pos:pos + length])
+        pos += length
+    return msgs
+
+def load_dump(path):
+    # A raw BMP stream as recorded with e.g. "nc -l 11019 > dump.bmp".
+    with open(path, 'rb') as f:
+        return split_messages(f.read())
+
+def random_prefix(rand):
+    plen = rand.choice((0, 8, 12, 16, 17, 22, 24, 24, 24, 25, 30, 32))
+    addr = rand.getrandbits(32) & ((0xffffffff << (32 - plen)) & 0xffffffff)
+    return "%d.%d.%d.%d/%d" % (addr >> 24, (addr >> 16) & 0xff,
+                               (addr >> 8) & 0xff, addr & 0xff, plen)
+
+def synthetic_corpus(count, seed=1):
+    # Every kind of UPDATE BgpMonitor reports, plus some the fast decoder
+    # has to hand to Ryu (label stacks and route refresh).
+    rand = random.Random(seed)
+    msgs = []
+    for index in xrange(count):
+        peer_as = rand.choice((65001, 65010, 64512))
+        peer = ("10.0.%d.1" % (index % 8), "192.168.%d.1" % (index % 8))
+        prefixes = [random_prefix(rand) for _ in range(rand.randint(1, 12))]
+        rich = rand.random() < 0.5
+        kind = rand.random()
+        if kind < 0.3:
+            rd = rand.choice(("65010:101", "10.1.1.1:7", "4200000001:42"))
+            msgs.append(bmp_synth.vpnv4_update(
+                peer_as, peer[0], peer[1], rd, prefixes, peer[1], rich=rich))
+        elif kind < 0.45:
+            rd = rand.choice(("65010:101", "10.1.1.1:7", "4200000001:42"))
+            msgs.append(bmp_synth.vpnv4_update(
+                peer_as, peer[0], peer[1], rd, prefixes, peer[1],
+                withdraw=True))
+        elif kind < 0.7:
+            msgs.append(bmp_synth.ipv4_update(
+                peer_as, peer[0], peer[1], prefixes, peer[1], rich=rich))
+        elif kind < 0.85:
+            msgs.append(bmp_synth.ipv4_update(
+                peer_as, peer[0], peer[1], prefixes, peer[1], withdraw=True))
+        elif kind < 0.95:
+            msgs.append(bmp_synth.vpnv4_update(
+                peer_as, peer[0], peer[1], "65010:101", prefixes, peer[1],
+                labels=(100, 200), rich=rich))
+        else:
+            msgs.append(bmp_synth.route_refresh(peer_as, peer[0], peer[1]))
+    return msgs
+
+def reframe(data, update):
+    # data with its BGP UPDATE body replaced by update, both lengths fixed.
+    pph = data[BMP_HDR_LEN:BMP_HDR_LEN + PER_PEER_HDR_LEN]
+    return bmp_synth.bmp_message(BMP_MSG_ROUTE_MONITORING, pph +
+                                 bmp_synth.bgp_message(bgp.BGP_MSG_UPDATE,
+                                                       update))
+
+def malformed_corpus(msgs, count, seed=1):
+    # Correctly framed messages whose UPDATE lies about its own lengths or
+    # stops early, so only the decoders see the damage.
+    rand = random.Random(seed)
+    base = bmp_synth.ipv4_update(65010, "10.0.0.1", "192.168.0.1",
+                                 ["10.0.0.0/24"], "192.168.0.1")
+    attr = bmp_synth.path_attribute
+    bad = [
+        reframe(base, struct.pack('!H', 0xffff)),
+        reframe(base, struct.pack('!HH', 0, 0xff)),
+        reframe(base, struct.pack('!HH', 0, 5) + attr(0x80, 14, '\x00\x01')),
+        reframe(base, struct.pack('!HH', 0, 5) + attr(0x80, 15, '\x00\x01')),
+        reframe(base, struct.pack('!HH', 0, 11) +
+                attr(0x80, 14, struct.pack('!HBB', 1, 128, 12) + '\x00' * 4)),
+        reframe(base, struct.pack('!HH', 0, 3) + '\x90\x0e\x00'),
+    ]
+    updates = [data for data in msgs if len(data) > 5 and
+               ord(data[5]) == BMP_MSG_ROUTE_MONITORING]
+    start = BMP_HDR_LEN + PER_PEER_HDR_LEN + 19
+    for _ in xrange(count):
+        data = rand.choice(updates)
+        update = data[start:]
+        if not update:
+            continue
+        if rand.random() < 0.5:
+            update = update[:rand.randrange(len(update))]
+        else:
+            pos = rand.randrange(len(update))
+            update = (update[:pos] + chr(rand.getrandbits(8)) +
+                      update[pos + 1:])
+        bad.append(reframe(data, update))
+    return bad
+
+##################
+# validation
+##################
+
+def ryu_events(monitor, data):
+    msg, _ = bmp.BMPMessage.parser(data)
+    if isinstance(msg.bgp_update, bgp.BGPRouteRefresh):
+        events = monitor.extract_BGP_RouteRefresh(msg, ADDR, BGP_T)
+    else:
+        events = monitor.extract_BGP_Update(msg, ADDR, BGP_T)
+    return msg.peer_address, events
+
+def fast_events(monitor, data):
+    rm = decode_route_monitoring(data)
+    return rm.peer_address, monitor.extract_fast(rm, ADDR, BGP_T)
+
+def validate(msgs, verbose):
+    monitor = BgpMonitor()
+    counts = {'messages': 0, 'fast': 0, 'fallback': 0, 'ryu_failed': 0,
+              'mismatch': 0, 'events': 0}
+    reasons = {}
+    for data in msgs:
+        if len(data) <= 5 or ord(data[5]) != BMP_MSG_ROUTE_MONITORING:
+            continue
+        counts['messages'] += 1
+        try:
+            expected = ryu_events(monitor, data)
+        except Exception, e:
+            expected = None
+            counts['ryu_failed'] += 1
+        try:
+            got = fast_events(monitor, data)
+        except DecodeFallback, e:
+            counts['fallback'] += 1
+            reasons[str(e)] = reasons.get(str(e), 0) + 1
+            continue
+        counts['fast'] += 1
+        if expected is None:
+            continue
+        counts['events'] += len(expected[1])
+        if got != expected:
+            counts['mismatch'] += 1
+            if verbose:
+                print "mismatch: %s" % data.encode('hex')
+                print "  ryu:  %s" % (expected,)
+                print "  fast: %s" % (got,)
+    return counts, reasons
+
+def validate_malformed(msgs, verbose):
+    # The fast decoder may only give up with DecodeFallback, and decode()
+    # must hand every message back as a result instead of raising.
+    monitor = BgpMonitor()
+    counts = {'messages': len(msgs), 'fallback': 0, 'decoded': 0,
+              'crashed': 0, 'failed': 0}
+    for data in msgs:
+        try:
+            decode_route_monitoring(data)
+            counts['decoded'] += 1
+        except DecodeFallback:
+            counts['fallback'] += 1
+        except Exception, e:
+            counts['crashed'] += 1
+            if verbose:
+                print "crash %r: %s" % (e, data.encode('hex'))
+        try:
+            result = monitor.decode((ADDR, data, 0, 0))
+        except Exception, e:
+            counts['crashed'] += 1
+            if verbose:
+                print "decode() raised %r: %s" % (e, data.encode('hex'))
+            continue
+        if result[4] is None:
+            counts['failed'] += 1
+    return counts
+
+def rib_decode(monitor, data, fast):
+    # decode() as BgpMonitor runs it with APGW_ADJ_RIB_IN=1, with or without
+    # the fast decoder.
+    saved = bgpMonitor.FAST_DECODER
+    bgpMonitor.FAST_DECODER = fast
+    try:
+        result = monitor.decode((ADDR, data, 0, 0))
+    finally:
+        bgpMonitor.FAST_DECODER = saved
+    update = result[8]
+    if update is not None:
+        monitor.adj_rib_in.apply(ADDR[0], result[6], update)
+        # The same path attributes, however they were encoded.
+        update = update[:5] + (decode_attributes(update[5]),)
+    return result, update
+
+def validate_rib(msgs, verbose):
+    # The Adj-RIB-In updates of the Ryu path must match the fast decoder's,
+    # and both mirrors must end up holding the same routes.
+    fast = BgpMonitor()
+    fast.adj_rib_in = AdjRibIn()
+    ryu = BgpMonitor()
+    ryu.adj_rib_in = AdjRibIn()
+    plain = BgpMonitor()
+    counts = {'messages': 0, 'failed': 0, 'mismatch': 0}
+    for data in msgs:
+        if len(data) <= 5 or ord(data[5]) != BMP_MSG_ROUTE_MONITORING:
+            continue
+        counts['messages'] += 1
+        expected, expected_update = rib_decode(fast, data, True)
+        got, got_update = rib_decode(ryu, data, False)
+        if got[4] is None or expected[4] is None:
+            # Only a failure when the message parses without the mirror.
+            if plain.decode((ADDR, data, 0, 0))[4] is not None:
+                counts['failed'] += 1
+                if verbose:
+                    print "rib update failed %s: %s" % (
+                        got[9] if got[4] is None else expected[9],
+                        data.encode('hex'))
+            continue
+        if got_update != expected_update:
+            counts['mismatch'] += 1
+            if verbose:
+                print "rib mismatch: %s" % data.encode('hex')
+                print "  ryu:  %s" % (got_update,)
+                print "  fast: %s" % (expected_update,)
+    counts['routes'] = ryu.adj_rib_in.routes
+    counts['fast_routes'] = fast.adj_rib_in.routes
+    return counts
+
+def main(argv):
+    logging.getLogger('BgpMonitor').setLevel(logging.WARN)
+    args = [arg for arg in argv[1:] if arg != '-v']
+    verbose = len(args) != len(argv) - 1
+    if args and not args[0].isdigit():
+        msgs = []
+        for path in args:
+            msgs += load_dump(path)
+        print "dumps: %s" % " ".join(args)
+    else:
+        count = int(args[0]) if args else 20000
+        msgs = synthetic_corpus(count)
+        print "synthetic corpus: %d messages" % count
+    counts, reasons = validate(msgs, verbose)
+    print ("%(messages)d route monitoring messages: %(fast)d decoded, "
+           "%(fallback)d fell back to Ryu, %(ryu_failed)d Ryu could not parse"
+           % counts)
+    for reason, count in sorted(reasons.items()):
+        print "  fallback %-40s %d" % (reason, count)
+    print "%(events)d events compared, %(mismatch)d messages differ" % counts
+    rib = validate_rib(msgs, verbose)
+    print ("adj_rib_in with the Ryu decoder: %(messages)d messages, "
+           "%(failed)d failed, %(mismatch)d differ, %(routes)d routes "
+           "(%(fast_routes)d with the fast decoder)" % rib)
+    bad = validate_malformed(malformed_corpus(msgs, 2000), verbose)
+    print ("%(messages)d malformed messages: %(fallback)d fell back to Ryu, "
+           "%(decoded)d decoded, %(failed)d Ryu could not parse, "
+           "%(crashed)d crashed" % bad)
+    return 1 if (counts['mismatch'] or rib['failed'] or rib['mismatch'] or
+                 rib['routes'] != rib['fast_routes'] or bad['crashed']) else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))